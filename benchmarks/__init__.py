@@ -0,0 +1,10 @@
+"""
+Benchmarks of the classification pipeline
+
+    python -m benchmarks.run --save-baseline benchmarks/baselines/local.json
+    python -m benchmarks.run --compare benchmarks/baselines/local.json --threshold 0.2
+
+Bundled corpuses contain only tweet ids and labels, so texts are synthetic
+tweets with their label distribution (optionally scaled up); hydrated
+datasets can be benchmarked with --input.
+"""
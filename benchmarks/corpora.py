@@ -0,0 +1,75 @@
+import csv
+import os
+import random
+
+CORPUSES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'classifiers', 'corpuses')
+BUNDLED_CORPUSES = {
+    'sanders': os.path.join(CORPUSES_DIR, 'sanders_corpus_reversed.csv'),
+    'sem_eval': os.path.join(CORPUSES_DIR, 'sem_eval_corpus.csv'),
+}
+
+SENTIMENT_WORDS = {
+    u'positive': [u'love', u'great', u'awesome', u'happy', u'best', u'good', u'nice', u'thanks', u'cool', u'win'],
+    u'negative': [u'hate', u'worst', u'bad', u'sad', u'awful', u'fail', u'angry', u'broken', u'sucks', u'never'],
+    u'neutral': [u'today', u'news', u'update', u'via', u'new', u'watch', u'read', u'live', u'now', u'week'],
+}
+EMOTICONS = {
+    u'positive': [u':)', u':-)', u':D', u'=]', u';)'],
+    u'negative': [u':(', u':-(', u":'(", u'D:', u':/'],
+    u'neutral': [u':o', u':|'],
+}
+TOPICS = [u'apple', u'google', u'microsoft', u'twitter', u'iphone', u'android', u'windows', u'obama']
+
+
+def corpus_labels(path):
+    """Labels of bundled corpus (id, label[, topic]), texts are not distributed with it"""
+    with open(path, 'rb') as f:
+        return [row[1].decode('utf-8') for row in csv.reader(f) if len(row) > 1]
+
+
+def common_words(random_state, count=2000):
+    """Pseudo-words with Zipf-like frequencies when drawn by zipf_choice"""
+    letters = u'abcdefghijklmnopqrstuvwxyz'
+    return [u''.join(random_state.choice(letters) for j in xrange(random_state.randint(2, 9)))
+            for i in xrange(count)]
+
+
+def zipf_choice(random_state, words):
+    return words[min(int(random_state.paretovariate(1.1)) - 1, len(words) - 1)]
+
+
+def synthetic_tweet(random_state, label, words):
+    """Tweet-like text: frequent words, sentiment words of label, and what
+    preprocessors handle (urls, mentions, hashtags, emoticons, lengthening)"""
+    tokens = [zipf_choice(random_state, words) for i in xrange(random_state.randint(4, 16))]
+    sentiment = SENTIMENT_WORDS.get(label, SENTIMENT_WORDS[u'neutral'])
+    for i in xrange(random_state.randint(1, 3)):
+        tokens.insert(random_state.randint(0, len(tokens)), random_state.choice(sentiment))
+
+    roll = random_state.random()
+    if roll < 0.3:
+        tokens.append(u'http://t.co/%s' % (u''.join(random_state.choice(u'abcdefXYZ0123') for i in xrange(8)),))
+    if roll < 0.4:
+        tokens.insert(0, u'@user%i' % (random_state.randint(1, 5000),))
+    if 0.3 < roll < 0.6:
+        tokens.append(u'#' + random_state.choice(TOPICS))
+    if 0.5 < roll < 0.8:
+        tokens.append(random_state.choice(EMOTICONS.get(label, EMOTICONS[u'neutral'])))
+    if roll > 0.9:
+        word = tokens[-1]
+        tokens[-1] = word + word[-1] * random_state.randint(2, 5) + u'!!!'
+    return u' '.join(tokens)
+
+
+def synthetic_corpus(labels, scale=1, seed=0):
+    """Synthetic (documents, labels) with label distribution of labels, scale times larger"""
+    random_state = random.Random(seed)
+    words = common_words(random_state)
+    result_labels = [label for i in xrange(scale) for label in labels]
+    documents = [synthetic_tweet(random_state, label, words) for label in result_labels]
+    return documents, result_labels
+
+
+def load_corpus(name, scale=1, seed=0):
+    """(documents, labels) of bundled corpus name with synthetic texts"""
+    return synthetic_corpus(corpus_labels(BUNDLED_CORPUSES[name]), scale, seed)
@@ -0,0 +1,121 @@
+import Queue
+import cPickle
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+from classifiers.classifier import DictionaryClassifier
+from classifiers.model_format import save_model
+from classifiers.run_experiments import build_classifier
+
+# metric -> True if greater is better
+METRICS = {
+    'preprocess_docs_per_s': True,
+    'extract_docs_per_s': True,
+    'train_s': False,
+    'classify_docs_per_s': True,
+    'latency_p50_ms': False,
+    'latency_p90_ms': False,
+    'latency_p99_ms': False,
+    'peak_memory_kb': False,
+    'pickle_bytes': False,
+    'model_bytes': False,
+}
+
+
+def best_time(function, repeat):
+    """Minimal wall time of repeat calls, and result of the last call"""
+    best = None
+    for i in xrange(repeat):
+        started = time.time()
+        result = function()
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1e-9), result
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def measure_configuration(options, documents, labels, repeat=3, latency_sample=500):
+    """Measures stages of one classifier configuration, returns dict of METRICS"""
+    classifier = build_classifier(options, '')
+    result = {}
+
+    preprocess = classifier.preprocessor.preprocess
+    elapsed, preprocessed = best_time(lambda: map(preprocess, documents), repeat)
+    result['preprocess_docs_per_s'] = len(documents) / elapsed
+
+    started = time.time()
+    classifier.learn(documents, labels)
+    result['train_s'] = time.time() - started
+
+    if isinstance(classifier, DictionaryClassifier):
+        result['extract_docs_per_s'] = None
+    else:
+        elapsed, matrix = best_time(lambda: classifier.feature_extractor.extract_batch(preprocessed), repeat)
+        result['extract_docs_per_s'] = len(documents) / elapsed
+
+    elapsed, predicted = best_time(lambda: classifier.classify_batch(documents), repeat)
+    result['classify_docs_per_s'] = len(documents) / elapsed
+
+    latencies = []
+    for document in documents[:latency_sample]:
+        started = time.time()
+        classifier.classify_one(document)
+        latencies.append((time.time() - started) * 1000.)
+    for percentile in (50, 90, 99):
+        result['latency_p%i_ms' % (percentile,)] = float(np.percentile(latencies, percentile))
+
+    result['pickle_bytes'] = len(cPickle.dumps(classifier, 2))
+    model_dir = tempfile.mkdtemp()
+    try:
+        save_model(os.path.join(model_dir, 'benchmark.model'), classifier)
+        result['model_bytes'] = directory_size(os.path.join(model_dir, 'benchmark.model'))
+    finally:
+        shutil.rmtree(model_dir)
+    return result
+
+
+def run_in_child(queue, options, documents, labels, repeat):
+    try:
+        start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = measure_configuration(options, documents, labels, repeat)
+        # peak memory added by this configuration, in kB on Linux
+        result['peak_memory_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_memory
+        queue.put(('ok', result))
+    except Exception:
+        queue.put(('error', traceback.format_exc()))
+
+
+def measure_isolated(options, documents, labels, repeat=3):
+    """Measures configuration in a forked process, so peak memory
+    of one configuration is not hidden by previous ones"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_in_child, args=(queue, options, documents, labels, repeat))
+    process.start()
+    while True:
+        try:
+            status, result = queue.get(timeout=1.)
+            break
+        except Queue.Empty:
+            if process.is_alive():
+                continue
+        # result of child that exited since the last get is already in the queue,
+        # otherwise child was killed (out of memory, segfault) before putting it
+        try:
+            status, result = queue.get(timeout=1.)
+        except Queue.Empty:
+            status, result = 'error', 'Process died with exit code %s' % (process.exitcode,)
+        break
+    process.join()
+    if status != 'ok':
+        raise RuntimeError('Benchmark of %s failed:\n%s' % (options, result))
+    return result
@@ -0,0 +1,158 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import yaml
+
+from classifiers.utils import read_labelled_set
+from classifiers.run_experiments import expand_grid
+from benchmarks.corpora import BUNDLED_CORPUSES, load_corpus
+from benchmarks.measure import METRICS, measure_isolated
+
+DEFAULT_GRID = [
+    {'algorithm': 'NaiveBayes', 'ngrams': 'Both', 'metric': ['Count', 'Boolean']},
+    {'algorithm': 'NaiveBayes', 'ngrams': 'Both', 'metric': 'Count', 'hashing_bits': 18},
+    {'algorithm': 'NaiveBayes', 'ngrams': 'Both', 'metric': 'Count', 'selection': ['DeltaIdf', 'ChiSquare'],
+     'top': 1000},
+    {'algorithm': 'MaxEnt', 'ngrams': 'Both', 'metric': 'Boolean', 'iterations': 30},
+    {'algorithm': 'MaxEnt', 'ngrams': 'Both', 'metric': 'Boolean', 'solver': 'sgd', 'iterations': 10},
+    {'algorithm': 'Dictionary', 'ngrams': 'Unigrams'},
+]
+
+DEFAULT_THRESHOLD = 0.2
+
+
+def configuration_key(corpus, options):
+    return '%s: %s' % (corpus, ', '.join('%s=%s' % (key, options[key]) for key in sorted(options)))
+
+
+def load_corpora(args):
+    """List of (name, documents, labels)"""
+    corpora = []
+    for name in args.corpus:
+        for scale in args.scale:
+            documents, labels = load_corpus(name, scale)
+            corpora.append(('%s x%i' % (name, scale), documents, labels))
+    for path in args.input:
+        documents, labels = read_labelled_set(path)
+        corpora.append((path, documents, labels))
+    return corpora
+
+
+def compare(results, baseline, thresholds):
+    """Returns list of regression descriptions of results against baseline
+    thresholds -- dict metric -> allowed relative slowdown, key 'default' for others
+    """
+    regressions = []
+    for key, metrics in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for metric, value in sorted(metrics.items()):
+            old_value = baseline[key].get(metric)
+            if value is None or not old_value:
+                continue
+            threshold = thresholds.get(metric, thresholds.get('default', DEFAULT_THRESHOLD))
+            if METRICS[metric]:
+                change = (old_value - value) / old_value
+            else:
+                change = (value - old_value) / old_value
+            if change > threshold:
+                regressions.append('%s: %s %.4g -> %.4g (%.0f%% worse, threshold %.0f%%)' %
+                                   (key, metric, old_value, value, change * 100, threshold * 100))
+    return regressions
+
+
+def format_results(results):
+    lines = []
+    for key, metrics in sorted(results.items()):
+        lines.append(key)
+        for metric in sorted(metrics):
+            value = metrics[metric]
+            lines.append('  %-22s %s' % (metric, '-' if value is None else '%.4g' % (value,)))
+    return '\n'.join(lines)
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description='Benchmarking classification pipeline')
+    parser.add_argument('--corpus', choices=sorted(BUNDLED_CORPUSES), nargs='*',
+                        default=sorted(BUNDLED_CORPUSES),
+                        help='Bundled corpuses to benchmark on (synthetic texts with their labels)')
+
+    parser.add_argument('--scale', type=int, nargs='+',
+                        default=[1],
+                        help='Scale factors of synthetic corpuses, e.g. 1 10')
+
+    parser.add_argument('--input', type=str, nargs='*',
+                        default=[],
+                        help='Hydrated labelled datasets (id, text, label) to benchmark on too')
+
+    parser.add_argument('--spec', type=str,
+                        required=False,
+                        help='YAML with grid of configurations in run_experiments.py format')
+
+    parser.add_argument('--repeat', type=int,
+                        default=3,
+                        help='Throughputs are best of so many runs')
+
+    parser.add_argument('--output', type=str,
+                        required=False,
+                        help='Path to save results as JSON')
+
+    parser.add_argument('--save-baseline', type=str,
+                        required=False,
+                        help='Path to save results as baseline')
+
+    parser.add_argument('--compare', type=str,
+                        required=False,
+                        help='Baseline to compare with, exits with status 1 on regression')
+
+    parser.add_argument('--threshold', type=float,
+                        default=None,
+                        help='Allowed relative regression of every metric (default: from baseline or 0.2)')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    grid = DEFAULT_GRID
+    if args.spec:
+        with open(args.spec) as f:
+            grid = yaml.safe_load(f)['grid']
+    configurations = expand_grid(grid)
+
+    results = {}
+    for name, documents, labels in load_corpora(args):
+        print 'Corpus %s: %i documents' % (name, len(documents))
+        for options in configurations:
+            key = configuration_key(name, options)
+            results[key] = measure_isolated(options, documents, labels, args.repeat)
+            print '  %s: %.0f docs/s classified, p99 latency %.2f ms' % \
+                  (key, results[key]['classify_docs_per_s'], results[key]['latency_p99_ms'])
+    print '\n' + format_results(results)
+
+    report = {'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'environment': {'python': sys.version.split()[0], 'numpy': np.__version__,
+                              'platform': platform.platform()},
+              'thresholds': {'default': DEFAULT_THRESHOLD},
+              'results': results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            print '\nResults saved to: %s' % (path,)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        thresholds = dict(baseline.get('thresholds', {}))
+        if args.threshold is not None:
+            thresholds = {'default': args.threshold}
+        regressions = compare(results, baseline['results'], thresholds)
+        if regressions:
+            print '\nRegressions against %s:\n%s' % (args.compare, '\n'.join(regressions))
+            sys.exit(1)
+        print '\nNo regressions against %s' % (args.compare,)
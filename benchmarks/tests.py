@@ -0,0 +1,66 @@
+import os
+import unittest
+
+from benchmarks import measure
+from benchmarks.corpora import synthetic_corpus
+from benchmarks.measure import METRICS, measure_isolated
+from benchmarks.run import compare, configuration_key
+
+
+class CorporaTest(unittest.TestCase):
+    def test_synthetic_corpus(self):
+        labels = [u'positive', u'negative', u'neutral', u'positive']
+        documents, result_labels = synthetic_corpus(labels, scale=3, seed=1)
+        self.assertEqual(result_labels, labels * 3)
+        self.assertEqual(len(documents), 12)
+        self.assertEqual(synthetic_corpus(labels, scale=3, seed=1), (documents, result_labels))
+        self.assertNotEqual(synthetic_corpus(labels, scale=3, seed=2)[0], documents)
+
+
+class CompareTest(unittest.TestCase):
+    def test_regressions_respect_direction_and_thresholds(self):
+        baseline = {'a': {'classify_docs_per_s': 100., 'train_s': 1., 'model_bytes': 1000., 'pickle_bytes': 0.},
+                    'removed': {'train_s': 1.}}
+        results = {'a': {'classify_docs_per_s': 70., 'train_s': 0.5, 'model_bytes': 1150., 'pickle_bytes': 10.,
+                         'extract_docs_per_s': None},
+                   'added': {'train_s': 9.}}
+        regressions = compare(results, baseline, {'default': 0.2})
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('a: classify_docs_per_s 100 -> 70 (30% worse'))
+
+        regressions = compare(results, baseline, {'default': 0.4, 'model_bytes': 0.1})
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('a: model_bytes'))
+
+    def test_configuration_key(self):
+        self.assertEqual(configuration_key('sanders x1', {'ngrams': 'Both', 'algorithm': 'NaiveBayes'}),
+                         'sanders x1: algorithm=NaiveBayes, ngrams=Both')
+
+
+class MeasureTest(unittest.TestCase):
+    def setUp(self):
+        self.documents, self.labels = synthetic_corpus([u'positive', u'negative', u'neutral'] * 20, seed=3)
+
+    def test_measure_isolated(self):
+        result = measure_isolated({'algorithm': 'NaiveBayes', 'ngrams': 'Both'}, self.documents, self.labels,
+                                  repeat=1)
+        self.assertEqual(sorted(result), sorted(METRICS))
+        self.assertTrue(all(value > 0 for metric, value in result.items() if metric != 'peak_memory_kb'))
+
+    def fail(self, *args):
+        raise ValueError('broken configuration')
+
+    def test_failed_child(self):
+        original = measure.measure_configuration
+        options = {'algorithm': 'NaiveBayes', 'ngrams': 'Both'}
+        try:
+            measure.measure_configuration = self.fail
+            self.assertRaises(RuntimeError, measure_isolated, options, self.documents, self.labels, repeat=1)
+            # child killed before it reports, as by out of memory killer
+            measure.measure_configuration = lambda *args: os._exit(1)
+            self.assertRaises(RuntimeError, measure_isolated, options, self.documents, self.labels, repeat=1)
+        finally:
+            measure.measure_configuration = original
+
+if __name__ == '__main__':
+    unittest.main()
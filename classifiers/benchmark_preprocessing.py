@@ -0,0 +1,57 @@
+import argparse
+import sys
+import time
+
+from classifiers.utils import read_labelled_set
+from classifiers.preprocessors import build_combined_preprocessor
+
+
+def throughput(preprocessor, documents, repeat):
+    """Returns (tweets per second, outputs) of preprocessor over documents"""
+    started = time.time()
+    for i in xrange(repeat):
+        outputs = map(preprocessor.preprocess, documents)
+    elapsed = time.time() - started
+    return len(documents) * repeat / max(elapsed, 1e-9), outputs
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description='Verifying compiled preprocessing against the preprocessor chain '
+                                                 'and measuring throughput of both')
+    parser.add_argument('--input', type=str, nargs='+',
+                        required=True,
+                        help='Labelled datasets (id, text, label), e.g. corpuses hydrated by download_tweets.py')
+
+    parser.add_argument('--repeat', type=int,
+                        default=3,
+                        help='How many times to preprocess each dataset')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+
+    chain = build_combined_preprocessor(compiled=False)
+    compiled = build_combined_preprocessor(compiled=True)
+
+    mismatches = 0
+    for input_path in args.input:
+        documents, labels = read_labelled_set(input_path)
+
+        chain_speed, expected = throughput(chain, documents, args.repeat)
+        compiled_speed, observed = throughput(compiled, documents, args.repeat)
+
+        for document, chain_output, compiled_output in zip(documents, expected, observed):
+            if chain_output != compiled_output:
+                mismatches += 1
+                print 'Mismatch: %r\n  chain: %r\n  compiled: %r' % (document, chain_output, compiled_output)
+
+        print 'Dataset: %s (%i tweets)' % (input_path, len(documents))
+        print 'Chain: %.0f tweets/s, compiled: %.0f tweets/s (x%.2f)\n' % \
+              (chain_speed, compiled_speed, compiled_speed / chain_speed)
+
+    if mismatches:
+        print '%i outputs differ' % (mismatches,)
+        sys.exit(1)
+    print 'All outputs are identical'
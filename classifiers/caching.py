@@ -0,0 +1,99 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def approximate_size(key, value):
+    """Rough memory footprint in bytes of cached key and value
+    (containers are counted with their items, one level deep)"""
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class LRUCache(object):
+    """Thread-safe mapping which keeps at most max_size items taking
+    at most max_memory bytes, least recently used items are evicted first
+
+    Either limit can be None (unbounded). Counts hits, misses and evictions.
+    Contents are not pickled, only limits.
+    """
+
+    def __init__(self, max_size=10000, max_memory=None, sizeof=approximate_size):
+        self.max_size = max_size
+        self.max_memory = max_memory
+        self.sizeof = sizeof
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __getstate__(self):
+        return {'max_size': self.max_size, 'max_memory': self.max_memory, 'sizeof': self.sizeof}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def clear(self):
+        """Drops all items and resets counters"""
+        self.items = OrderedDict()
+        self.sizes = {}
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            value = self.items.pop(key)
+            self.items[key] = value
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(key, value) if self.max_memory is not None else 0
+        with self.lock:
+            if key in self.items:
+                del self.items[key]
+                self.memory -= self.sizes.pop(key)
+            if self.max_memory is not None and size > self.max_memory:
+                return
+
+            self.items[key] = value
+            self.sizes[key] = size
+            self.memory += size
+            while (self.max_size is not None and len(self.items) > self.max_size) or \
+                    (self.max_memory is not None and self.memory > self.max_memory):
+                old_key, old_value = self.items.popitem(last=False)
+                self.memory -= self.sizes.pop(old_key)
+                self.evictions += 1
+
+    def stats(self):
+        """Dict of counters, memory is 0 unless max_memory is set"""
+        requests = self.hits + self.misses
+        return {'size': len(self.items), 'memory': self.memory,
+                'max_size': self.max_size, 'max_memory': self.max_memory,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': float(self.hits) / requests if requests else 0.}
+
+
+def cached_map(cache, function, keys):
+    """Applies function to keys, computing it once per distinct key missing in cache"""
+    results = []
+    for key in keys:
+        value = cache.get(key)
+        if value is None:
+            value = function(key)
+            cache.put(key, value)
+        results.append(value)
+    return results
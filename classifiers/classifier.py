@@ -1,9 +1,16 @@
 import numpy as np
-import math
 import os
+import pickle
+
+from classifiers.optimizers import SoftmaxObjective, LBFGSOptimizer, SGDOptimizer, minimize
+from classifiers import instrumentation
+from classifiers.caching import LRUCache, cached_map
+from classifiers.sparse import SparseRowBuilder, bincount
 
 
 class BaseClassifier(object):
+    text_cache = None
+
     def __init__(self, preprocessor, feature_extractor):
         """
         Fields:
@@ -27,7 +34,11 @@ class BaseClassifier(object):
         self.class_index = {}
         self.classes = []
         self.class_probability = []
+        return self.encode_more_labels(labels)
 
+    def encode_more_labels(self, labels):
+        """Encodes labels keeping indices of already known classes,
+        unseen classes get next indices"""
         encoded_labels = np.zeros((len(labels),), dtype=np.int)
         for i in xrange(len(labels)):
             label = labels[i]
@@ -50,33 +61,142 @@ class BaseClassifier(object):
         """Probability that document belongs to Class"""
         raise NotImplementedError('ClassifierBase.conditional_probability')
 
-    def classify_one(self, document, original_class=True):
-        document = self.preprocessor.preprocess(document)
-        classes = range(len(self.classes))
-        prob_of_class = lambda c: self.conditional_probability(c, document)
+    def class_scores(self, feature_matrix):
+        """Unnormalized log probabilities of all classes
+        returns matrix of shape (document_count, class_count)
+        """
+        raise NotImplementedError('ClassifierBase.class_scores')
+
+    def timed_class_scores(self, feature_matrix):
+        """class_scores recorded as stage 'score.<name>' when instrumentation is enabled"""
+        with instrumentation.timer('score.' + self.name):
+            return self.class_scores(feature_matrix)
+
+    def enable_cache(self, max_size=10000, max_memory=None):
+        """Memoises work done for raw texts, so repeated texts (retweets, spam)
+        are classified by a dictionary lookup
+        max_size -- maximal number of cached texts, None for unbounded
+        max_memory -- approximate memory limit in bytes, None for unbounded
+        """
+        self.text_cache = LRUCache(max_size, max_memory)
+
+    def disable_cache(self):
+        self.text_cache = None
+
+    def clear_cache(self):
+        """Must be called whenever preprocessor or feature extractor changes"""
+        if self.text_cache is not None:
+            self.text_cache.clear()
+
+    def cache_stats(self):
+        """Counters of text cache or None if it is disabled"""
+        if self.text_cache is None:
+            return None
+        return self.text_cache.stats()
+
+    def extract_row(self, text):
+        """Preprocesses text document and extracts its features as dict"""
+        return self.feature_extractor.extract_row(self.preprocessor.preprocess(text))
+
+    def extract_features(self, text_set):
+        """Preprocesses text documents and extracts their feature matrix"""
+        if self.text_cache is None:
+            documents = map(self.preprocessor.preprocess, text_set)
+            with instrumentation.timer('extract'):
+                return self.feature_extractor.extract_batch(documents)
+
+        with instrumentation.timer('extract.cached'):
+            builder = SparseRowBuilder(self.feature_extractor.features_count())
+            for row in cached_map(self.text_cache, self.extract_row, text_set):
+                builder.append(row)
+            return builder.build()
+
+    def predict_log_proba_batch(self, text_set):
+        """Log probabilities of all classes for each text document in text_set
+        returns matrix of shape (document_count, class_count)
+        """
+        return normalize_log_scores(self.timed_class_scores(self.extract_features(text_set)))
 
-        result_class = max(classes, key=prob_of_class)
-        if original_class:
-            return self.classes[result_class]
+    def predict_proba_batch(self, text_set):
+        return np.exp(self.predict_log_proba_batch(text_set))
+
+    def predict_log_proba(self, document):
+        """Log probabilities of all classes, indexed as self.classes"""
+        return self.predict_log_proba_batch([document])[0]
 
-        return result_class
+    def predict_proba(self, document):
+        return np.exp(self.predict_log_proba(document))
+
+    def classify_one(self, document, original_class=True):
+        return self.classify_batch([document], original_class)[0]
 
     def classify_batch(self, text_set, original_class=True):
         """Classifies each text document in text_set
         returns list of classes
         """
-        result_classes = []
-        for text in text_set:
-            result_classes.append(self.classify_one(text, original_class))
-        return result_classes
+        result_classes = np.argmax(self.timed_class_scores(self.extract_features(text_set)), axis=1)
+        if original_class:
+            return [self.classes[c] for c in result_classes]
+
+        return list(result_classes)
+
+
+def normalize_log_scores(scores):
+    """Turns rows of unnormalized log probabilities into log probabilities
+    using numerically stable log-sum-exp"""
+    max_scores = np.max(scores, axis=1)[:, np.newaxis]
+    log_normalizer = max_scores + np.log(np.sum(np.exp(scores - max_scores), axis=1))[:, np.newaxis]
+    return scores - log_normalizer
+
+
+def grow_table(buffer, table, rows, columns, fill):
+    """Returns (buffer, table) where table is a view of first columns of buffer
+    with shape (rows, columns); spare columns of buffer are kept filled with fill,
+    so that adding columns copies the table only when its capacity doubles"""
+    old_rows, old_columns = (0, 0) if table is None else table.shape
+    if buffer is None or buffer.shape[0] != rows or buffer.shape[1] < columns:
+        capacity = columns if columns <= old_columns else max(columns, 2 * old_columns)
+        buffer = np.empty((rows, capacity))
+        buffer.fill(fill)
+        if table is not None:
+            buffer[:old_rows, :old_columns] = table
+    return buffer, buffer[:, :columns]
 
 
 class NaiveBayesClassifier(BaseClassifier):
+    """Log likelihood of feature f in class c is log_numerator[c, f] - log_denominator[c],
+    denominators are applied when scoring, so that update() recomputes only changed columns"""
+    log_prior = None
+    log_numerator = None
+    log_denominator = None
+    features_counts = None
+    count_buffer = None
+    numerator_buffer = None
+    class_document_count = None
+    pending_update = None
+
     def __init__(self, preprocessor, feature_extractor, alpha=1.):
+        if getattr(feature_extractor, 'signed', False):
+            raise ValueError('NaiveBayesClassifier: counts of signed hashing extractor may be negative')
         super(NaiveBayesClassifier, self).__init__(preprocessor, feature_extractor)
         self.alpha = alpha
         self.name = 'MultinomialNaiveBayes'
 
+    def __getstate__(self):
+        # spare capacity of tables is not stored, tables are pickled as copies of their views
+        state = dict(self.__dict__)
+        state.pop('count_buffer', None)
+        state.pop('numerator_buffer', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'log_likelihood' in state:
+            # pickled before likelihoods were split into numerators and denominators,
+            # tables are recomputed from counts when needed
+            del self.log_likelihood
+            self.log_numerator = None
+
     def get_class_prob(self, labels):
         class_count = len(self.classes)
         class_document_count = np.zeros(class_count)
@@ -88,104 +208,311 @@ class NaiveBayesClassifier(BaseClassifier):
         return class_document_count / document_count
 
     def learn(self, documents, labels):
+        self.clear_cache()
         documents = map(self.preprocessor.preprocess, documents)
         labels = self.get_encoded_labels(labels)
-        class_count = len(self.classes)
 
         self.feature_extractor.learn(documents, labels)
-        self.feature_count = self.feature_extractor.features_count()
-
-        self.class_probability = self.get_class_prob(labels)
-        self.features_counts = np.zeros((class_count, self.feature_count))
-        self.class_feature_sum = []
+        feature_matrix = self.feature_extractor.extract_batch(documents)
+        self.learn_features(feature_matrix, labels)
+
+    def learn_features(self, feature_matrix, labels):
+        """Learns counts from extracted feature matrix and encoded labels"""
+        self.class_document_count = None
+        self.features_counts = None
+        self.count_buffer = None
+        self.pending_update = None
+        self.add_feature_counts(feature_matrix, labels)
+        self.compute_probability_tables()
+
+    def learn_counts(self, features_counts, class_document_count):
+        """Learns from precomputed class x feature counts and numbers of documents
+        of each class (classes must already be encoded)"""
+        self.features_counts = features_counts
+        self.count_buffer = None
+        self.class_document_count = class_document_count
+        self.pending_update = None
+        self.class_probability = class_document_count / np.sum(class_document_count)
+        self.feature_count = np.count_nonzero(np.sum(features_counts, axis=0))
+        self.class_feature_sum = list(np.sum(features_counts, axis=1))
+        self.compute_probability_tables()
+
+    def partial_fit(self, documents, labels):
+        """Learns from one more chunk of a training set, so training set
+        of any size can be streamed in bounded memory (see utils.iter_labelled_chunks).
+        Counts are added to learned ones, learn() starts from scratch
+        """
+        self.clear_cache()
+        documents = map(self.preprocessor.preprocess, documents)
+        labels = self.encode_more_labels(labels)
+
+        self.feature_extractor.partial_fit(documents, labels)
+        feature_matrix = self.feature_extractor.extract_batch(documents)
+        self.add_feature_counts(feature_matrix, labels)
+        # tables are recomputed lazily, once after the last chunk
+        self.log_prior = None
+        self.log_numerator = None
+
+    def update(self, documents, labels):
+        """Folds new labelled documents into learned model in place,
+        previously unseen ngrams and classes are added.
+        Takes time proportional to new data (tables grow with spare capacity,
+        so new features copy them only occasionally), changes are kept for save_update()
+        """
+        if self.features_counts is not None and self.class_document_count is None:
+            raise ValueError('NaiveBayesClassifier: model was trained before document counts '
+                             'were stored, retrain it to enable updates')
+        if self.pending_update is None:
+            self.start_update()
 
-        for i in xrange(len(documents)):
-            document = documents[i]
-            Class = labels[i]
-            feature_vector = self.feature_extractor.extract(document)
-            self.features_counts[Class] += feature_vector
+        self.clear_cache()
+        old_class_count = len(self.classes)
+        tables_computed = self.log_numerator is not None
 
+        documents = map(self.preprocessor.preprocess, documents)
+        labels = self.encode_more_labels(labels)
+        self.feature_extractor.partial_fit(documents, labels)
+        feature_matrix = self.feature_extractor.extract_batch(documents)
+        columns, counts = self.add_feature_counts(feature_matrix, labels)
+
+        self.pending_update['columns'].append(columns)
+        self.pending_update['counts'].append(counts)
+        self.pending_update['class_document_count'].append(
+            np.bincount(labels, minlength=len(self.classes)).astype(np.float64))
+
+        if not tables_computed or old_class_count != len(self.classes):
+            self.compute_probability_tables()
+        else:
+            self.update_probability_tables(columns)
+
+    def start_update(self):
+        """Starts recording changes made by update() from current state"""
+        class_count, feature_count = (0, 0) if self.features_counts is None else self.features_counts.shape
+        self.pending_update = {'class_count': class_count, 'feature_count': feature_count,
+                               'document_count': self.document_count(),
+                               'columns': [], 'counts': [], 'class_document_count': []}
+
+    def document_count(self):
+        if self.class_document_count is None:
+            return 0.
+        return float(np.sum(self.class_document_count))
+
+    def save_update(self, path):
+        """Saves changes made by update() since learning, start_update()
+        or previous save_update(), to be applied by apply_update()
+        to a copy of the model these changes were made to"""
+        if self.pending_update is None:
+            self.start_update()
+        pending = self.pending_update
+        class_count, feature_count = len(self.classes), self.feature_extractor.features_count()
+
+        columns = np.concatenate(pending['columns'] or [np.zeros((0,), dtype=np.int64)])
+        counts = np.zeros((class_count, len(columns)))
+        position = 0
+        for block in pending['counts']:
+            counts[:block.shape[0], position:position + block.shape[1]] = block
+            position += block.shape[1]
+        class_document_count = np.zeros((class_count,))
+        for chunk_document_count in pending['class_document_count']:
+            class_document_count[:len(chunk_document_count)] += chunk_document_count
+
+        unique_columns, positions = np.unique(columns, return_inverse=True)
+        unique_counts = np.zeros((class_count, len(unique_columns)))
         for Class in xrange(class_count):
-            self.class_feature_sum.append(np.sum(self.features_counts[Class]))
+            unique_counts[Class] = bincount(positions, weights=counts[Class], length=len(unique_columns))
+
+        delta = {'version': 1,
+                 'base_class_count': pending['class_count'],
+                 'base_feature_count': pending['feature_count'],
+                 'base_document_count': pending['document_count'],
+                 'classes': self.classes[pending['class_count']:],
+                 'features': [self.feature_extractor.get_feature_name(i)
+                              for i in xrange(pending['feature_count'], feature_count)],
+                 'class_document_count': class_document_count,
+                 'columns': unique_columns,
+                 'counts': unique_counts}
+        with open(path, 'wb') as f:
+            pickle.dump(delta, f, pickle.HIGHEST_PROTOCOL)
+        self.start_update()
+
+    def apply_update(self, path):
+        """Applies changes saved by save_update() of a copy of this model"""
+        with open(path, 'rb') as f:
+            delta = pickle.load(f)
+
+        class_count, feature_count = (0, 0) if self.features_counts is None else self.features_counts.shape
+        if (class_count, feature_count, self.document_count()) != \
+                (delta['base_class_count'], delta['base_feature_count'], delta['base_document_count']):
+            raise ValueError('NaiveBayesClassifier: update %s was saved from a different model state' % (path,))
+
+        self.clear_cache()
+        tables_computed = self.log_numerator is not None
+
+        for label in delta['classes']:
+            self.class_index[label] = len(self.classes)
+            self.classes.append(label)
+        if delta['features']:
+            self.feature_extractor.extend_features(delta['features'])
+
+        columns = delta['columns']
+        self.grow_counts(len(self.classes), self.feature_extractor.features_count())
+        seen_before = np.sum(self.features_counts[:, columns], axis=0) > 0
+        self.features_counts[:, columns] += delta['counts']
+        self.class_document_count += delta['class_document_count']
+        self.update_counts_summary(columns, seen_before, delta['counts'])
+
+        if not tables_computed or class_count != len(self.classes):
+            self.compute_probability_tables()
+        else:
+            self.update_probability_tables(columns)
+
+    def grow_counts(self, class_count, feature_count):
+        """Pads count tables with zeros for new classes and features"""
+        if self.features_counts is None:
+            self.class_document_count = np.zeros((class_count,))
+            self.class_feature_sum = [0.] * class_count
+            self.feature_count = 0
+        else:
+            old_class_count = self.features_counts.shape[0]
+            if old_class_count != class_count:
+                self.class_document_count = np.concatenate(
+                    (self.class_document_count, np.zeros((class_count - old_class_count,))))
+                self.class_feature_sum = list(self.class_feature_sum) + [0.] * (class_count - old_class_count)
+        # counts loaded or learned without buffer are copied into one on first change
+        self.count_buffer, self.features_counts = grow_table(self.count_buffer, self.features_counts,
+                                                             class_count, feature_count, 0.)
+
+    def add_feature_counts(self, feature_matrix, labels):
+        """Adds counts of extracted feature matrix and encoded labels to learned ones,
+        counts of classes and features unseen before start from zero.
+        Touches only columns of features present in feature_matrix,
+        returns them with their class x column counts
+        """
+        class_count = len(self.classes)
+        self.grow_counts(class_count, feature_matrix.shape[1])
+
+        columns = np.unique(feature_matrix.indices).astype(np.int64)
+        counts = feature_matrix.select_columns(columns).sum_by_label(labels, class_count)
+        seen_before = np.sum(self.features_counts[:, columns], axis=0) > 0
+        self.features_counts[:, columns] += counts
+        self.class_document_count += np.bincount(labels, minlength=class_count)
+        self.update_counts_summary(columns, seen_before, counts)
+        return columns, counts
+
+    def update_counts_summary(self, columns, seen_before, counts):
+        """Updates class probabilities and sums after counts of columns were added"""
+        self.class_probability = self.class_document_count / np.sum(self.class_document_count)
+        # only features seen in training share the smoothing mass, so hashed
+        # feature spaces with mostly empty slots are not oversmoothed
+        seen_now = np.sum(self.features_counts[:, columns], axis=0) > 0
+        self.feature_count += int(np.count_nonzero(seen_now & ~seen_before))
+        self.class_feature_sum = list(np.asarray(self.class_feature_sum) + np.sum(counts, axis=1))
+
+    def get_log_denominator(self):
+        """Log of likelihood denominators of all classes"""
+        return np.log(np.asarray(self.class_feature_sum) + max(self.feature_count, 1) * self.alpha)
+
+    def update_probability_tables(self, columns):
+        """Recomputes log numerators of changed columns (new features are among them)
+        and log denominators, other columns are not touched"""
+        class_count, feature_count = self.features_counts.shape
+        self.numerator_buffer, self.log_numerator = grow_table(self.numerator_buffer, self.log_numerator,
+                                                               class_count, feature_count, np.log(self.alpha))
+        self.log_numerator[:, columns] = np.log(self.features_counts[:, columns] + self.alpha)
+        self.log_denominator = self.get_log_denominator()
+        self.log_prior = np.log(self.class_probability)
+
+    def compute_probability_tables(self):
+        """Freezes log priors and class x feature tables of log likelihoods"""
+        self.log_prior = np.log(self.class_probability)
+        self.log_numerator = np.log(self.features_counts + self.alpha)
+        self.numerator_buffer = None
+        self.log_denominator = self.get_log_denominator()
+
+    def class_scores(self, feature_matrix):
+        """Unnormalized log posteriors of all classes for each row of feature_matrix"""
+        if self.log_numerator is None:
+            self.compute_probability_tables()
+        # every occurrence of a feature divides by denominator of class
+        return feature_matrix.dot(self.log_numerator.T) - \
+               np.outer(feature_matrix.row_sums(), self.log_denominator) + self.log_prior
 
     def conditional_probability(self, Class, document):
-        feature_vector = self.feature_extractor.extract(document)
-        prior = math.log(self.class_probability[Class], 10)
-        likelihood = (self.features_counts[Class] + self.alpha) / \
-                     (self.features_counts[Class] + self.feature_count * self.alpha)
-        log_likelihood = np.sum(feature_vector * np.log10(likelihood))
-        posterior = prior + log_likelihood
-        return posterior
+        """Unnormalized log posterior of Class for preprocessed document"""
+        return self.timed_class_scores(self.feature_extractor.extract_batch([document]))[0][Class]
 
 
 class MaxEntClassifier(BaseClassifier):
-    def __init__(self, preprocessor, feature_extractor, epsilon=0.05, num_iter=1, step=0.001):
+    def __init__(self, preprocessor, feature_extractor, epsilon=1e-4, num_iter=100, step=0.5,
+                 solver='lbfgs', l2=1e-4, batch_size=100, validation_fraction=0.1, patience=5):
+        """
+        solver -- 'lbfgs' (quasi-Newton) or 'sgd' (mini-batch gradient descent)
+        epsilon -- convergence threshold of relative loss decrease
+        num_iter -- maximal number of iterations (epochs for sgd)
+        step -- learning rate of sgd
+        l2 -- L2 regularisation strength
+        batch_size -- mini-batch size of sgd
+        validation_fraction -- part of documents held out for early stopping
+        patience -- stop after so many iterations without held-out loss improvement
+        """
         super(MaxEntClassifier, self).__init__(preprocessor, feature_extractor)
         self.name = 'MaxEnt'
         self.epsilon = epsilon
         self.step = step
         self.num_iter = num_iter
+        self.solver = solver
+        self.l2 = l2
+        self.batch_size = batch_size
+        self.validation_fraction = validation_fraction
+        self.patience = patience
+        self.history = []
+
+    def __str__(self):
+        return 'Algorithm=%s (solver=%s, l2=%g), %s' % \
+               (self.name, self.solver, self.l2, str(self.feature_extractor))
 
-    def init_weights(self, class_count, feature_count):
-        weights = np.zeros((class_count, feature_count))
-        return weights
+    def get_optimizer(self):
+        if self.solver == 'sgd':
+            return SGDOptimizer(step=self.step, batch_size=self.batch_size)
+        return LBFGSOptimizer()
 
     def learn(self, documents, labels, show_progress=False):
+        self.clear_cache()
         documents = map(self.preprocessor.preprocess, documents)
         labels = self.get_encoded_labels(labels)
         self.feature_extractor.learn(documents, labels)
 
+        feature_matrix = self.feature_extractor.extract_batch(documents)
+        self.learn_features(feature_matrix, labels, show_progress)
+
+    def learn_features(self, feature_matrix, labels, show_progress=False):
+        """Learns weights from extracted feature matrix and encoded labels"""
         class_count = len(self.classes)
-        classes = range(class_count)
-
-        feature_count = self.feature_extractor.features_count()
-        empirical_count = np.zeros((class_count, feature_count))
-        feature_vectors = map(lambda doc: self.feature_extractor.extract(doc), documents)
-        self.weights = self.init_weights(class_count, feature_count)
-        step = self.step
-        num_iter = self.num_iter
-
-        for i in xrange(len(documents)):
-            empirical_count[labels[i]] += feature_vectors[i]
-
-        itr = 0
-        while True:
-            temp_weights = np.zeros((class_count, feature_count))
-            delta = 0.0
-
-            conditional_probability = np.zeros((len(documents), class_count))
-            for i in xrange(len(documents)):
-                feature_vector = feature_vectors[i]
-                normalizer = sum(map(lambda c: math.exp(sum(self.weights[c] * feature_vector)), classes))
-                for Class in classes:
-                    conditional_probability[i][Class] = math.exp(np.sum(self.weights[Class] * feature_vector)) / normalizer
-
-            for Class in classes:
-                for Feature in xrange(feature_count):
-                    predicted_count = 0.0
-                    for i in xrange(len(documents)):
-                        if labels[i] == Class:
-                            predicted_count += feature_vectors[i][Feature] * conditional_probability[i][Class]
-
-                    part_derivative = empirical_count[Class][Feature] - predicted_count
-                    temp_weights[Class][Feature] = self.weights[Class][Feature] + step * part_derivative
-                    delta += (part_derivative) ** 2
-
-            self.weights = temp_weights
-            delta = math.sqrt(delta) / (class_count * feature_count)
-            if show_progress:
-                print delta
-            itr += 1
-            if delta <= self.epsilon or (num_iter and itr >= num_iter):
-                break
+        document_count = len(labels)
 
-    def conditional_probability(self, Class, document):
-        feature_vector = self.feature_extractor.extract(document)
-        classes = range(len(self.classes))
+        validation = None
+        held_out = int(document_count * self.validation_fraction)
+        if held_out > 0:
+            order = np.random.RandomState(0).permutation(document_count)
+            validation_rows, train_rows = order[:held_out], order[held_out:]
+            validation = SoftmaxObjective(feature_matrix.take_rows(validation_rows),
+                                          labels[validation_rows], class_count)
+            feature_matrix, labels = feature_matrix.take_rows(train_rows), labels[train_rows]
+
+        objective = SoftmaxObjective(feature_matrix, labels, class_count, self.l2)
+        params, self.history = minimize(objective, objective.initial_params(), self.get_optimizer(),
+                                        num_iter=self.num_iter, epsilon=self.epsilon,
+                                        validation=validation, patience=self.patience,
+                                        show_progress=show_progress)
+        self.weights, self.bias = objective.unpack(params)
+
+    def class_scores(self, feature_matrix):
+        return feature_matrix.dot(self.weights.T) + self.bias
 
-        probability = math.exp(np.sum(self.weights[Class] * feature_vector))
-        normalizer = sum(map(lambda c: math.exp(sum(self.weights[c] * feature_vector)), classes))
-        return probability / normalizer
+    def conditional_probability(self, Class, document):
+        """Probability of Class for preprocessed document"""
+        scores = self.timed_class_scores(self.feature_extractor.extract_batch([document]))
+        return np.exp(normalize_log_scores(scores)[0][Class])
 
 
 class DictionaryClassifier(BaseClassifier):
@@ -210,11 +537,12 @@ class DictionaryClassifier(BaseClassifier):
         document = self.preprocessor.preprocess(document)
         pos_count = 0
         neg_count = 0
-        for word in document.split():
-            if word in self.positive_words:
-                pos_count += 1
-            if word in self.negative_words:
-                neg_count += 1
+        with instrumentation.timer('score.' + self.name):
+            for word in document.split():
+                if word in self.positive_words:
+                    pos_count += 1
+                if word in self.negative_words:
+                    neg_count += 1
 
         if pos_count >= neg_count:
             return u'positive'
@@ -222,6 +550,9 @@ class DictionaryClassifier(BaseClassifier):
             return u'negative'
 
     def classify_batch(self, text_set, original_class=True):
+        if self.text_cache is not None:
+            return cached_map(self.text_cache, self.classify_one, text_set)
+
         result = []
         for document in text_set:
             result.append(self.classify_one(document))
@@ -237,12 +568,44 @@ class HierarchicalClassifier(BaseClassifier):
         self.classifier = classifier
         self.pipelines = pipelines
 
+    def __str__(self):
+        return 'Algorithm=%s (%s; %s)' % \
+               (self.name, str(self.classifier),
+                '; '.join('%s: %s' % (Class, str(classifier)) for Class, classifier in self.pipelines))
+
     def learn(self, train_set, classes):
         pass
 
+    def enable_cache(self, max_size=10000, max_memory=None):
+        for classifier in [self.classifier] + [classifier for Class, classifier in self.pipelines]:
+            classifier.enable_cache(max_size, max_memory)
+
+    def disable_cache(self):
+        for classifier in [self.classifier] + [classifier for Class, classifier in self.pipelines]:
+            classifier.disable_cache()
+
+    def cache_stats(self):
+        return self.classifier.cache_stats()
+
     def classify_one(self, document, original_class=True):
         result = self.classifier.classify_one(document)
         for Class, classifier in self.pipelines:
             if Class == result:
                 return classifier.classify_one(document)
+        return result
+
+    def classify_batch(self, text_set, original_class=True):
+        result = self.classifier.classify_batch(text_set)
+        # like classify_one, documents are refined only by first pipeline matching class of root classifier
+        root = list(result)
+        refined_classes = set()
+        for Class, classifier in self.pipelines:
+            if Class in refined_classes:
+                continue
+            refined_classes.add(Class)
+            positions = [i for i in xrange(len(root)) if root[i] == Class]
+            if positions:
+                refined = classifier.classify_batch([text_set[i] for i in positions])
+                for i, label in zip(positions, refined):
+                    result[i] = label
         return result
\ No newline at end of file
@@ -1,57 +1,250 @@
-import sys
-import os
-import time
+"""
+Hydrates corpus of tweet ids (id, label[, topic]) into labelled dataset (id, text, label)
+
+    python download_tweets.py corpuses/sem_eval_corpus.csv sem_eval.csv --workers 4
+    python download_tweets.py corpuses/sem_eval_corpus.csv sem_eval.csv --resume
+
+Ids are looked up in batches of 100 by concurrent workers; Twitter client
+paces their requests within rate-limit budget announced by API.
+Rows are written as batches arrive, so their order differs from input.
+
+Progress is logged to <output>.checkpoint, so an interrupted download
+continues with --resume: hydrated and missing ids are skipped, deferred ids
+(rate-limited or failed) are tried again. With --shard i/n, cooperating
+processes download disjoint parts of the corpus to <output>.shard-i-of-n.
+"""
+
+import argparse
 import csv
-from classifiers.utils import UnicodeWriter
+import httplib
+import os
+import socket
+import sys
+from multiprocessing.pool import ThreadPool
 
-from twitter_api_wrapper.twitter import Twitter
+from classifiers.utils import UnicodeWriter
+from twitter_api_wrapper.rate_limits import RateLimiter
+from twitter_api_wrapper.twitter import Twitter, LOOKUP_BATCH_SIZE
 from twitter_api_wrapper.twitter_exceptions import *
 
-if len(sys.argv) != 3:
-    print "Usage: python download_tweets.py path_to_input path_to_output"
-    sys.exit()
-
-input_path = sys.argv[1]
-output_path = sys.argv[2]
-
-if not os.path.exists(input_path):
-    print "Input path does not exist"
-    sys.exit()
-
-if os.path.exists(output_path):
-    print "Output path already exists"
-    sys.exit()
-
-with open(input_path, 'r') as input_file:
-    with open(output_path, 'w') as output_file:
-        reader = csv.reader(input_file, delimiter=',')
-        writer = UnicodeWriter(output_file, delimiter=',')
-        twitter_client = Twitter()
-
-        count = 0
-        for row in reader:
-            id = row[0]
-            sentiment = row[1]
-
-            try:
-                tweet = twitter_client.get_tweet(id)
-                count += 1
-            except Twitter_Rate_Limit_Exception:
-                time.sleep(60)
-                continue
-            except Twitter_Forbidden_Exception:
-                time.sleep(5)
-                continue
-            except Twitter_Not_Found_Exception:
-                time.sleep(5)
-                continue
-
-            if count % 100 == 0:
-                print count
-
-            try:
-                writer.writerow([id, tweet['text'], sentiment])
-            except Exception:
-                print [id, tweet['text'], sentiment]
-
-            time.sleep(5)
\ No newline at end of file
+# statuses of ids in checkpoint
+HYDRATED = 'hydrated'
+MISSING = 'missing'
+DEFERRED = 'deferred'
+
+
+class Checkpoint(object):
+    """Append-only log of download progress, one line per batch:
+    'hydrated <output size> <ids>', 'missing <ids>' or 'deferred <ids>'
+    Output size is recorded after rows of batch are synced to disk,
+    so output can be truncated to the last recorded size on resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def load(self):
+        """Returns (dict id -> last status, output size of last hydrated batch,
+        size of complete lines of checkpoint)"""
+        statuses = {}
+        output_size = 0
+        size = 0
+        if not os.path.exists(self.path):
+            return statuses, output_size, size
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    # interrupted write
+                    break
+                size += len(line)
+                fields = line.split()
+                if fields[0] == HYDRATED:
+                    output_size = int(fields[1])
+                    ids = fields[2] if len(fields) > 2 else ''
+                else:
+                    ids = fields[1]
+                for id in ids.split(','):
+                    if id:
+                        statuses[id] = fields[0]
+        return statuses, output_size, size
+
+    def open(self, size=0):
+        """Opens checkpoint for appending after its first size bytes,
+        so that records are not glued to a line torn by interruption"""
+        self.file = open(self.path, 'ab')
+        self.file.truncate(size)
+
+    def record(self, status, ids, output_size=None):
+        """Appends status of ids; hydrated batches are recorded with output size even if empty"""
+        if status == HYDRATED:
+            line = '%s %i %s\n' % (status, output_size, ','.join(ids))
+        elif ids:
+            line = '%s %s\n' % (status, ','.join(ids))
+        else:
+            return
+        self.file.write(line)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_corpus(input_path):
+    """List of (id, label) of corpus rows"""
+    with open(input_path, 'rb') as f:
+        return [(row[0], row[1].decode('utf-8')) for row in csv.reader(f) if len(row) > 1]
+
+
+def shard_rows(rows, shard, shard_count):
+    """Rows of shard-th of shard_count disjoint parts of corpus"""
+    return [(id, label) for id, label in rows if int(id) % shard_count == shard]
+
+
+def make_batches(rows, batch_size=LOOKUP_BATCH_SIZE):
+    return [rows[i:i + batch_size] for i in xrange(0, len(rows), batch_size)]
+
+
+def hydrate_batch(twitter, batch):
+    """Returns (list of (id, text, label) of tweets of batch which still exist, status);
+    status is DEFERRED and list is empty if lookup failed even after retries of client
+    (error of whole batch, e.g. 403 of credentials, does not mean its tweets are gone)"""
+    labels = dict(batch)
+    try:
+        tweets = twitter.lookup([id for id, label in batch])
+    except (Twitter_Exception, httplib.HTTPException, socket.error):
+        return [], DEFERRED
+    return [(tweet[u'id_str'], tweet[u'text'], labels[tweet[u'id_str']]) for tweet in tweets], HYDRATED
+
+
+def download_tweets(twitter, rows, output_file, workers=4, checkpoint=None, retry_rounds=3):
+    """Hydrates rows (id, label) by concurrent workers, writes (id, text, label)
+    to output_file as they arrive and logs progress to checkpoint (if given);
+    deferred batches are tried again in up to retry_rounds more rounds
+    returns (number of hydrated tweets, list of ids still deferred)
+    """
+    writer = UnicodeWriter(output_file, delimiter=',')
+    pool = ThreadPool(workers)
+    hydrated = 0
+    try:
+        for round in xrange(retry_rounds + 1):
+            batches = make_batches(rows)
+            deferred = []
+            results = pool.imap_unordered(lambda batch: (batch, hydrate_batch(twitter, batch)), batches)
+            for i, (batch, (result, status)) in enumerate(results):
+                for row in result:
+                    writer.writerow(row)
+                output_file.flush()
+                os.fsync(output_file.fileno())
+                hydrated += len(result)
+                if status == DEFERRED:
+                    deferred.extend(batch)
+
+                if checkpoint is not None:
+                    if status == HYDRATED:
+                        found = set(id for id, text, label in result)
+                        checkpoint.record(HYDRATED, list(found), output_file.tell())
+                        checkpoint.record(MISSING, [id for id, label in batch if id not in found])
+                    else:
+                        checkpoint.record(DEFERRED, [id for id, label in batch])
+                print '%i/%i batches, %i tweets hydrated, %i ids deferred' % \
+                      (i + 1, len(batches), hydrated, len(deferred))
+
+            rows = deferred
+            if not rows:
+                break
+            if round < retry_rounds:
+                print 'Retrying %i deferred ids' % (len(rows),)
+    finally:
+        pool.terminate()
+    return hydrated, [id for id, label in rows]
+
+
+def resumable_download(twitter, rows, output_path, workers=4, retry_rounds=3):
+    """Downloads rows (id, label) to output_path, skipping ids finished according to
+    its checkpoint; returns (number of hydrated tweets, number of ids left before, list of ids deferred)
+    """
+    checkpoint = Checkpoint(output_path + '.checkpoint')
+    statuses, output_size, checkpoint_size = checkpoint.load()
+    total = len(rows)
+    rows = [(id, label) for id, label in rows if statuses.get(id) not in (HYDRATED, MISSING)]
+    if statuses:
+        print 'Resuming: %i of %i ids left' % (len(rows), total)
+
+    checkpoint.open(checkpoint_size)
+    try:
+        with open(output_path, 'ab') as output_file:
+            # rows written after last checkpoint would be written again
+            output_file.truncate(output_size)
+            # tell() of file opened for appending reports old size until it is written
+            output_file.seek(0, os.SEEK_END)
+            count, deferred = download_tweets(twitter, rows, output_file, workers, checkpoint, retry_rounds)
+    finally:
+        checkpoint.close()
+    return count, len(rows), deferred
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description='Downloading texts of corpus of tweet ids')
+    parser.add_argument('input', type=str,
+                        help='Corpus of tweet ids (id, label[, topic])')
+
+    parser.add_argument('output', type=str,
+                        help='Output path of labelled dataset (id, text, label)')
+
+    parser.add_argument('--workers', type=int,
+                        default=4,
+                        help='Number of concurrent lookup requests')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue interrupted download recorded in <output>.checkpoint')
+
+    parser.add_argument('--retry-rounds', type=int,
+                        default=3,
+                        help='Number of times deferred (rate-limited or failed) batches are tried again')
+
+    parser.add_argument('--shard', type=str,
+                        required=False,
+                        help='i/n downloads i-th of n disjoint parts of corpus (0 <= i < n) '
+                             'to <output>.shard-i-of-n, for n cooperating processes')
+
+    return parser
+
+
+if __name__ == '__main__':
+    parser = get_args_parser()
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print "Input path does not exist"
+        sys.exit(1)
+
+    rows = read_corpus(args.input)
+    output_path = args.output
+    shard_count = 1
+    if args.shard:
+        try:
+            shard, shard_count = map(int, args.shard.split('/'))
+        except ValueError:
+            parser.error('--shard must be i/n')
+        if not 0 <= shard < shard_count:
+            parser.error('--shard i/n must satisfy 0 <= i < n')
+        rows = shard_rows(rows, shard, shard_count)
+        output_path = '%s.shard-%i-of-%i' % (args.output, shard, shard_count)
+
+    if os.path.exists(output_path) and not args.resume:
+        print "Output path already exists (use --resume to continue its download)"
+        sys.exit(1)
+
+    if os.path.exists(output_path) and not os.path.exists(output_path + '.checkpoint'):
+        print "Output path exists without checkpoint, its download cannot be resumed"
+        sys.exit(1)
+
+    # processes of shards share rate limits, each paces its requests to its share of budget
+    twitter = Twitter(rate_limiter=RateLimiter(share=1. / shard_count))
+    count, left, deferred = resumable_download(twitter, rows, output_path, args.workers, args.retry_rounds)
+    print 'Hydrated %i of %i tweets, %i ids deferred (download them with --resume)' % \
+          (count, left, len(deferred))
@@ -1,4 +1,8 @@
 import numpy as np
+import zlib
+from collections import defaultdict
+
+from classifiers.sparse import SparseRowBuilder
 
 
 class FeatureExtractorBase(object):
@@ -16,10 +20,36 @@ class FeatureExtractorBase(object):
         sentiment_list -- vector of text_list's document sentiment"""
         raise NotImplementedError('FeatureExtractorBase:learn(self, text_list) is not defined')
 
+    def partial_fit(self, documents, labels):
+        """Learns features from one more chunk of a training set,
+        features learned before keep their indices"""
+        raise NotImplementedError('FeatureExtractorBase:partial_fit(self, documents, labels) is not defined')
+
     def extract(self, document):
         """Extracts feature vector from text document"""
         raise NotImplementedError('FeatureExtractorBase:extract(self, text) is not defined')
 
+    def restrict_features(self, features):
+        """Keeps only given features, renumbered in given order"""
+        raise NotImplementedError('FeatureExtractorBase:restrict_features(self, features) is not defined')
+
+    def extend_features(self, names):
+        """Appends features with given names (as returned by get_feature_name)"""
+        raise NotImplementedError('FeatureExtractorBase:extend_features(self, names) is not defined')
+
+    def extract_row(self, document):
+        """Extracts nonzero features of text document as dict {feature index: value}"""
+        feature_vector = self.extract(document)
+        nonzero = np.flatnonzero(feature_vector)
+        return dict(zip(nonzero, feature_vector[nonzero]))
+
+    def extract_batch(self, documents):
+        """Extracts feature vectors of text documents as SparseRowMatrix"""
+        builder = SparseRowBuilder(self.features_count())
+        for document in documents:
+            builder.append(self.extract_row(document))
+        return builder.build()
+
 
 class NgramExtractorBase(FeatureExtractorBase):
     def __init__(self, ns):
@@ -57,23 +87,47 @@ class NgramExtractorBase(FeatureExtractorBase):
             return ngram
         return None
 
-    def learn_from_one(self, words):
-        """Learns features from one text document (list of words)"""
+    def iter_ngrams(self, words):
+        """Yields all ngrams of words list"""
         for i in xrange(len(words)):
             for n in self.ns:
                 ngram = self.try_get_ngram(words, n, i)
-                if ngram and ngram not in self.ngrams:
-                    self.ngrams[ngram] = len(self.feature_list)
-                    self.feature_list.append(ngram)
+                if ngram:
+                    yield ngram
+
+    def learn_from_one(self, words):
+        """Learns features from one text document (list of words)"""
+        for ngram in self.iter_ngrams(words):
+            if ngram not in self.ngrams:
+                self.ngrams[ngram] = len(self.feature_list)
+                self.feature_list.append(ngram)
 
     def learn(self, documents, labels):
         """Learns features from a training set"""
+        self.ngrams = {}
+        self.feature_list = []
+        self.partial_fit(documents, labels)
+
+    def partial_fit(self, documents, labels):
+        """Adds ngrams of documents to vocabulary, new ngrams get next indices"""
         for i in xrange(len(documents)):
             text = documents[i]
 
             words = text.split()
             self.learn_from_one(words)
 
+    def restrict_features(self, features):
+        """Drops ngrams not in features from vocabulary"""
+        self.feature_list = [self.feature_list[i] for i in features]
+        self.ngrams = dict((ngram, i) for i, ngram in enumerate(self.feature_list))
+
+    def extend_features(self, names):
+        """Appends ngrams to vocabulary"""
+        for ngram in names:
+            if ngram not in self.ngrams:
+                self.ngrams[ngram] = len(self.feature_list)
+                self.feature_list.append(ngram)
+
     def add_ngram(self, feature_vector, ngram):
         """Adds ngram to feature vector"""
         raise NotImplementedError('NgramExtractorBase:add_ngram() is not defined')
@@ -81,16 +135,19 @@ class NgramExtractorBase(FeatureExtractorBase):
     def extract(self, document):
         """Extracts ngrams as vector [a_1, ..., a_n] where
         n is number of features in training"""
-        f_num = len(self.feature_list)
-        feature_vector = np.zeros((f_num,))
-        words = document.split()
-        for i in xrange(len(words)):
-            for n in self.ns:
-                ngram = self.try_get_ngram(words, n, i)
-                if ngram and ngram in self.ngrams:
-                    self.add_ngram(feature_vector, ngram)
+        row = self.extract_row(document)
+        feature_vector = np.zeros((self.features_count(),))
+        feature_vector[row.keys()] = row.values()
         return feature_vector
 
+    def extract_row(self, document):
+        """Extracts only nonzero a_i as dict {i: a_i}"""
+        row = defaultdict(float)
+        for ngram in self.iter_ngrams(document.split()):
+            if ngram in self.ngrams:
+                self.add_ngram(row, ngram)
+        return row
+
 
 class NgramExtractorBoolean(NgramExtractorBase):
     """Values a_i of feature_vector [a_1, ..., a_n] equal
@@ -122,3 +179,103 @@ class NgramExtractorCount(NgramExtractorBase):
         if ngram in self.ngrams:
             ngram_pos = self.ngrams[ngram]
             feature_vector[ngram_pos] += 1
+
+
+class NgramExtractorHashing(NgramExtractorBase):
+    """Maps ngrams to [0, 2^bits) features by hashing them,
+        keeps no vocabulary, so memory does not depend on training set.
+        With signed=True the sign of each ngram's value is hashed too,
+        so that collisions cancel out in expectation; negative values suit
+        only weights of MaxEnt, not counts of Naive Bayes or feature selectors.
+    """
+    feature_hashes = None
+    feature_map = None
+
+    def __init__(self, ns, bits=20, signed=False):
+        super(NgramExtractorHashing, self).__init__(ns)
+        if not 0 < bits < 32:
+            raise ValueError('NgramExtractorHashing: bits must be in range [1, 31]')
+        self.bits = bits
+        self.signed = signed
+        self.mask = (1 << bits) - 1
+        self.name = 'NgramExtractorHashing'
+
+    def __str__(self):
+        return 'FeatureExtractor=%s (ngrams=[%s], bits=%d, signed=%s)' % \
+               (self.name, ', '.join(map(str, self.ns)), self.bits, self.signed)
+
+    def get_feature_name(self, feature_i):
+        if self.feature_hashes is not None:
+            feature_i = self.feature_hashes[feature_i]
+        return u'hash_%d' % feature_i
+
+    def features_count(self):
+        if self.feature_hashes is not None:
+            return len(self.feature_hashes)
+        return 1 << self.bits
+
+    def learn(self, documents, labels):
+        """Hashing needs no vocabulary, only drops restriction of features"""
+        self.feature_hashes = None
+        self.feature_map = None
+
+    def partial_fit(self, documents, labels):
+        """Hashing needs no vocabulary, so nothing is learned"""
+        pass
+
+    def extend_features(self, names):
+        if names:
+            raise ValueError('NgramExtractorHashing: number of hashed features is fixed')
+
+    def restrict_features(self, features):
+        """Keeps only given hash slots, ngrams hashed to other slots are ignored"""
+        if self.feature_hashes is not None:
+            features = [self.feature_hashes[i] for i in features]
+        self.feature_hashes = [int(feature) for feature in features]
+        self.feature_map = dict((feature, i) for i, feature in enumerate(self.feature_hashes))
+
+    def hash_ngram(self, ngram):
+        """Returns (feature index, sign) of ngram"""
+        hashed = zlib.crc32(ngram.encode('utf-8')) & 0xffffffff
+        if self.signed and hashed >> 31:
+            return hashed & self.mask, -1.
+        return hashed & self.mask, 1.
+
+    def extract_row(self, document):
+        row = defaultdict(float)
+        for ngram in self.iter_ngrams(document.split()):
+            self.add_ngram(row, ngram)
+
+        if self.feature_map is not None:
+            feature_map = self.feature_map
+            return dict((feature_map[i], value) for i, value in row.iteritems() if i in feature_map)
+        return row
+
+
+class NgramExtractorHashingBoolean(NgramExtractorHashing):
+    """Values a_i of feature_vector [a_1, ..., a_n] equal
+        (signed) 1 if some ngram hashed to i is presented in text document
+        0 otherwise
+    """
+
+    def __init__(self, ns, bits=20, signed=False):
+        super(NgramExtractorHashingBoolean, self).__init__(ns, bits, signed)
+        self.name = 'NgramExtractorHashingBoolean'
+
+    def add_ngram(self, feature_vector, ngram):
+        ngram_pos, sign = self.hash_ngram(ngram)
+        feature_vector[ngram_pos] = sign
+
+
+class NgramExtractorHashingCount(NgramExtractorHashing):
+    """Values a_i of feature_vector [a_1, ..., a_n] equal
+        (signed) number of occurrences of ngrams hashed to i in text document
+    """
+
+    def __init__(self, ns, bits=20, signed=False):
+        super(NgramExtractorHashingCount, self).__init__(ns, bits, signed)
+        self.name = 'NgramExtractorHashingCount'
+
+    def add_ngram(self, feature_vector, ngram):
+        ngram_pos, sign = self.hash_ngram(ngram)
+        feature_vector[ngram_pos] += sign
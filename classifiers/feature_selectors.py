@@ -1,9 +1,37 @@
 import numpy as np
-import math
+
+
+class FeatureStatistics(object):
+    """Sufficient statistics of labelled feature matrix, computed in one pass
+
+    class_feature_counts -- class x feature sums of feature values
+    class_document_frequency -- class x feature numbers of documents containing feature
+    class_document_count -- numbers of documents of each class
+    """
+
+    def __init__(self, feature_matrix, labels, class_count):
+        self.class_feature_counts = feature_matrix.sum_by_label(labels, class_count)
+        self.class_document_frequency = feature_matrix.binarize().sum_by_label(labels, class_count)
+        self.class_document_count = np.bincount(labels, minlength=class_count).astype(np.float64)
+        self.class_count = class_count
+        self.feature_count = feature_matrix.shape[1]
+
+    def document_count(self):
+        return np.sum(self.class_document_count)
+
+
+def top_indices(scores, count):
+    """Indices of count greatest scores (in no particular order)"""
+    count = min(int(count), len(scores))
+    if count <= 0:
+        return np.zeros((0,), dtype=np.int64)
+    return np.argpartition(-scores, count - 1)[:count]
 
 
 class BaseFeatureSelector(object):
     def __init__(self, feature_extractor, top):
+        if getattr(feature_extractor, 'signed', False):
+            raise ValueError('FeatureSelector: values of signed hashing extractor may be negative')
         self.feature_extractor = feature_extractor
         self.name = 'FeatureSelectorBase'
         self.top = top
@@ -11,39 +39,63 @@ class BaseFeatureSelector(object):
     def __str__(self):
         return 'FeatureSelector=%s (top = %f), %s' % (self.name, self.top, str(self.feature_extractor))
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'best_features' in state:
+            # selector pickled before vocabulary remapping, remap it now
+            self.feature_extractor.restrict_features(self.best_features)
+            del self.best_features
+
+    def get_feature_name(self, feature_i):
+        return self.feature_extractor.get_feature_name(feature_i)
+
     def features_count(self):
-        return len(self.best_features)
+        return self.feature_extractor.features_count()
 
-    def get_feature_scores(self, documents, labels, feature_count):
+    def get_feature_scores(self, statistics):
+        """Returns class x feature matrix of scores (features are selected per class)
+        or vector of feature scores (features are selected globally)"""
         raise NotImplementedError()
 
     def learn(self, documents, labels):
-        best_features = set([])
         self.feature_extractor.learn(documents, labels)
-        f_num = self.feature_extractor.features_count()
+        class_count = len(set(labels))
+        feature_matrix = self.feature_extractor.extract_batch(documents)
+        statistics = FeatureStatistics(feature_matrix, labels, class_count)
+        self.feature_extractor.restrict_features(self.select_features(statistics))
+
+    def select_features(self, statistics):
+        """Sorted indices of best features according to statistics of extracted feature matrix"""
+        f_num = statistics.feature_count
         if 0.0 < self.top <= 1.0:
             top_num = f_num * self.top
         else:
             top_num = self.top
 
-        scores = self.get_feature_scores(documents, labels, f_num)
-        class_count = len(set(labels))
+        class_count = statistics.class_count
+        scores = self.get_feature_scores(statistics)
 
-        for Class in xrange(class_count):
-            features = zip(range(f_num), list(scores[Class]))
-            features.sort(key=lambda x: x[1], reverse=True)
-            best_for_class = map(lambda x: x[0], features[:int(1.0 * top_num / class_count)])
-            for feature in best_for_class:
-                best_features.add(feature)
+        if scores.ndim == 1:
+            best_features = top_indices(scores, top_num)
+        else:
+            best_for_classes = [top_indices(scores[Class], 1.0 * top_num / class_count)
+                                for Class in xrange(class_count)]
+            best_features = np.unique(np.concatenate(best_for_classes))
+
+        return np.sort(best_features)
 
-        self.best_features = list(best_features)
+    def partial_fit(self, documents, labels):
+        raise NotImplementedError('BaseFeatureSelector:partial_fit() is not supported, '
+                                  'features are selected from statistics of the whole training set')
 
     def extract(self, document):
-        orig_features = self.feature_extractor.extract(document)
-        features = np.zeros((self.features_count(),))
-        for i in xrange(self.features_count()):
-            features[i] = orig_features[self.best_features[i]]
-        return features
+        return self.feature_extractor.extract(document)
+
+    def extract_row(self, document):
+        return self.feature_extractor.extract_row(document)
+
+    def extract_batch(self, documents):
+        return self.feature_extractor.extract_batch(documents)
 
 
 class MutualInformationFeatureSelector(BaseFeatureSelector):
@@ -51,44 +103,25 @@ class MutualInformationFeatureSelector(BaseFeatureSelector):
         super(MutualInformationFeatureSelector, self).__init__(feature_extractor, top)
         self.name = 'MISelector'
 
-    def get_feature_scores(self, documents, labels, feature_count):
-        classes = set(labels)
-        class_count = len(classes)
-        FV = map(self.feature_extractor.extract, documents)
-        MI = np.zeros((len(classes), feature_count))
-        FC = np.zeros((feature_count, class_count))
-        FS = np.zeros((feature_count,))
-        CF = np.zeros((class_count, ))
-        N = 4.0
-
-        for i in xrange(len(documents)):
-            label = labels[i]
-            for Feature in xrange(feature_count):
-                feature_instance = FV[i][Feature]
-                FC[Feature][label] += feature_instance
-                CF[label] += feature_instance
-                N += feature_instance
-
-        for Feature in xrange(feature_count):
-            FS[Feature] = np.sum(FC[Feature])
-
-        for Class in xrange(class_count):
-            for Feature in xrange(feature_count):
-                n_11 = FC[Feature][Class] + 1.
-                n_10 = FS[Feature] - FC[Feature][Class] + 1.
-                n_01 = CF[Class] - FC[Feature][Class] + 1.
-                n_00 = N - (n_11 + n_10 + n_01)
-
-                n_1x = n_11 + n_10
-                n_x1 = n_11 + n_01
-                n_0x = n_00 + n_01
-                n_x0 = n_00 + n_10
-                MI[Class][Feature] = (n_11 / N) * math.log(N * n_11 / (n_1x * n_x1), 2) + \
-                                     (n_10 / N) * math.log(N * n_10 / (n_1x * n_x0), 2) + \
-                                     (n_01 / N) * math.log(N * n_01 / (n_0x * n_x1), 2) + \
-                                     (n_00 / N) * math.log(N * n_00 / (n_0x * n_x0), 2)
-
-        return MI
+    def get_feature_scores(self, statistics):
+        FC = statistics.class_feature_counts
+        FS = np.sum(FC, axis=0)
+        CF = np.sum(FC, axis=1)[:, np.newaxis]
+        N = 4.0 + np.sum(CF)
+
+        n_11 = FC + 1.
+        n_10 = FS - FC + 1.
+        n_01 = CF - FC + 1.
+        n_00 = N - (n_11 + n_10 + n_01)
+
+        n_1x = n_11 + n_10
+        n_x1 = n_11 + n_01
+        n_0x = n_00 + n_01
+        n_x0 = n_00 + n_10
+        return (n_11 / N) * np.log2(N * n_11 / (n_1x * n_x1)) + \
+               (n_10 / N) * np.log2(N * n_10 / (n_1x * n_x0)) + \
+               (n_01 / N) * np.log2(N * n_01 / (n_0x * n_x1)) + \
+               (n_00 / N) * np.log2(N * n_00 / (n_0x * n_x0))
 
 
 class DeltaIdfFeatureSelector(BaseFeatureSelector):
@@ -96,9 +129,6 @@ class DeltaIdfFeatureSelector(BaseFeatureSelector):
         super(DeltaIdfFeatureSelector, self).__init__(feature_extractor, top)
         self.name = 'DeltaIdf'
 
-    def features_count(self):
-        return len(self.best_features)
-
     def top_n_features(self, n):
         self.features_delta.sort(key=lambda x: x[1])
         get_name = lambda x: (self.feature_extractor.get_feature_name(x[0]), x[1])
@@ -109,24 +139,53 @@ class DeltaIdfFeatureSelector(BaseFeatureSelector):
         bottom.sort(key=absolute)
         return top, bottom
 
-    def get_feature_scores(self, documents, labels, feature_count):
-        classes = set(labels)
-        class_count = len(classes)
-        class_feature_counts = np.zeros((class_count, feature_count))
-        class_document_count = [0. for i in xrange(class_count)]
-
-        for i in xrange(len(documents)):
-            document, label = documents[i], labels[i]
-            feature_vector = self.feature_extractor.extract(document)
-            class_feature_counts[label] += feature_vector
-            class_document_count[label] += 1
-
-        features_deltas = []
-        for Class1 in xrange(class_count):
-            features_delta = np.log2(class_document_count[Class1] / (class_feature_counts[Class1] + 1.))
-            for Class2 in xrange(class_count):
-                if Class1 != Class2:
-                    features_delta -= np.log2(class_document_count[Class2] / (class_feature_counts[Class2] + 1.))
-            features_deltas.append(features_delta)
-
-        return features_deltas
+    def get_feature_scores(self, statistics):
+        class_document_count = statistics.class_document_count[:, np.newaxis]
+        log_idf = np.log2(class_document_count / (statistics.class_feature_counts + 1.))
+        # delta of each class against all the other classes
+        return 2. * log_idf - np.sum(log_idf, axis=0)
+
+
+class ChiSquareFeatureSelector(BaseFeatureSelector):
+    """Chi-square statistic of feature presence against class (one class vs the rest)"""
+
+    def __init__(self, feature_extractor, top):
+        super(ChiSquareFeatureSelector, self).__init__(feature_extractor, top)
+        self.name = 'ChiSquare'
+
+    def get_feature_scores(self, statistics):
+        N = statistics.document_count()
+        A = statistics.class_document_frequency
+        B = np.sum(A, axis=0) - A
+        C = statistics.class_document_count[:, np.newaxis] - A
+        D = N - A - B - C
+
+        denominator = (A + C) * (B + D) * (A + B) * (C + D)
+        chi_square = N * (A * D - B * C) ** 2 / np.where(denominator > 0, denominator, 1.)
+        return np.where(denominator > 0, chi_square, 0.)
+
+
+class InformationGainFeatureSelector(BaseFeatureSelector):
+    """Decrease of class entropy after observing feature presence,
+    features are ranked globally"""
+
+    def __init__(self, feature_extractor, top):
+        super(InformationGainFeatureSelector, self).__init__(feature_extractor, top)
+        self.name = 'InformationGain'
+
+    def entropy(self, counts, totals):
+        """Entropy of class distributions given by columns of counts"""
+        probability = counts / np.where(totals > 0, totals, 1.)
+        return -np.sum(probability * np.log2(np.where(probability > 0, probability, 1.)), axis=0)
+
+    def get_feature_scores(self, statistics):
+        N = statistics.document_count()
+        class_count = statistics.class_document_count[:, np.newaxis]
+        present = statistics.class_document_frequency
+        absent = class_count - present
+        present_total = np.sum(present, axis=0)
+        absent_total = N - present_total
+
+        class_entropy = self.entropy(class_count, N)[0]
+        return class_entropy - (present_total / N) * self.entropy(present, present_total) - \
+               (absent_total / N) * self.entropy(absent, absent_total)
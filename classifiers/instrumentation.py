@@ -0,0 +1,160 @@
+"""
+Opt-in timing of pipeline stages
+
+Instrumented code records durations under stage names ('preprocess.<Preprocessor>',
+'extract', 'score', 'twitter.<method>', ...) into per-process histograms, and
+into totals of the current request when one is started by start_request().
+Disabled instrumentation costs one attribute check per instrumented call;
+concurrent updates are not locked, so counts from many threads are approximate.
+"""
+
+import math
+import threading
+import time
+
+enabled = False
+clock = time.time
+
+# histogram buckets are powers of two of microseconds: [0, 2), [2, 4), ..., [2^30, inf)
+BUCKET_COUNT = 31
+
+
+class Histogram(object):
+    """Count, total, extremes and log2-bucketed distribution of durations"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+        self.buckets = [0] * BUCKET_COUNT
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        # frexp exponent e satisfies 2^(e-1) <= microseconds < 2^e
+        bucket = math.frexp(seconds * 1e6)[1] - 1
+        self.buckets[min(max(bucket, 0), BUCKET_COUNT - 1)] += 1
+
+    def percentile(self, percent):
+        """Upper bound of percentile in seconds, precise up to factor of two"""
+        if not self.count:
+            return None
+        rank = percent / 100. * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(2. ** (bucket + 1) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'total_s': self.total, 'min_s': self.min, 'max_s': self.max,
+                'mean_s': self.total / self.count if self.count else None,
+                'p50_s': self.percentile(50), 'p90_s': self.percentile(90), 'p99_s': self.percentile(99)}
+
+
+histograms = {}
+counters = {}
+lock = threading.Lock()
+current = threading.local()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with lock:
+        histograms.clear()
+        counters.clear()
+
+
+def record(name, seconds):
+    """Adds duration of stage name"""
+    histogram = histograms.get(name)
+    if histogram is None:
+        with lock:
+            histogram = histograms.setdefault(name, Histogram())
+    histogram.add(seconds)
+    timings = getattr(current, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.) + seconds
+
+
+def increment(name, value=1):
+    counters[name] = counters.get(name, 0) + value
+
+
+class Timer(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, clock() - self.started)
+        return False
+
+
+class NoTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+no_timer = NoTimer()
+
+
+def timer(name):
+    """Context manager timing its block as stage name, if instrumentation is enabled"""
+    if enabled:
+        return Timer(name)
+    return no_timer
+
+
+def start_request():
+    """Starts collecting stage totals of current thread's request"""
+    current.timings = {}
+
+
+def finish_request():
+    """Returns dict stage -> seconds spent in current thread's request"""
+    timings = getattr(current, 'timings', None) or {}
+    current.timings = None
+    return timings
+
+
+def snapshot():
+    """All statistics as JSON-serialisable dict"""
+    with lock:
+        return {'enabled': enabled,
+                'stages': dict((name, histogram.to_dict()) for name, histogram in histograms.items()),
+                'counters': dict(counters)}
+
+
+def format_stats():
+    """Statistics as text table, stages sorted by total time"""
+    stats = snapshot()
+    lines = ['%-70s %10s %12s %12s %12s %12s' % ('stage', 'count', 'total ms', 'mean us', 'p90 us', 'p99 us')]
+    for name, stage in sorted(stats['stages'].items(), key=lambda item: -item[1]['total_s']):
+        lines.append('%-70s %10i %12.1f %12.1f %12.1f %12.1f' %
+                     (name, stage['count'], stage['total_s'] * 1e3, stage['mean_s'] * 1e6,
+                      stage['p90_s'] * 1e6, stage['p99_s'] * 1e6))
+    for name, value in sorted(stats['counters'].items()):
+        lines.append('%-70s %10i' % (name, value))
+    return '\n'.join(lines)
@@ -0,0 +1,319 @@
+"""
+Versioned on-disk classifier format, a directory (conventionally *.model) of
+
+manifest.json -- format name and version, list of stored files
+skeleton.pkl -- pickle of the classifier without its large tables
+array_<n>.npy -- numeric tables, raw arrays loadable with np.load(mmap_mode='r')
+vocabulary_<n>.*.npy -- ngram vocabularies: utf-8 strings concatenated in one
+    byte array, sorted by (crc32, ngram) and indexed by offsets
+
+Loaded with mmap_mode='r' nothing is parsed but the small skeleton, so loading is
+near-instant and pages of tables are shared by all processes mapping the same model.
+
+Converting existing pickles:
+    python -m classifiers.model_format trained_classifiers/*.obj
+"""
+
+import binascii
+import cPickle
+import errno
+import json
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+
+from classifiers.feature_extractors import NgramExtractorBase, NgramExtractorHashing
+
+FORMAT_NAME = 'bachelor-project-model'
+FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+SKELETON_FILE = 'skeleton.pkl'
+
+# smaller arrays are pickled into skeleton
+MIN_ARRAY_BYTES = 4096
+
+
+def ngram_hash(encoded):
+    return zlib.crc32(encoded) & 0xffffffff
+
+
+class MappedVocabulary(object):
+    """Read-only mapping ngram -> feature index over memory-mapped arrays
+
+    strings -- uint8 array, utf-8 ngrams sorted by (hash, ngram)
+    offsets -- ngram i is strings[offsets[i]:offsets[i + 1]]
+    hashes -- sorted crc32 of ngrams, searched to find ngram
+    features -- feature index of ngram i
+    """
+
+    # lookups of one process are memoised until memo grows that large
+    MAX_MEMO_SIZE = 100000
+
+    def __init__(self, strings, offsets, hashes, features):
+        self.strings = strings
+        self.offsets = offsets
+        self.hashes = hashes
+        self.features = features
+        self.memo = {}
+
+    def __reduce__(self):
+        # pickled as plain dict
+        return dict, (list(self.iteritems()),)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def ngram(self, position):
+        return self.strings[self.offsets[position]:self.offsets[position + 1]].tostring().decode('utf-8')
+
+    def find(self, ngram):
+        """Feature index of ngram or -1"""
+        if ngram in self.memo:
+            return self.memo[ngram]
+
+        encoded = ngram.encode('utf-8')
+        hashed = ngram_hash(encoded)
+        position, feature = int(np.searchsorted(self.hashes, hashed)), -1
+        while position < len(self.hashes) and self.hashes[position] == hashed:
+            if self.strings[self.offsets[position]:self.offsets[position + 1]].tostring() == encoded:
+                feature = int(self.features[position])
+                break
+            position += 1
+
+        if len(self.memo) >= self.MAX_MEMO_SIZE:
+            self.memo = {}
+        self.memo[ngram] = feature
+        return feature
+
+    def __contains__(self, ngram):
+        return self.find(ngram) >= 0
+
+    def __getitem__(self, ngram):
+        feature = self.find(ngram)
+        if feature < 0:
+            raise KeyError(ngram)
+        return feature
+
+    def get(self, ngram, default=None):
+        feature = self.find(ngram)
+        return default if feature < 0 else feature
+
+    def __iter__(self):
+        for position in xrange(len(self)):
+            yield self.ngram(position)
+
+    def iteritems(self):
+        for position in xrange(len(self)):
+            yield self.ngram(position), int(self.features[position])
+
+
+class MappedFeatureList(object):
+    """Read-only list of ngrams indexed by feature index, backed by MappedVocabulary"""
+
+    def __init__(self, vocabulary, positions):
+        self.vocabulary = vocabulary
+        self.positions = positions
+
+    def __reduce__(self):
+        # pickled as plain list
+        return list, (list(self),)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, feature_i):
+        return self.vocabulary.ngram(self.positions[feature_i])
+
+    def __iter__(self):
+        for feature_i in xrange(len(self)):
+            yield self[feature_i]
+
+
+class ModelWriter(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.arrays = {}
+        self.vocabularies = {}
+
+    def save_array(self, name, array):
+        np.save(os.path.join(self.directory, name + '.npy'), np.ascontiguousarray(array))
+        self.files[name] = {'dtype': str(array.dtype), 'shape': list(array.shape)}
+
+    def save_vocabulary(self, name, feature_list):
+        encoded = [ngram.encode('utf-8') for ngram in feature_list]
+        order = sorted(xrange(len(encoded)), key=lambda i: (ngram_hash(encoded[i]), encoded[i]))
+
+        lengths = np.array([len(encoded[i]) for i in order], dtype=np.int64)
+        offsets = np.zeros((len(order) + 1,), dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        features = np.array(order, dtype=np.int32)
+        positions = np.zeros((len(order),), dtype=np.int32)
+        positions[features] = np.arange(len(order), dtype=np.int32)
+
+        self.save_array(name + '.strings', np.fromstring(''.join(encoded[i] for i in order), dtype=np.uint8))
+        self.save_array(name + '.offsets', offsets)
+        self.save_array(name + '.hashes', np.array([ngram_hash(encoded[i]) for i in order], dtype=np.uint32))
+        self.save_array(name + '.features', features)
+        self.save_array(name + '.positions', positions)
+
+    def persistent_id(self, obj):
+        """Stores large arrays and ngram vocabularies outside of pickle"""
+        if isinstance(obj, np.ndarray) and obj.dtype != object and obj.nbytes >= MIN_ARRAY_BYTES:
+            if id(obj) not in self.arrays:
+                name = 'array_%i' % (len(self.arrays),)
+                self.save_array(name, obj)
+                self.arrays[id(obj)] = (obj, name)
+            return 'array', self.arrays[id(obj)][1]
+
+        if isinstance(obj, NgramExtractorBase) and not isinstance(obj, NgramExtractorHashing):
+            if id(obj) not in self.vocabularies:
+                name = 'vocabulary_%i' % (len(self.vocabularies),)
+                self.save_vocabulary(name, obj.feature_list)
+                self.vocabularies[id(obj)] = (obj, name)
+            state = obj.__dict__.copy()
+            del state['ngrams'], state['feature_list']
+            # state itself is pickled as usual, with its own persistent ids
+            return 'vocabulary', self.vocabularies[id(obj)][1], type(obj), state
+        return None
+
+    def write(self, classifier):
+        with open(os.path.join(self.directory, SKELETON_FILE), 'wb') as f:
+            pickler = cPickle.Pickler(f, 2)
+            pickler.persistent_id = self.persistent_id
+            pickler.dump(classifier)
+
+        manifest = {'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+                    'classifier': type(classifier).__name__, 'files': self.files}
+        with open(os.path.join(self.directory, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+class ModelReader(object):
+    def __init__(self, directory, mmap_mode):
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+        self.files = {}
+        self.loaded = {}
+
+    def load_array(self, name):
+        # empty arrays can not be mapped
+        mmap_mode = self.mmap_mode if np.prod(self.files[name]['shape']) > 0 else None
+        return np.load(os.path.join(self.directory, name + '.npy'), mmap_mode=mmap_mode)
+
+    def load_vocabulary(self, name, cls, state):
+        extractor = cls.__new__(cls)
+        extractor.__dict__.update(state)
+        vocabulary = MappedVocabulary(*[self.load_array(name + suffix)
+                                        for suffix in ('.strings', '.offsets', '.hashes', '.features')])
+        feature_list = MappedFeatureList(vocabulary, self.load_array(name + '.positions'))
+        if self.mmap_mode == 'r':
+            extractor.ngrams, extractor.feature_list = vocabulary, feature_list
+        else:
+            # writable model gets ordinary vocabulary, so it can be updated
+            extractor.feature_list = list(feature_list)
+            extractor.ngrams = dict((ngram, i) for i, ngram in enumerate(extractor.feature_list))
+        return extractor
+
+    def persistent_load(self, pid):
+        if pid[1] not in self.loaded:
+            if pid[0] == 'array':
+                self.loaded[pid[1]] = self.load_array(pid[1])
+            else:
+                self.loaded[pid[1]] = self.load_vocabulary(*pid[1:])
+        return self.loaded[pid[1]]
+
+    def read(self):
+        with open(os.path.join(self.directory, MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT_NAME or manifest.get('version') > FORMAT_VERSION:
+            raise ValueError('Unsupported model format %s version %s in %s' %
+                             (manifest.get('format'), manifest.get('version'), self.directory))
+        self.files = manifest['files']
+
+        with open(os.path.join(self.directory, SKELETON_FILE), 'rb') as f:
+            unpickler = cPickle.Unpickler(f)
+            unpickler.persistent_load = self.persistent_load
+            return unpickler.load()
+
+
+def is_model_directory(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def temp_path(directory, prefix):
+    return os.path.join(directory, prefix + binascii.hexlify(os.urandom(8)))
+
+
+def make_temp_directory(directory, prefix):
+    """Like tempfile.mkdtemp, but with mode 0777 restricted by umask, as directories
+    created by process usually are (mkdtemp makes them private)"""
+    while True:
+        path = temp_path(directory, prefix)
+        try:
+            os.mkdir(path, 0777)
+            return path
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def make_temp_file(directory, prefix):
+    """Like tempfile.mkstemp, returns (file descriptor, path) of new file
+    with mode 0666 restricted by umask"""
+    while True:
+        path = temp_path(directory, prefix)
+        try:
+            return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666), path
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def save_model(path, classifier):
+    """Saves classifier to directory path; the model is written to a temporary
+    directory renamed to path when complete, so a partial model is never read.
+    Existing model is moved away first, so path briefly does not exist."""
+    path = os.path.abspath(path)
+    temp_dir = make_temp_directory(os.path.dirname(path), '.tmp-')
+    try:
+        ModelWriter(temp_dir).write(classifier)
+        if os.path.isdir(path):
+            old_dir = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.old-')
+            os.rename(path, os.path.join(old_dir, 'model'))
+            os.rename(temp_dir, path)
+            shutil.rmtree(old_dir)
+        else:
+            os.rename(temp_dir, path)
+    except:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
+def load_model(path, mmap_mode='r'):
+    """Loads classifier saved by save_model
+
+    mmap_mode -- 'r' maps tables read-only (shared between processes),
+        'c' maps them copy-on-write, None reads them into memory;
+        classifiers loaded with 'r' can not be updated or retrained
+    """
+    return ModelReader(path, mmap_mode).read()
+
+
+def convert(pickle_path, model_path=None):
+    """Converts pickled classifier (.obj) to model directory (.model)"""
+    with open(pickle_path, 'rb') as f:
+        classifier = cPickle.load(f)
+    if model_path is None:
+        model_path = os.path.splitext(pickle_path)[0] + '.model'
+    save_model(model_path, classifier)
+    return model_path
+
+
+if __name__ == '__main__':
+    for pickle_path in sys.argv[1:]:
+        print 'Converted %s to %s' % (pickle_path, convert(pickle_path))
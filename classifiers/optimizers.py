@@ -0,0 +1,197 @@
+import numpy as np
+import time
+
+
+class SoftmaxObjective(object):
+    """Mean negative log likelihood of multinomial logistic regression
+    with L2 penalty on weights
+
+    Parameters are packed into one vector: class_count x feature_count weights
+    followed by class_count biases.
+    """
+
+    def __init__(self, feature_matrix, labels, class_count, l2=0.):
+        self.feature_matrix = feature_matrix
+        self.labels = np.asarray(labels)
+        self.class_count = class_count
+        self.feature_count = feature_matrix.shape[1]
+        self.l2 = l2
+
+    def document_count(self):
+        return len(self.labels)
+
+    def initial_params(self):
+        return np.zeros((self.class_count * (self.feature_count + 1),))
+
+    def unpack(self, params):
+        """Splits parameter vector to weights matrix and bias vector"""
+        split = self.class_count * self.feature_count
+        return params[:split].reshape((self.class_count, self.feature_count)), params[split:]
+
+    def loss_and_gradient(self, params, rows=None):
+        """Loss and its gradient on all documents or only on given rows"""
+        feature_matrix, labels = self.feature_matrix, self.labels
+        if rows is not None:
+            feature_matrix, labels = feature_matrix.take_rows(rows), labels[rows]
+        document_count = max(len(labels), 1)
+        weights, bias = self.unpack(params)
+
+        scores = feature_matrix.dot(weights.T) + bias
+        scores -= np.max(scores, axis=1)[:, np.newaxis]
+        log_normalizer = np.log(np.sum(np.exp(scores), axis=1))
+        log_probability = scores - log_normalizer[:, np.newaxis]
+
+        documents = np.arange(len(labels))
+        loss = -np.sum(log_probability[documents, labels]) / document_count
+        loss += 0.5 * self.l2 * np.sum(weights ** 2)
+
+        residual = np.exp(log_probability)
+        residual[documents, labels] -= 1.
+        weights_gradient = feature_matrix.transpose_dot(residual).T / document_count + self.l2 * weights
+        bias_gradient = np.sum(residual, axis=0) / document_count
+
+        return loss, np.concatenate((weights_gradient.ravel(), bias_gradient))
+
+    def loss(self, params):
+        return self.loss_and_gradient(params)[0]
+
+
+class LBFGSOptimizer(object):
+    """Limited-memory BFGS with backtracking line search"""
+
+    def __init__(self, memory=10, max_line_search=20):
+        self.memory = memory
+        self.max_line_search = max_line_search
+
+    def direction(self, gradient, steps, gradient_steps):
+        """Two-loop recursion, approximates inverse Hessian times gradient"""
+        q = gradient.copy()
+        alphas = []
+        for s, y in reversed(zip(steps, gradient_steps)):
+            alpha = np.dot(s, q) / np.dot(y, s)
+            q -= alpha * y
+            alphas.append(alpha)
+
+        if steps:
+            s, y = steps[-1], gradient_steps[-1]
+            q *= np.dot(s, y) / np.dot(y, y)
+
+        for (s, y), alpha in zip(zip(steps, gradient_steps), reversed(alphas)):
+            beta = np.dot(y, q) / np.dot(y, s)
+            q += (alpha - beta) * s
+        return -q
+
+    def iterate(self, objective, params):
+        """Yields (params, loss, gradient) after each iteration"""
+        loss, gradient = objective.loss_and_gradient(params)
+        steps, gradient_steps = [], []
+
+        while True:
+            direction = self.direction(gradient, steps, gradient_steps)
+            slope = np.dot(gradient, direction)
+            if slope >= 0:
+                steps, gradient_steps = [], []
+                direction = -gradient
+                slope = np.dot(gradient, direction)
+
+            step = 1. if steps else 1. / max(np.sqrt(-slope), 1.)
+            for i in xrange(self.max_line_search):
+                new_params = params + step * direction
+                new_loss, new_gradient = objective.loss_and_gradient(new_params)
+                if new_loss <= loss + 1e-4 * step * slope:
+                    break
+                step *= 0.5
+            else:
+                # no step decreases loss enough: params are kept, memory of curvature
+                # is dropped and steepest descent tried, or it failed too and loss cannot decrease
+                if not steps:
+                    return
+                steps, gradient_steps = [], []
+                continue
+
+            s, y = new_params - params, new_gradient - gradient
+            if np.dot(s, y) > 1e-10:
+                steps.append(s)
+                gradient_steps.append(y)
+                if len(steps) > self.memory:
+                    steps.pop(0)
+                    gradient_steps.pop(0)
+
+            params, loss, gradient = new_params, new_loss, new_gradient
+            yield params, loss, gradient
+
+
+class SGDOptimizer(object):
+    """Mini-batch stochastic gradient descent, one iteration is one pass over documents"""
+
+    def __init__(self, step=0.5, batch_size=100, decay=0.1, seed=0):
+        self.step = step
+        self.batch_size = batch_size
+        self.decay = decay
+        self.random = np.random.RandomState(seed)
+
+    def iterate(self, objective, params):
+        """Yields (params, loss, gradient) after each epoch"""
+        document_count = objective.document_count()
+        epoch = 0
+        while True:
+            rate = self.step / (1. + self.decay * epoch)
+            order = self.random.permutation(document_count)
+            for start in xrange(0, document_count, self.batch_size):
+                batch = order[start:start + self.batch_size]
+                loss, gradient = objective.loss_and_gradient(params, batch)
+                params = params - rate * gradient
+
+            epoch += 1
+            loss, gradient = objective.loss_and_gradient(params)
+            yield params, loss, gradient
+
+
+def minimize(objective, params, optimizer, num_iter=100, epsilon=1e-4,
+             validation=None, patience=5, show_progress=False):
+    """Runs optimizer until convergence
+
+    num_iter -- maximal number of iterations
+    epsilon -- stops when relative loss decrease or gradient norm falls below it
+    validation -- objective on held-out documents, stops early when its loss
+        did not improve for patience iterations, best params are returned
+    returns (params, history), where history is list of dicts with
+    iteration, loss, validation_loss and time (seconds) of each iteration
+    """
+    history = []
+    best_params, best_loss, bad_iterations = params, None, 0
+    previous_loss = None
+    started = time.time()
+
+    for itr, (params, loss, gradient) in enumerate(optimizer.iterate(objective, params)):
+        finished = time.time()
+        record = {'iteration': itr + 1, 'loss': loss, 'validation_loss': None, 'time': finished - started}
+
+        if validation is not None:
+            record['validation_loss'] = validation.loss(params)
+            if best_loss is None or record['validation_loss'] < best_loss:
+                best_params, best_loss, bad_iterations = params, record['validation_loss'], 0
+            else:
+                bad_iterations += 1
+        elif previous_loss is None or loss <= previous_loss:
+            best_params = params
+
+        history.append(record)
+        if show_progress:
+            if record['validation_loss'] is None:
+                print 'Iteration %i: loss %f, %f s' % (itr + 1, loss, record['time'])
+            else:
+                print 'Iteration %i: loss %f, validation loss %f, %f s' % \
+                      (itr + 1, loss, record['validation_loss'], record['time'])
+
+        converged = np.sqrt(np.sum(gradient ** 2)) <= epsilon
+        if previous_loss is not None:
+            # increase of loss counts as no progress
+            converged = converged or previous_loss - loss <= epsilon * max(abs(previous_loss), 1.)
+        if converged or bad_iterations >= patience or itr + 1 >= num_iter:
+            break
+
+        previous_loss = loss
+        started = time.time()
+
+    return best_params, history
@@ -1,7 +1,21 @@
-import unicodedata
-import sys
 import re
 
+from classifiers import instrumentation
+from classifiers.unicode_tables import category_ranges, category_code_points
+
+
+shared_punctuation_table = None
+
+
+def punctuation_table():
+    """Maps all punctuation except '_' to None"""
+    global shared_punctuation_table
+    if shared_punctuation_table is None:
+        table = dict.fromkeys(category_code_points('P'))
+        table.pop(ord(u'_'), None)
+        shared_punctuation_table = table
+    return shared_punctuation_table
+
 
 class PreprocessorBase(object):
     def __init__(self):
@@ -10,6 +24,10 @@ class PreprocessorBase(object):
     def preprocess(self, text):
         pass
 
+    def compile(self):
+        """Returns function equivalent to preprocess, possibly faster"""
+        return self.preprocess
+
 
 class PreprocessorPunctuationRemove(PreprocessorBase):
     """
@@ -20,13 +38,38 @@ class PreprocessorPunctuationRemove(PreprocessorBase):
 
     def __init__(self):
         super(PreprocessorPunctuationRemove, self).__init__()
-        self.table = dict.fromkeys(i for i in xrange(sys.maxunicode)
-                                   if unicodedata.category(unichr(i)).startswith('P'))
-        self.table.pop(ord(u'_'), None)
+
+    def __setstate__(self, state):
+        # preprocessors pickled before tables were shared kept their own copy
+        state.pop('table', None)
+        self.__dict__.update(state)
+
+    @property
+    def table(self):
+        """translate() table, loaded on first use and shared by all instances"""
+        return punctuation_table()
 
     def preprocess(self, text):
         return text.translate(self.table)
 
+    def character_class(self):
+        """Regex character class matching removed characters"""
+        ranges = []
+        for start, end in category_ranges('P'):
+            if start <= ord(u'_') <= end:
+                ranges.extend([[start, ord(u'_') - 1], [ord(u'_') + 1, end]])
+            else:
+                ranges.append([start, end])
+        ranges = [[start, end] for start, end in ranges if start <= end]
+
+        escape = lambda code: re.escape(unichr(code))
+        return u'[%s]' % u''.join(escape(start) if start == end else escape(start) + u'-' + escape(end)
+                                  for start, end in ranges)
+
+    def compile(self):
+        regex = re.compile(self.character_class() + u'+', re.UNICODE)
+        return lambda text: regex.sub(u'', text)
+
 
 class PreprocessorHashtagRemove(PreprocessorBase):
     """
@@ -42,6 +85,10 @@ class PreprocessorHashtagRemove(PreprocessorBase):
     def preprocess(self, text):
         return self.regex.sub(u'', text)
 
+    def compile(self):
+        regex = self.regex
+        return lambda text: regex.sub(u'', text) if u'#' in text else text
+
 
 class PreprocessorLengtheningRemove(PreprocessorBase):
     """
@@ -57,6 +104,11 @@ class PreprocessorLengtheningRemove(PreprocessorBase):
     def preprocess(self, text):
         return self.regex.sub(ur'\1\1', text)
 
+    def compile(self):
+        # runs of two characters are replaced by themselves anyway
+        regex = re.compile(ur'(\w)\1\1+', re.UNICODE)
+        return lambda text: regex.sub(ur'\1\1', text)
+
 
 class PreprocessorWhitespaceRemove(PreprocessorBase):
     """
@@ -72,6 +124,11 @@ class PreprocessorWhitespaceRemove(PreprocessorBase):
     def preprocess(self, text):
         return self.regex.sub(ur' ', text)
 
+    def compile(self):
+        # single spaces are replaced by themselves anyway
+        regex = re.compile(ur'\s{2,}|[^\S ]', re.UNICODE)
+        return lambda text: regex.sub(u' ', text)
+
 
 class PreprocessorLowercase(PreprocessorBase):
     """
@@ -104,6 +161,11 @@ class PreprocessorUrlEncode(PreprocessorBase):
     def preprocess(self, text):
         return self.regex.sub(u'URL_TOKEN', text)
 
+    def compile(self):
+        # every matched url contains '/' (protocol or path) or '.' (www.)
+        regex = self.regex
+        return lambda text: regex.sub(u'URL_TOKEN', text) if u'/' in text or u'.' in text else text
+
 
 class PreprocessorUserEncode(PreprocessorBase):
     """
@@ -119,6 +181,10 @@ class PreprocessorUserEncode(PreprocessorBase):
     def preprocess(self, text):
         return self.regex.sub(ur'USERNAME', text)
 
+    def compile(self):
+        regex = self.regex
+        return lambda text: regex.sub(u'USERNAME', text) if u'@' in text else text
+
 
 class PreprocessorEmoticons(PreprocessorBase):
     """
@@ -157,6 +223,21 @@ class PreprocessorEmoticons(PreprocessorBase):
         text = self.regex_pos.sub(u'POSITIVE_SMILEY', text)
         return self.regex_neg.sub(u'NEGATIVE_SMILEY', text)
 
+    def compile(self):
+        # every emoticon contains a mouth character
+        regex_pos, regex_neg = self.regex_pos, self.regex_neg
+        has_pos_mouth = re.compile(ur'[3D\]\}\)\[\(\{]').search
+        has_neg_mouth = re.compile(ur'[\(\[\{\\/\)]').search
+
+        def preprocess(text):
+            if has_pos_mouth(text):
+                text = regex_pos.sub(u'POSITIVE_SMILEY', text)
+            if has_neg_mouth(text):
+                text = regex_neg.sub(u'NEGATIVE_SMILEY', text)
+            return text
+
+        return preprocess
+
 
 class CombinedPreprocessor(PreprocessorBase):
     """
@@ -173,10 +254,92 @@ class CombinedPreprocessor(PreprocessorBase):
         self.preprocessors.append(preprocessor)
 
     def preprocess(self, text):
+        if instrumentation.enabled:
+            return self.timed_preprocess(text)
         for preprocessor in self.preprocessors:
             text = preprocessor.preprocess(text)
         return text
 
+    def timed_preprocess(self, text):
+        """preprocess recording each preprocessor as stage 'preprocess.<class name>'"""
+        clock, record = instrumentation.clock, instrumentation.record
+        for preprocessor in self.preprocessors:
+            started = clock()
+            text = preprocessor.preprocess(text)
+            record('preprocess.' + type(preprocessor).__name__, clock() - started)
+        return text
+
+    def compile(self):
+        return CompiledPreprocessor(self.preprocessors).preprocess
+
+
+class CompiledPreprocessor(PreprocessorBase):
+    """
+
+    Produces exactly the same output as CombinedPreprocessor
+    with fewer and cheaper passes over text:
+    steps are skipped when text lacks characters they require,
+    punctuation removal followed by whitespace replacement is fused
+    into one pass, other steps use their compiled forms
+
+    """
+
+    def __init__(self, preprocessors):
+        super(CompiledPreprocessor, self).__init__()
+        self.preprocessors = preprocessors
+        self.steps, self.step_names = self.compile_steps(preprocessors)
+
+    def __getstate__(self):
+        return {'preprocessors': self.preprocessors}
+
+    def __setstate__(self, state):
+        self.__init__(state['preprocessors'])
+
+    def compile_steps(self, preprocessors):
+        """Returns list of step functions and list of their names for instrumentation"""
+        steps = []
+        names = []
+        i = 0
+        while i < len(preprocessors):
+            preprocessor = preprocessors[i]
+            following = preprocessors[i + 1] if i + 1 < len(preprocessors) else None
+            if isinstance(preprocessor, PreprocessorPunctuationRemove) and \
+                    isinstance(following, PreprocessorWhitespaceRemove):
+                steps.append(self.fuse_punctuation_whitespace(preprocessor))
+                names.append('preprocess.%s+%s' % (type(preprocessor).__name__, type(following).__name__))
+                i += 2
+            else:
+                steps.append(preprocessor.compile())
+                names.append('preprocess.' + type(preprocessor).__name__)
+                i += 1
+        return steps, names
+
+    def fuse_punctuation_whitespace(self, punctuation):
+        """Maximal run of punctuation and whitespace becomes one space
+        if it contains whitespace, empty string otherwise.
+        Runs consisting of one space are not matched at all"""
+        punct = punctuation.character_class()
+        run = ur'[\s%s]' % punct[1:-1]
+        regex = re.compile(ur'(?P<space>%s+\s%s*|\s%s+|[^\S ]%s*)|%s+' % (punct, run, run, run, punct),
+                           re.UNICODE)
+        replace = lambda match: u' ' if match.lastgroup == 'space' else u''
+        return lambda text: regex.sub(replace, text)
+
+    def preprocess(self, text):
+        if instrumentation.enabled:
+            return self.timed_preprocess(text)
+        for step in self.steps:
+            text = step(text)
+        return text
+
+    def timed_preprocess(self, text):
+        clock, record = instrumentation.clock, instrumentation.record
+        for step, name in zip(self.steps, self.step_names):
+            started = clock()
+            text = step(text)
+            record(name, clock() - started)
+        return text
+
 
 def build_preprocessor_from_args(args):
     preprocessors = []
@@ -206,10 +369,12 @@ def build_preprocessor_from_args(args):
     return CombinedPreprocessor(preprocessors)
 
 
-def build_combined_preprocessor():
+def build_combined_preprocessor(compiled=True):
     preprocessors = [PreprocessorLowercase(), PreprocessorUrlEncode(),
                      PreprocessorUserEncode(), PreprocessorEmoticons(),
                      PreprocessorHashtagRemove(), PreprocessorLengtheningRemove(),
                      PreprocessorPunctuationRemove(), PreprocessorWhitespaceRemove()]
 
+    if compiled:
+        return CompiledPreprocessor(preprocessors)
     return CombinedPreprocessor(preprocessors)
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+Grid of cross-validated experiments described by YAML spec, see experiments.yaml
+
+Each dataset is read, shuffled and preprocessed once; every feature extractor
+of the grid extracts the whole dataset once, and folds take rows and columns
+of that matrix (columns of ngrams unseen in training folds are dropped, as a
+vocabulary learned on training folds would do). Feature statistics of a fold
+are shared by all selectors and top-k values. Configurations are evaluated in
+parallel by worker processes which inherit shared data on fork.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy as np
+import yaml
+
+from classifiers.utils import read_labelled_set, UnicodeWriter
+from classifiers.classifier import DictionaryClassifier
+from classifiers.preprocessors import build_combined_preprocessor, CombinedPreprocessor
+from classifiers.feature_extractors import NgramExtractorHashing
+from classifiers.feature_selectors import BaseFeatureSelector, FeatureStatistics
+from classifiers.train_classifier import get_args_parser, build_classifier_from_args
+from classifiers.test_classifier import make_folds, average_measures
+
+COLUMNS = ['dataset', 'algorithm', 'ngrams', 'metric', 'hashing_bits', 'selection', 'top', 'solver', 'l2',
+           'accuracy', 'precision', 'recall', 'f1', 'train_s', 'predict_s']
+
+
+def expand_grid(grid):
+    """Cartesian products of option lists of each grid block, as list of dicts"""
+    configurations = []
+    for block in grid:
+        keys = sorted(block)
+        values = [value if isinstance(value, list) else [value] for value in (block[key] for key in keys)]
+        for combination in itertools.product(*values):
+            configurations.append(dict(zip(keys, combination)))
+    return configurations
+
+
+def build_classifier(configuration, dataset):
+    """Builds classifier the way train_classifier.py does from the same options"""
+    configuration = dict(configuration)
+    configuration.setdefault('metric', 'Count')
+    argv = ['--input', dataset]
+    for key, value in sorted(configuration.items()):
+        argv += ['--' + key.replace('_', '-'), str(value)]
+    return build_classifier_from_args(get_args_parser().parse_args(argv))
+
+
+def split_extractor(classifier):
+    """(feature selector or None, feature extractor) of classifier"""
+    if isinstance(classifier.feature_extractor, BaseFeatureSelector):
+        return classifier.feature_extractor, classifier.feature_extractor.feature_extractor
+    return None, classifier.feature_extractor
+
+
+# data shared with forked worker processes
+shared_state = {}
+# feature statistics of (extractor, fold), per process
+statistics_cache = {}
+
+
+def fold_matrices(dataset, extractor_key, fold):
+    """Train and test feature matrices of fold, without columns unseen in training"""
+    feature_matrix = dataset['matrices'][extractor_key]
+    train_rows, test_rows = dataset['folds'][fold]
+    train_matrix, test_matrix = feature_matrix.take_rows(train_rows), feature_matrix.take_rows(test_rows)
+    if not dataset['hashed'][extractor_key]:
+        seen = np.flatnonzero(np.bincount(train_matrix.indices, minlength=train_matrix.shape[1]))
+        train_matrix, test_matrix = train_matrix.select_columns(seen), test_matrix.select_columns(seen)
+    return train_matrix, test_matrix
+
+
+def evaluate(index):
+    """Cross-validates configuration index, returns its row of results table"""
+    state = shared_state
+    configuration = state['configurations'][index]
+    dataset = state['datasets'][configuration['dataset']]
+    classifier = build_classifier(configuration['options'], configuration['dataset'])
+    encoded_labels = classifier.get_encoded_labels(dataset['labels'])
+
+    correct, p_sum, r_sum, f1_sum, train_time, predict_time = 0, 0., 0., 0., 0., 0.
+    for fold in xrange(len(dataset['folds'])):
+        train_rows, test_rows = dataset['folds'][fold]
+        test_labels = [dataset['labels'][i] for i in test_rows]
+
+        if isinstance(classifier, DictionaryClassifier):
+            classifier.preprocessor = CombinedPreprocessor([])
+            started = time.time()
+            result_labels = classifier.classify_batch([dataset['documents'][i] for i in test_rows])
+            predict_time += time.time() - started
+        else:
+            selector, extractor = split_extractor(classifier)
+            extractor_key = (configuration['dataset'], str(extractor))
+            train_matrix, test_matrix = fold_matrices(dataset, extractor_key, fold)
+            train_labels = encoded_labels[train_rows]
+
+            started = time.time()
+            if selector is not None:
+                if (extractor_key, fold) not in statistics_cache:
+                    statistics_cache.clear()
+                    statistics_cache[(extractor_key, fold)] = \
+                        FeatureStatistics(train_matrix, train_labels, len(classifier.classes))
+                best_features = selector.select_features(statistics_cache[(extractor_key, fold)])
+                train_matrix, test_matrix = \
+                    train_matrix.select_columns(best_features), test_matrix.select_columns(best_features)
+            classifier.learn_features(train_matrix, train_labels)
+            train_time += time.time() - started
+
+            started = time.time()
+            predicted = np.argmax(classifier.class_scores(test_matrix), axis=1)
+            result_labels = [classifier.classes[c] for c in predicted]
+            predict_time += time.time() - started
+
+        correct += sum(1 for expected, observed in zip(test_labels, result_labels) if expected == observed)
+        p, r, f1 = average_measures(dataset['classes'], test_labels, result_labels)
+        p_sum, r_sum, f1_sum = p_sum + p, r_sum + r, f1_sum + f1
+
+    folds = len(dataset['folds'])
+    row = dict((key, configuration['options'].get(key, '')) for key in COLUMNS)
+    row.update({'dataset': configuration['dataset'], 'accuracy': float(correct) / len(dataset['labels']),
+                'precision': p_sum / folds, 'recall': r_sum / folds, 'f1': f1_sum / folds,
+                'train_s': train_time, 'predict_s': predict_time})
+    return row
+
+
+def prepare_dataset(path, configurations, folds, stratified, seed):
+    """Reads, shuffles and preprocesses dataset, extracts feature matrices
+    of all extractors used by configurations"""
+    documents, labels = read_labelled_set(path)
+    order = range(len(documents))
+    random.Random(seed).shuffle(order)
+    documents, labels = [documents[i] for i in order], [labels[i] for i in order]
+
+    started = time.time()
+    documents = map(build_combined_preprocessor().preprocess, documents)
+    print 'Dataset %s: %i documents preprocessed in %.2f s' % (path, len(documents), time.time() - started)
+
+    assignment = make_folds(labels, folds, stratified)
+    dataset = {'documents': documents, 'labels': labels, 'classes': sorted(set(labels)),
+               'folds': [(np.flatnonzero(assignment != fold), np.flatnonzero(assignment == fold))
+                         for fold in xrange(folds)],
+               'matrices': {}, 'hashed': {}}
+
+    for configuration in configurations:
+        classifier = build_classifier(configuration, path)
+        if isinstance(classifier, DictionaryClassifier):
+            continue
+        selector, extractor = split_extractor(classifier)
+        key = (path, str(extractor))
+        if key not in dataset['matrices']:
+            started = time.time()
+            extractor.learn(documents, None)
+            dataset['matrices'][key] = extractor.extract_batch(documents)
+            dataset['hashed'][key] = isinstance(extractor, NgramExtractorHashing)
+            print '  %s: %i features extracted in %.2f s' % \
+                  (str(extractor), dataset['matrices'][key].shape[1], time.time() - started)
+    return dataset
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return '%.4f' % (value,)
+    return unicode(value)
+
+
+def print_table(rows, stream=sys.stdout):
+    table = [COLUMNS] + [[format_value(row[key]) for key in COLUMNS] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in xrange(len(COLUMNS))]
+    for line in table:
+        stream.write('  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip() + '\n')
+
+
+def get_args_parser_experiments():
+    parser = argparse.ArgumentParser(description='Cross-validating a grid of classifier configurations')
+    parser.add_argument('--spec', type=str,
+                        required=True,
+                        help='YAML experiment spec (see experiments.yaml)')
+
+    parser.add_argument('--workers', type=int,
+                        required=False,
+                        help='Number of worker processes (overrides spec)')
+
+    parser.add_argument('--output', type=str,
+                        required=False,
+                        help='CSV results table path (overrides spec)')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser_experiments().parse_args()
+    with open(args.spec) as f:
+        spec = yaml.safe_load(f)
+
+    evaluation = spec.get('evaluation', {})
+    workers = args.workers or spec.get('workers', 1)
+    output = args.output or spec.get('output')
+    configurations = expand_grid(spec['grid'])
+
+    shared_state['datasets'] = {}
+    shared_state['configurations'] = []
+    for path in spec['datasets']:
+        shared_state['datasets'][path] = prepare_dataset(path, configurations, evaluation.get('folds', 10),
+                                                         evaluation.get('stratified', False),
+                                                         evaluation.get('seed', 0))
+        shared_state['configurations'] += [{'dataset': path, 'options': options} for options in configurations]
+
+    print 'Evaluating %i configurations with %i workers\n' % (len(shared_state['configurations']), workers)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        rows = pool.map(evaluate, xrange(len(shared_state['configurations'])), chunksize=1)
+        pool.close()
+    else:
+        rows = map(evaluate, xrange(len(shared_state['configurations'])))
+
+    print_table(rows)
+    if output:
+        with open(output, 'wb') as f:
+            writer = UnicodeWriter(f)
+            writer.writerow(COLUMNS)
+            writer.writerows([[format_value(row[key]) for key in COLUMNS] for row in rows])
+        print '\nResults saved to: %s' % (output,)
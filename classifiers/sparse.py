@@ -0,0 +1,148 @@
+import numpy as np
+from array import array
+
+
+def bincount(values, weights=None, length=0):
+    """np.bincount with exactly length bins (values must be smaller),
+    numpy < 1.14 rejects minlength 0 of empty matrices"""
+    return np.bincount(values, weights=weights, minlength=max(length, 1))[:length]
+
+
+class SparseRowMatrix(object):
+    """Compressed sparse row matrix of document feature vectors
+
+    Values of row i are stored in data[indptr[i]:indptr[i + 1]],
+    their column (feature) indices in indices[indptr[i]:indptr[i + 1]].
+    Memory usage is proportional to the number of nonzero values.
+    """
+
+    def __init__(self, data, indices, indptr, column_count):
+        self.data = np.asarray(data, dtype=np.float64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.shape = (len(self.indptr) - 1, column_count)
+        self.value_rows = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def nnz(self):
+        return len(self.data)
+
+    def row_lengths(self):
+        return np.diff(self.indptr)
+
+    def row_sums(self):
+        return bincount(self.row_indices(), weights=self.data, length=self.shape[0])
+
+    def row_indices(self):
+        """Row index of every stored value"""
+        if self.value_rows is None:
+            self.value_rows = np.repeat(np.arange(self.shape[0], dtype=np.int32), self.row_lengths())
+        return self.value_rows
+
+    def row(self, i):
+        """Returns row i as dense vector"""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        vector = np.zeros((self.shape[1],))
+        vector[self.indices[start:end]] = self.data[start:end]
+        return vector
+
+    def toarray(self):
+        result = np.zeros(self.shape)
+        result[self.row_indices(), self.indices] = self.data
+        return result
+
+    def dot(self, matrix):
+        """Matrix product with dense matrix of shape (column_count, k)
+        returns dense matrix of shape (row_count, k)"""
+        matrix = np.asarray(matrix)
+        if matrix.ndim == 1:
+            return self.dot(matrix[:, np.newaxis])[:, 0]
+
+        row_indices = self.row_indices()
+        result = np.zeros((self.shape[0], matrix.shape[1]))
+        for j in xrange(matrix.shape[1]):
+            products = self.data * matrix[self.indices, j]
+            result[:, j] = bincount(row_indices, weights=products, length=self.shape[0])
+        return result
+
+    def transpose_dot(self, matrix):
+        """Matrix product of transposed self with dense matrix of shape (row_count, k)
+        returns dense matrix of shape (column_count, k)"""
+        matrix = np.asarray(matrix)
+        if matrix.ndim == 1:
+            return self.transpose_dot(matrix[:, np.newaxis])[:, 0]
+
+        row_indices = self.row_indices()
+        result = np.zeros((self.shape[1], matrix.shape[1]))
+        for j in xrange(matrix.shape[1]):
+            products = self.data * matrix[row_indices, j]
+            result[:, j] = bincount(self.indices, weights=products, length=self.shape[1])
+        return result
+
+    def sum_by_label(self, labels, label_count, weights=None):
+        """Sums rows having equal labels
+
+        labels -- vector of row labels in range [0, label_count)
+        weights -- optional vector of row weights
+        returns dense matrix of shape (label_count, column_count)
+        """
+        row_labels = np.asarray(labels)[self.row_indices()]
+        values = self.data
+        if weights is not None:
+            values = values * np.asarray(weights)[self.row_indices()]
+
+        result = np.zeros((label_count, self.shape[1]))
+        for label in xrange(label_count):
+            mask = row_labels == label
+            result[label] = bincount(self.indices[mask], weights=values[mask], length=self.shape[1])
+        return result
+
+    def binarize(self):
+        """Returns matrix with every nonzero value replaced by 1"""
+        return SparseRowMatrix((self.data != 0).astype(np.float64), self.indices, self.indptr, self.shape[1])
+
+    def take_rows(self, rows):
+        """Returns matrix consisting of given rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.row_lengths()[rows]
+        indptr = np.zeros((len(rows) + 1,), dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        positions = np.repeat(self.indptr[rows] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return SparseRowMatrix(self.data[positions], self.indices[positions], indptr, self.shape[1])
+
+    def select_columns(self, columns):
+        """Returns matrix consisting of given columns (in given order)"""
+        column_map = np.empty((self.shape[1],), dtype=np.int64)
+        column_map.fill(-1)
+        column_map[np.asarray(columns, dtype=np.int64)] = np.arange(len(columns))
+
+        new_indices = column_map[self.indices]
+        kept = new_indices >= 0
+        indptr = np.zeros((self.shape[0] + 1,), dtype=np.int64)
+        np.cumsum(bincount(self.row_indices()[kept], length=self.shape[0]), out=indptr[1:])
+        return SparseRowMatrix(self.data[kept], new_indices[kept], indptr, len(columns))
+
+
+class SparseRowBuilder(object):
+    """Accumulates rows one by one and builds SparseRowMatrix"""
+
+    def __init__(self, column_count):
+        self.column_count = column_count
+        self.data = array('d')
+        self.indices = array('i')
+        self.indptr = array('l', [0])
+
+    def append(self, row):
+        """Appends row given as dict {column: value}"""
+        columns = sorted(row)
+        self.indices.extend(columns)
+        self.data.extend(row[column] for column in columns)
+        self.indptr.append(len(self.indices))
+
+    def build(self):
+        return SparseRowMatrix(np.array(self.data, dtype=np.float64),
+                               np.array(self.indices, dtype=np.int32),
+                               np.array(self.indptr, dtype=np.int64),
+                               self.column_count)
@@ -1,7 +1,17 @@
+import copy
+import itertools
+import multiprocessing
 import sys
 import os
 from random import shuffle
+
+import numpy as np
+
+from classifiers import instrumentation
 from classifiers.utils import read_labelled_set, save_classifier
+from classifiers.classifier import NaiveBayesClassifier
+from classifiers.preprocessors import CombinedPreprocessor
+from classifiers.feature_extractors import NgramExtractorBase, NgramExtractorHashing
 
 
 def measures(label, test_set, result_set):
@@ -32,38 +42,130 @@ def measures(label, test_set, result_set):
     return precision, recall, f1
 
 
-def cross_validation(classifier, input_set, classes, show_progress=True):
+def make_folds(labels, folds, stratified=False):
+    """Assigns each document to one of folds, sizes of folds differ at most by one
+    (no document is dropped); stratified folds keep class proportions
+    returns vector of fold indices
+    """
+    labels = np.asarray(labels)
+    assignment = np.zeros((len(labels),), dtype=np.int64)
+    if not stratified:
+        assignment[:] = np.arange(len(labels)) * folds // max(len(labels), 1)
+        return assignment
+
+    # documents of each class are dealt to folds in turn, continuing where previous class stopped
+    offset = 0
+    for Class in np.unique(labels):
+        positions = np.flatnonzero(labels == Class)
+        assignment[positions] = (offset + np.arange(len(positions))) % folds
+        offset += len(positions)
+    return assignment
+
+
+def average_measures(classes, test_labels, result_labels):
+    """Precision, recall and f1 averaged over classes"""
+    p_whole, r_whole, f1_whole = 0., 0., 0.
+    for Class in classes:
+        p, r, f1 = measures(Class, test_labels, result_labels)
+        p_whole += p
+        r_whole += r
+        f1_whole += f1
     class_count = len(classes)
-    tenth = len(input_set) / 10
+    return p_whole / class_count, r_whole / class_count, f1_whole / class_count
 
-    p_avg, r_avg, f1_avg = 0., 0., 0.
-    for i in xrange(10):
-        start, end = i * tenth, (i + 1) * tenth
-        train_set = input_set[:start] + input_set[end:]
-        test_set = input_set[start:end]
 
-        train_documents, train_labels = map(list, zip(*train_set))
-        classifier.learn(train_documents, train_labels)
+def supports_count_subtraction(classifier):
+    """Naive Bayes is only counts, so model of a fold is full model minus fold counts,
+    unless features are selected from the training set"""
+    return isinstance(classifier, NaiveBayesClassifier) and \
+           isinstance(classifier.feature_extractor, NgramExtractorBase)
 
-        test_documents, test_labels = map(list, zip(*test_set))
-        result_labels = classifier.classify_batch(test_documents, True)
 
-        p_whole, r_whole, f1_whole = 0., 0., 0.
-        for Class in classes:
-            p, r, f1 = measures(Class, test_labels, result_labels)
-            p_whole += p
-            r_whole += r
-            f1_whole += f1
+# state of cross-validation, shared with forked worker processes
+shared_state = {}
 
-        if show_progress:
-            print 'Results of iteration %i (average of all classes): %f (precision), %f (recall), %f (f1)' % \
-                  (i, p_whole / class_count, r_whole / class_count, f1_whole / class_count)
 
-        p_avg += p_whole / class_count
-        r_avg += r_whole / class_count
-        f1_avg += f1_whole / class_count
+def evaluate_fold(fold):
+    """Trains on all folds but fold, returns (p, r, f1) measured on fold"""
+    state = shared_state
+    test_rows = np.flatnonzero(state['assignment'] == fold)
+    test_labels = [state['labels'][i] for i in test_rows]
 
-    return p_avg / 10., r_avg / 10., f1_avg / 10.
+    if state['counts'] is not None:
+        classifier, feature_matrix, encoded_labels = state['classifier'], state['feature_matrix'], state['encoded_labels']
+        class_count = len(classifier.classes)
+        test_matrix = feature_matrix.take_rows(test_rows)
+        features_counts = state['counts'] - test_matrix.sum_by_label(encoded_labels[test_rows], class_count)
+        class_document_count = state['class_document_count'] - \
+                               np.bincount(encoded_labels[test_rows], minlength=class_count)
+
+        if not isinstance(classifier.feature_extractor, NgramExtractorHashing):
+            # vocabulary of retrained model would have only ngrams of training folds
+            seen = np.flatnonzero(np.sum(features_counts, axis=0))
+            features_counts, test_matrix = features_counts[:, seen], test_matrix.select_columns(seen)
+
+        classifier.learn_counts(features_counts, class_document_count)
+        result_labels = [classifier.classes[c] for c in np.argmax(classifier.timed_class_scores(test_matrix), axis=1)]
+    else:
+        classifier = copy.deepcopy(state['classifier'])
+        train_rows = np.flatnonzero(state['assignment'] != fold)
+        classifier.learn([state['documents'][i] for i in train_rows], [state['labels'][i] for i in train_rows])
+        result_labels = classifier.classify_batch([state['documents'][i] for i in test_rows], True)
+
+    return average_measures(state['classes'], test_labels, result_labels)
+
+
+def cross_validation(classifier, input_set, classes, show_progress=True, folds=10, workers=1, stratified=False):
+    """k-fold cross-validation, returns precision, recall and f1 averaged over folds
+
+    Documents are preprocessed once; Naive Bayes without feature selection
+    is learned once and models of folds are derived by subtracting fold counts.
+    workers -- number of processes evaluating folds in parallel
+    """
+    documents, labels = map(list, zip(*input_set))
+    preprocessor = classifier.preprocessor
+    documents = map(preprocessor.preprocess, documents)
+
+    # folds get already preprocessed documents; feature extractor and classes are learned
+    # below, so they are copied, preprocessor is shared rather than copied
+    classifier = copy.deepcopy(classifier, {id(preprocessor): preprocessor})
+    classifier.preprocessor = CombinedPreprocessor([])
+
+    shared_state.clear()
+    shared_state.update({'documents': documents, 'labels': labels, 'classes': list(classes),
+                         'assignment': make_folds(labels, folds, stratified),
+                         'classifier': classifier, 'counts': None})
+    if supports_count_subtraction(classifier):
+        encoded_labels = classifier.get_encoded_labels(labels)
+        classifier.feature_extractor.learn(documents, encoded_labels)
+        with instrumentation.timer('extract'):
+            feature_matrix = classifier.feature_extractor.extract_batch(documents)
+        shared_state.update({'feature_matrix': feature_matrix, 'encoded_labels': encoded_labels,
+                             'counts': feature_matrix.sum_by_label(encoded_labels, len(classifier.classes)),
+                             'class_document_count': np.bincount(encoded_labels).astype(np.float64)})
+
+    if workers > 1:
+        pool = multiprocessing.Pool(min(workers, folds))
+        results = pool.imap(evaluate_fold, xrange(folds))
+    else:
+        pool = None
+        results = itertools.imap(evaluate_fold, xrange(folds))
+
+    p_avg, r_avg, f1_avg = 0., 0., 0.
+    try:
+        for i, (p, r, f1) in enumerate(results):
+            if show_progress:
+                print 'Results of iteration %i (average of all classes): %f (precision), %f (recall), %f (f1)' % \
+                      (i, p, r, f1)
+            p_avg += p
+            r_avg += r
+            f1_avg += f1
+    finally:
+        if pool is not None:
+            pool.terminate()
+        shared_state.clear()
+
+    return p_avg / folds, r_avg / folds, f1_avg / folds
 
 
 if __name__ == '__main__':
@@ -75,9 +177,21 @@ if __name__ == '__main__':
 
     def main():
         parser = get_args_parser()
+        parser.add_argument('--folds', type=int,
+                            default=10,
+                            help='Number of cross-validation folds')
+
+        parser.add_argument('--workers', type=int,
+                            default=1,
+                            help='Number of processes evaluating folds in parallel')
+
+        parser.add_argument('--stratified', action='store_true',
+                            help='Keep class proportions in every fold')
 
         args = parser.parse_args()
         classifier = build_classifier_from_args(args)
+        if args.stats:
+            instrumentation.enable()
 
         docs, labels = read_labelled_set(args.input)
         input_set = zip(docs, labels)
@@ -85,11 +199,14 @@ if __name__ == '__main__':
         classes = set(labels)
 
         print 'Testing dataset: %s' % (args.input,)
-        print 'Test method: 10-fold cross-validation\n'
+        print 'Test method: %i-fold%s cross-validation\n' % (args.folds, ' stratified' if args.stratified else '')
         print 'Classifier: %s' % (str(classifier), )
 
-        p, r, f1 = cross_validation(classifier, input_set, classes)
-        print 'After 10-fold-average'
+        p, r, f1 = cross_validation(classifier, input_set, classes, folds=args.folds, workers=args.workers,
+                                    stratified=args.stratified)
+        print 'After %i-fold-average' % (args.folds,)
         print 'Precision: %f, Recall: %f, F1: %f\n' % (p, r, f1)
+        if args.stats:
+            print instrumentation.format_stats()
 
     main()
\ No newline at end of file
@@ -0,0 +1,665 @@
+import copy
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unicodedata
+import unittest
+from StringIO import StringIO
+
+import numpy as np
+
+from classifiers import run_experiments, test_classifier
+from classifiers.caching import LRUCache, cached_map
+from classifiers.classifier import BaseClassifier, HierarchicalClassifier, NaiveBayesClassifier
+from classifiers.feature_extractors import NgramExtractorCount, NgramExtractorHashingBoolean, NgramExtractorHashingCount
+from classifiers.feature_selectors import FeatureStatistics, MutualInformationFeatureSelector, DeltaIdfFeatureSelector, \
+    ChiSquareFeatureSelector, InformationGainFeatureSelector
+from classifiers.model_format import convert, is_model_directory, load_model, save_model
+from classifiers.optimizers import LBFGSOptimizer, SoftmaxObjective, minimize
+from classifiers.preprocessors import CombinedPreprocessor, build_combined_preprocessor, punctuation_table
+from classifiers.run_experiments import build_classifier, expand_grid, prepare_dataset
+from classifiers.sparse import SparseRowBuilder
+from classifiers.test_classifier import cross_validation, make_folds
+from classifiers.unicode_tables import category_ranges, generate_ranges, read_ranges, write_ranges
+from classifiers.utils import UnicodeWriter, iter_labelled_chunks, load_classifier, save_classifier
+
+
+def build_matrix(rows, column_count):
+    builder = SparseRowBuilder(column_count)
+    for row in rows:
+        builder.append(row)
+    return builder.build()
+
+
+class SparseRowMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.matrix = build_matrix([{0: 1., 2: 2.}, {}, {1: 3.}], 3)
+
+    def test_products(self):
+        dense = self.matrix.toarray()
+        weights = np.arange(6.).reshape((3, 2))
+        self.assertTrue(np.allclose(self.matrix.dot(weights), dense.dot(weights)))
+        self.assertTrue(np.allclose(self.matrix.transpose_dot(weights), dense.T.dot(weights)))
+        self.assertTrue(np.allclose(self.matrix.row_sums(), dense.sum(axis=1)))
+        self.assertTrue(np.allclose(self.matrix.sum_by_label([1, 0, 1], 2),
+                                    [dense[1], dense[0] + dense[2]]))
+
+    def test_rows_and_columns(self):
+        self.assertTrue(np.allclose(self.matrix.take_rows([2, 0]).toarray(), self.matrix.toarray()[[2, 0]]))
+        self.assertTrue(np.allclose(self.matrix.select_columns([2, 1]).toarray(), self.matrix.toarray()[:, [2, 1]]))
+
+    def test_empty_batch(self):
+        matrix = build_matrix([], 3)
+        self.assertEqual(matrix.dot(np.ones((3, 2))).shape, (0, 2))
+        self.assertEqual(matrix.row_sums().shape, (0,))
+        self.assertEqual(matrix.select_columns([0, 1]).shape, (0, 2))
+        self.assertEqual(matrix.sum_by_label([], 2).shape, (2, 3))
+        self.assertEqual(matrix.select_columns([]).row_sums().shape, (0,))
+
+        classifier = NaiveBayesClassifier(CombinedPreprocessor([]), NgramExtractorCount([1]))
+        classifier.learn([u'good day', u'bad day'], [u'positive', u'negative'])
+        self.assertEqual(classifier.classify_batch([]), [])
+        self.assertEqual(classifier.predict_proba_batch([]).shape, (0, 2))
+
+
+class QuadraticObjective(object):
+    """Loss sum((params - 1)^2), its gradient points uphill if wrong_gradient"""
+
+    def __init__(self, wrong_gradient=False):
+        self.sign = -1. if wrong_gradient else 1.
+
+    def loss_and_gradient(self, params):
+        return np.sum((params - 1.) ** 2), self.sign * 2. * (params - 1.)
+
+
+class OptimizerTest(unittest.TestCase):
+    def test_lbfgs_minimizes(self):
+        params, history = minimize(QuadraticObjective(), np.zeros((3,)), LBFGSOptimizer(), epsilon=1e-8)
+        self.assertTrue(np.allclose(params, 1., atol=1e-4))
+
+    def test_loss_never_increases(self):
+        matrix = build_matrix([{0: 1.}, {1: 1.}, {0: 1., 1: 1.}, {2: 2.}], 3)
+        objective = SoftmaxObjective(matrix, [0, 1, 0, 1], 2, l2=1e-3)
+        params, history = minimize(objective, objective.initial_params(), LBFGSOptimizer(), num_iter=50)
+        losses = [record['loss'] for record in history]
+        self.assertTrue(all(b <= a for a, b in zip(losses, losses[1:])), losses)
+
+    def test_failed_line_search_keeps_params(self):
+        objective = QuadraticObjective(wrong_gradient=True)
+        params, history = minimize(objective, np.zeros((3,)), LBFGSOptimizer(max_line_search=5))
+        self.assertEqual(history, [])
+        self.assertTrue(np.allclose(params, 0.))
+
+
+def make_documents(count, vocabulary_size, seed):
+    """Random documents of words w0, w1, ... labelled by their first word"""
+    random = np.random.RandomState(seed)
+    documents = [u' '.join(u'w%i' % (word,) for word in random.randint(vocabulary_size, size=6))
+                 for i in xrange(count)]
+    labels = [[u'positive', u'negative', u'neutral'][int(document.split()[0][1:]) % 3] for document in documents]
+    return documents, labels
+
+
+def naive_bayes():
+    return NaiveBayesClassifier(CombinedPreprocessor([]), NgramExtractorCount([1, 2]))
+
+
+class NaiveBayesUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        documents, labels = make_documents(300, 50, seed=1)
+        # neutral class and words beyond w50 are first seen in updates
+        self.train = [(document, label) for document, label in zip(documents, labels) if label != u'neutral']
+        self.updates = [zip(*make_documents(50, 50 + 100 * i, seed=2 + i)) for i in xrange(4)]
+        self.test_documents = make_documents(100, 500, seed=10)[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def learned(self, rows):
+        classifier = naive_bayes()
+        classifier.learn(*map(list, zip(*rows)))
+        return classifier
+
+    def assertSameModel(self, first, second):
+        self.assertEqual(first.classes, second.classes)
+        self.assertTrue(np.allclose(first.predict_log_proba_batch(self.test_documents),
+                                    second.predict_log_proba_batch(self.test_documents)))
+
+    def test_updates_equal_retraining(self):
+        classifier = self.learned(self.train)
+        for update in self.updates:
+            classifier.update(*map(list, zip(*update)))
+        retrained = self.learned(self.train + sum(self.updates, []))
+        self.assertSameModel(classifier, retrained)
+        self.assertEqual(classifier.classify_batch(self.test_documents), retrained.classify_batch(self.test_documents))
+
+    def test_saved_update_is_applied_to_copy(self):
+        classifier = self.learned(self.train)
+        copied = copy.deepcopy(classifier)
+        classifier.start_update()
+        for update in self.updates:
+            classifier.update(*map(list, zip(*update)))
+        path = os.path.join(self.directory, 'update.pkl')
+        classifier.save_update(path)
+
+        copied.apply_update(path)
+        self.assertSameModel(classifier, copied)
+        self.assertTrue(np.array_equal(classifier.features_counts, copied.features_counts))
+
+    def test_update_of_different_model_is_rejected(self):
+        classifier = self.learned(self.train)
+        other = self.learned(self.train[:100])
+        classifier.start_update()
+        classifier.update(*map(list, zip(*self.updates[0])))
+        path = os.path.join(self.directory, 'update.pkl')
+        classifier.save_update(path)
+        self.assertRaises(ValueError, other.apply_update, path)
+
+        # the update is applied once
+        copied = self.learned(self.train)
+        copied.apply_update(path)
+        self.assertRaises(ValueError, copied.apply_update, path)
+
+    def test_empty_update(self):
+        classifier = self.learned(self.train)
+        copied = copy.deepcopy(classifier)
+        classifier.start_update()
+        path = os.path.join(self.directory, 'update.pkl')
+        classifier.save_update(path)
+        copied.apply_update(path)
+        self.assertSameModel(classifier, copied)
+
+    def test_pickled_updated_model(self):
+        classifier = self.learned(self.train)
+        classifier.update(*map(list, zip(*self.updates[0])))
+        unpickled = pickle.loads(pickle.dumps(classifier, pickle.HIGHEST_PROTOCOL))
+        self.assertFalse('count_buffer' in unpickled.__dict__)
+        self.assertSameModel(classifier, unpickled)
+
+        for update in self.updates[1:]:
+            classifier.update(*map(list, zip(*update)))
+            unpickled.update(*map(list, zip(*update)))
+        self.assertSameModel(classifier, unpickled)
+
+
+class ModelFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.umask = os.umask(022)
+        documents, labels = make_documents(300, 500, seed=1)
+        self.classifier = naive_bayes()
+        self.classifier.learn(documents, labels)
+        self.test_documents = make_documents(100, 600, seed=2)[0]
+        self.expected = self.classifier.predict_log_proba_batch(self.test_documents)
+
+    def tearDown(self):
+        os.umask(self.umask)
+        shutil.rmtree(self.directory)
+
+    def assertSamePredictions(self, classifier):
+        self.assertTrue(np.allclose(classifier.predict_log_proba_batch(self.test_documents), self.expected))
+
+    def test_round_trip(self):
+        path = os.path.join(self.directory, 'classifier.model')
+        save_model(path, self.classifier)
+        self.assertTrue(is_model_directory(path))
+        self.assertEqual(os.stat(path).st_mode & 0777, 0755)
+        self.assertEqual(os.listdir(self.directory), ['classifier.model'])
+        self.assertTrue(any(name.startswith('array_') for name in os.listdir(path)))
+        for mmap_mode in ('r', 'c', None):
+            self.assertSamePredictions(load_model(path, mmap_mode))
+
+        # models loaded into memory can be updated
+        loaded = load_model(path, None)
+        loaded.update([u'w1 w700'], [u'positive'])
+
+    def test_existing_model_is_replaced(self):
+        path = os.path.join(self.directory, 'classifier.model')
+        other = naive_bayes()
+        other.learn([u'w1 w2', u'w3'], [u'positive', u'negative'])
+        save_model(path, other)
+        save_model(path, self.classifier)
+        self.assertSamePredictions(load_model(path))
+        self.assertEqual(os.listdir(self.directory), ['classifier.model'])
+
+    def test_pickle_is_converted(self):
+        pickle_path = os.path.join(self.directory, 'classifier.obj')
+        save_classifier(pickle_path, self.classifier)
+        self.assertEqual(os.stat(pickle_path).st_mode & 0777, 0644)
+        self.assertSamePredictions(load_classifier(pickle_path))
+
+        model_path = convert(pickle_path)
+        self.assertEqual(model_path, os.path.join(self.directory, 'classifier.model'))
+        self.assertSamePredictions(load_classifier(model_path))
+
+
+class ConstantClassifier(BaseClassifier):
+    """Maps documents to labels by dictionary, unknown documents keep their text as label"""
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def classify_one(self, document, original_class=True):
+        return self.labels.get(document, document)
+
+    def classify_batch(self, text_set, original_class=True):
+        return [self.classify_one(document) for document in text_set]
+
+
+class ScoringTest(unittest.TestCase):
+    def test_batch_scores_equal_single_documents(self):
+        documents, labels = make_documents(200, 100, seed=1)
+        classifier = naive_bayes()
+        classifier.learn(documents, labels)
+        test_documents = make_documents(20, 120, seed=2)[0]
+
+        probabilities = classifier.predict_proba_batch(test_documents)
+        self.assertTrue(np.allclose(np.sum(probabilities, axis=1), 1.))
+        for document, document_probabilities in zip(test_documents, probabilities):
+            self.assertTrue(np.allclose(classifier.predict_proba(document), document_probabilities))
+        self.assertEqual(classifier.classify_batch(test_documents),
+                         [classifier.classify_one(document) for document in test_documents])
+
+    def test_naive_bayes_scores_equal_likelihood_formula(self):
+        documents, labels = make_documents(100, 30, seed=3)
+        classifier = naive_bayes()
+        classifier.alpha = 0.5
+        classifier.learn(documents, labels)
+        matrix = classifier.extract_features(make_documents(10, 40, seed=4)[0])
+
+        counts = classifier.features_counts
+        seen = np.count_nonzero(np.sum(counts, axis=0))
+        likelihood = (counts + 0.5) / (np.sum(counts, axis=1)[:, np.newaxis] + seen * 0.5)
+        expected = matrix.toarray().dot(np.log(likelihood).T) + np.log(classifier.class_probability)
+        self.assertTrue(np.allclose(classifier.class_scores(matrix), expected))
+
+    def test_naive_bayes_pickled_with_likelihoods(self):
+        documents, labels = make_documents(100, 30, seed=5)
+        classifier = naive_bayes()
+        classifier.learn(documents, labels)
+        expected = classifier.predict_log_proba_batch(documents)
+
+        # tables of models pickled before numerators and denominators were split
+        state = classifier.__getstate__()
+        state['log_likelihood'] = state.pop('log_numerator') - state.pop('log_denominator')[:, np.newaxis]
+        legacy = NaiveBayesClassifier.__new__(NaiveBayesClassifier)
+        legacy.__setstate__(state)
+        self.assertTrue(np.allclose(legacy.predict_log_proba_batch(documents), expected))
+
+    def test_hierarchical_batch_equals_single_documents(self):
+        # document refined to label of later pipeline is not refined again
+        classifier = HierarchicalClassifier(ConstantClassifier({u'x': u'a', u'y': u'b'}),
+                                            [(u'a', ConstantClassifier({u'x': u'b'})),
+                                             (u'b', ConstantClassifier({u'x': u'c', u'y': u'd'}))])
+        documents = [u'x', u'y', u'z']
+        self.assertEqual(classifier.classify_batch(documents), [u'b', u'd', u'z'])
+        self.assertEqual(classifier.classify_batch(documents),
+                         [classifier.classify_one(document) for document in documents])
+
+
+class HashingExtractorTest(unittest.TestCase):
+    def test_ngrams_are_hashed_to_fixed_features(self):
+        extractor = NgramExtractorHashingCount([1, 2], bits=4)
+        extractor.learn([u'never seen'], [0])
+        matrix = extractor.extract_batch([u'good good day', u''])
+        self.assertEqual(matrix.shape, (2, 16))
+        self.assertEqual(sum(matrix.row_sums()), 5.)
+
+        boolean = NgramExtractorHashingBoolean([1], bits=4)
+        self.assertEqual(sum(boolean.extract_row(u'good good').values()), 1.)
+
+    def test_signed_values_cancel(self):
+        extractor = NgramExtractorHashingCount([1], bits=1, signed=True)
+        row = extractor.extract_row(u' '.join(u'w%i' % (i,) for i in xrange(100)))
+        self.assertTrue(sum(abs(value) for value in row.values()) < 100)
+
+    def test_restricted_features(self):
+        extractor = NgramExtractorHashingCount([1], bits=8)
+        index = extractor.hash_ngram(u'good')[0]
+        extractor.restrict_features([index])
+        self.assertEqual(extractor.features_count(), 1)
+        self.assertEqual(dict(extractor.extract_row(u'good bad')), {0: 1.})
+
+    def test_naive_bayes_needs_unsigned_counts(self):
+        classifier = NaiveBayesClassifier(CombinedPreprocessor([]), NgramExtractorHashingCount([1], bits=8))
+        classifier.learn([u'good day', u'nice fun', u'bad day', u'awful sad'] * 5,
+                         [u'pos', u'pos', u'neg', u'neg'] * 5)
+        self.assertEqual(classifier.classify_batch([u'bad day', u'good fun']), [u'neg', u'pos'])
+
+        signed = NgramExtractorHashingCount([1], bits=8, signed=True)
+        self.assertRaises(ValueError, NaiveBayesClassifier, CombinedPreprocessor([]), signed)
+        self.assertRaises(ValueError, ChiSquareFeatureSelector, signed, 10)
+
+
+def make_polar_documents(count, seed):
+    """Documents containing 'good' are positive and 'bad' negative, other words are noise"""
+    random = np.random.RandomState(seed)
+    documents, labels = [], []
+    for i in xrange(count):
+        label = random.randint(2)
+        words = [u'noise%i' % (word,) for word in random.randint(30, size=4)] + [[u'bad', u'good'][label]]
+        random.shuffle(words)
+        documents.append(u' '.join(words))
+        labels.append([u'negative', u'positive'][label])
+    return documents, labels
+
+
+class FeatureSelectionTest(unittest.TestCase):
+    def test_statistics(self):
+        matrix = build_matrix([{0: 2.}, {0: 1., 1: 1.}, {2: 3.}], 3)
+        statistics = FeatureStatistics(matrix, [0, 1, 1], 2)
+        self.assertTrue(np.array_equal(statistics.class_feature_counts, [[2., 0., 0.], [1., 1., 3.]]))
+        self.assertTrue(np.array_equal(statistics.class_document_frequency, [[1., 0., 0.], [1., 1., 1.]]))
+        self.assertTrue(np.array_equal(statistics.class_document_count, [1., 2.]))
+        self.assertEqual(statistics.document_count(), 3.)
+
+    def test_informative_features_are_selected(self):
+        documents, labels = make_polar_documents(200, seed=1)
+        encoded = [[u'negative', u'positive'].index(label) for label in labels]
+        for selector_class in (MutualInformationFeatureSelector, DeltaIdfFeatureSelector,
+                               ChiSquareFeatureSelector, InformationGainFeatureSelector):
+            # per class selectors may pick the same features for both classes
+            selector = selector_class(NgramExtractorCount([1]), 4)
+            selector.learn(documents, encoded)
+            selected = set(selector.get_feature_name(i) for i in xrange(selector.features_count()))
+            self.assertTrue(set([u'bad', u'good']) <= selected, selector_class.__name__)
+            self.assertLessEqual(len(selected), 4)
+
+
+class RestrictFeaturesTest(unittest.TestCase):
+    def test_restricted_extraction_selects_columns(self):
+        documents, labels = make_polar_documents(20, seed=2)
+        for make_extractor in (lambda: NgramExtractorCount([1, 2]), lambda: NgramExtractorHashingCount([1, 2], bits=6)):
+            extractor = make_extractor()
+            extractor.learn(documents, labels)
+            full = extractor.extract_batch(documents).toarray()
+            names = [extractor.get_feature_name(i) for i in xrange(extractor.features_count())]
+            features = [5, 1, 3]
+            extractor.restrict_features(features)
+            self.assertEqual(extractor.features_count(), 3)
+            self.assertEqual([extractor.get_feature_name(i) for i in xrange(3)], [names[i] for i in features])
+            self.assertTrue(np.array_equal(extractor.extract_batch(documents).toarray(), full[:, features]))
+            self.assertTrue(np.array_equal(extractor.extract(documents[0]), full[0, features]))
+
+            # restricting again composes with the first restriction
+            extractor.restrict_features([2, 0])
+            self.assertTrue(np.array_equal(extractor.extract_batch(documents).toarray(), full[:, [3, 5]]))
+
+            extractor.learn(documents, labels)
+            self.assertEqual(extractor.features_count(), len(names))
+
+    def test_selector_pickled_before_restriction(self):
+        documents, labels = make_polar_documents(50, seed=3)
+        encoded = [[u'negative', u'positive'].index(label) for label in labels]
+        selector = ChiSquareFeatureSelector(NgramExtractorCount([1]), 4)
+        selector.learn(documents, encoded)
+
+        legacy = ChiSquareFeatureSelector(NgramExtractorCount([1]), 4)
+        legacy.feature_extractor.learn(documents, encoded)
+        statistics = FeatureStatistics(legacy.feature_extractor.extract_batch(documents), encoded, 2)
+        legacy.best_features = legacy.select_features(statistics)
+        loaded = pickle.loads(pickle.dumps(legacy))
+
+        self.assertFalse(hasattr(loaded, 'best_features'))
+        self.assertEqual(loaded.features_count(), selector.features_count())
+        self.assertTrue(np.array_equal(loaded.extract_batch(documents).toarray(),
+                                       selector.extract_batch(documents).toarray()))
+
+    def test_classifier_with_selector(self):
+        documents, labels = make_polar_documents(200, seed=4)
+        classifier = NaiveBayesClassifier(CombinedPreprocessor([]),
+                                          InformationGainFeatureSelector(NgramExtractorCount([1]), 2))
+        classifier.learn(documents, labels)
+        self.assertEqual(classifier.feature_extractor.features_count(), 2)
+        self.assertEqual(classifier.classify_batch([u'good noise1', u'noise2 bad']), [u'positive', u'negative'])
+
+
+class CompiledPreprocessorTest(unittest.TestCase):
+    texts = [u'', u' ', u'plain text', u'  Leading and trailing  ', u'tabs\tand\nnew\r\nlines',
+             u'Soooo goooood!!! :) :-D', u'so bad :( :\'( =[', u'(: reversed ):', u'8) xD ;)',
+             u'see http://example.com/path?q=1 and www.example.org.', u'mail me at a.b@example.com',
+             u'@user_1 @other: hi', u'#hashtag #multi-word_tag# ##double', u'snake_case_word __init__',
+             u'dots... commas,,, dashes -- and \u2014 em dash \u00abquoted\u00bb \u201cquotes\u201d',
+             u'mixed ,\t. \u3000ideographic\u00a0nbsp', u'!!!', u'. . .', u' ,', u', ', u'a ,b, c',
+             u'\u00bfQu\u00e9 tal?', u'AAAAaaaa', u'\u0639\u0631\u0628\u064a\u060c \u0646\u0635']
+
+    def test_same_output_as_chain(self):
+        random = np.random.RandomState(5)
+        alphabet = list(u'ab_ #@:;()/.,!?-\'\t\n\u00a0\u2014xD')
+        texts = self.texts + [u''.join(random.choice(alphabet, size=random.randint(1, 30)))
+                              for i in xrange(500)]
+
+        combined = build_combined_preprocessor(compiled=False)
+        compiled = build_combined_preprocessor(compiled=True)
+        for text in texts:
+            self.assertEqual(compiled.preprocess(text), combined.preprocess(text), repr(text))
+
+    def test_each_preprocessor_compiles_to_same_output(self):
+        for preprocessor in build_combined_preprocessor(compiled=False).preprocessors:
+            compiled = preprocessor.compile()
+            for text in self.texts:
+                self.assertEqual(compiled(text), preprocessor.preprocess(text),
+                                 '%s %r' % (type(preprocessor).__name__, text))
+
+    def test_pickle(self):
+        compiled = build_combined_preprocessor(compiled=True)
+        loaded = pickle.loads(pickle.dumps(compiled))
+        for text in self.texts:
+            self.assertEqual(loaded.preprocess(text), compiled.preprocess(text))
+
+
+class UnicodeTablesTest(unittest.TestCase):
+    def test_shipped_ranges_match_unicode_database(self):
+        self.assertEqual(category_ranges('P'), generate_ranges('P'))
+
+    def test_ranges_round_trip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'tables', 'P.txt')
+            write_ranges(path, [[33, 35], [95, 95]])
+            self.assertEqual(read_ranges(path), [[33, 35], [95, 95]])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_punctuation_table(self):
+        table = punctuation_table()
+        punctuation = set(code for code in xrange(sys.maxunicode)
+                          if unicodedata.category(unichr(code)).startswith('P')) - set([ord(u'_')])
+        self.assertEqual(set(table), punctuation)
+        self.assertTrue(all(value is None for value in table.itervalues()))
+
+
+class CachingTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LRUCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(sorted(cache.items), ['a', 'c'])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 1, 1))
+
+    def test_memory_limit(self):
+        cache = LRUCache(max_size=None, max_memory=10, sizeof=lambda key, value: value)
+        cache.put('a', 4)
+        cache.put('b', 4)
+        cache.put('c', 4)
+        self.assertEqual(sorted(cache.items), ['b', 'c'])
+        self.assertEqual(cache.memory, 8)
+        cache.put('b', 20)
+        self.assertEqual(sorted(cache.items), ['c'])
+        self.assertEqual(cache.memory, 4)
+
+    def test_cached_map(self):
+        calls = []
+        function = lambda key: calls.append(key) or key.upper()
+        cache = LRUCache()
+        self.assertEqual(cached_map(cache, function, ['a', 'b', 'a', 'a']), ['A', 'B', 'A', 'A'])
+        self.assertEqual(calls, ['a', 'b'])
+
+    def test_pickled_empty(self):
+        cache = LRUCache(5, 100)
+        cache.put('a', 1)
+        loaded = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(loaded), 0)
+        self.assertEqual((loaded.max_size, loaded.max_memory), (5, 100))
+
+    def test_cached_classifier(self):
+        documents, labels = make_documents(60, 20, seed=6)
+        classifier = naive_bayes()
+        classifier.learn(documents, labels)
+        texts = documents[:10] * 3
+        expected = classifier.predict_proba_batch(texts)
+
+        classifier.enable_cache(max_size=100)
+        self.assertTrue(np.allclose(classifier.predict_proba_batch(texts), expected))
+        self.assertEqual(classifier.classify_batch(texts), classifier.classify_batch(texts))
+        self.assertGreater(classifier.cache_stats()['hits'], 0)
+
+        # learning changes vocabulary, cached rows must not be reused
+        relearned = naive_bayes()
+        relearned.learn(documents[30:], labels[30:])
+        classifier.learn(documents[30:], labels[30:])
+        self.assertTrue(np.allclose(classifier.predict_proba_batch(texts), relearned.predict_proba_batch(texts)))
+
+
+class PartialFitTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.documents, self.labels = make_documents(95, 80, seed=7)
+        self.path = os.path.join(self.directory, 'train.csv')
+        with open(self.path, 'wb') as f:
+            writer = UnicodeWriter(f)
+            for i, (document, label) in enumerate(zip(self.documents, self.labels)):
+                writer.writerow([unicode(i), document, label])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_chunks_are_read_lazily(self):
+        chunks = list(iter_labelled_chunks(self.path, 20))
+        self.assertEqual([len(documents) for documents, labels in chunks], [20, 20, 20, 20, 15])
+        self.assertEqual(sum((documents for documents, labels in chunks), []), self.documents)
+        self.assertEqual(sum((labels for documents, labels in chunks), []), self.labels)
+
+    def test_streamed_training_equals_learn(self):
+        for make_extractor in (lambda: NgramExtractorCount([1, 2]), lambda: NgramExtractorHashingCount([1, 2], bits=8)):
+            learned = NaiveBayesClassifier(CombinedPreprocessor([]), make_extractor())
+            learned.learn(self.documents, self.labels)
+            streamed = NaiveBayesClassifier(CombinedPreprocessor([]), make_extractor())
+            for documents, labels in iter_labelled_chunks(self.path, 20):
+                streamed.partial_fit(documents, labels)
+
+            self.assertEqual(streamed.classes, learned.classes)
+            test_documents = make_documents(50, 100, seed=8)[0]
+            self.assertTrue(np.allclose(streamed.predict_log_proba_batch(test_documents),
+                                        learned.predict_log_proba_batch(test_documents)))
+
+    def test_partial_fit_keeps_feature_indices(self):
+        extractor = NgramExtractorCount([1])
+        extractor.partial_fit([u'a b'], [u'positive'])
+        extractor.partial_fit([u'c a'], [u'negative'])
+        self.assertEqual([extractor.get_feature_name(i) for i in xrange(3)], [u'a', u'b', u'c'])
+
+    def test_selectors_reject_partial_fit(self):
+        selector = ChiSquareFeatureSelector(NgramExtractorCount([1]), 10)
+        self.assertRaises(NotImplementedError, selector.partial_fit, self.documents, self.labels)
+
+
+class CrossValidationTest(unittest.TestCase):
+    def setUp(self):
+        documents, labels = make_documents(120, 40, seed=9)
+        self.input_set = zip(documents, labels)
+        self.classes = set(labels)
+
+    def cross_validation(self, classifier, **kwargs):
+        return cross_validation(classifier, self.input_set, self.classes, show_progress=False, folds=4, **kwargs)
+
+    def test_folds(self):
+        labels = [u'a'] * 7 + [u'b'] * 5
+        for stratified in (False, True):
+            assignment = make_folds(labels, 5, stratified)
+            sizes = np.bincount(assignment, minlength=5)
+            self.assertEqual(sum(sizes), len(labels))
+            self.assertLessEqual(max(sizes) - min(sizes), 1)
+        stratified = make_folds(labels, 2, True)
+        self.assertEqual(list(np.bincount(stratified[:7])), [4, 3])
+        self.assertEqual(list(np.bincount(stratified[7:])), [2, 3])
+
+    def test_count_subtraction_equals_retraining(self):
+        for make_extractor in (lambda: NgramExtractorCount([1, 2]), lambda: NgramExtractorHashingCount([1], bits=6)):
+            make_classifier = lambda: NaiveBayesClassifier(CombinedPreprocessor([]), make_extractor())
+            subtracted = self.cross_validation(make_classifier())
+            original = test_classifier.supports_count_subtraction
+            test_classifier.supports_count_subtraction = lambda classifier: False
+            try:
+                retrained = self.cross_validation(make_classifier())
+            finally:
+                test_classifier.supports_count_subtraction = original
+            self.assertTrue(np.allclose(subtracted, retrained), (subtracted, retrained))
+
+    def test_parallel_folds(self):
+        classifier = naive_bayes()
+        self.assertTrue(np.allclose(self.cross_validation(classifier, workers=2), self.cross_validation(classifier)))
+
+    def test_classifier_is_not_modified(self):
+        classifier = naive_bayes()
+        documents, labels = map(list, zip(*self.input_set))
+        classifier.learn(documents[:30], labels[:30])
+        features_count = classifier.feature_extractor.features_count()
+        expected = classifier.predict_log_proba_batch(documents)
+
+        self.cross_validation(classifier)
+        self.assertEqual(classifier.feature_extractor.features_count(), features_count)
+        self.assertTrue(np.allclose(classifier.predict_log_proba_batch(documents), expected))
+
+
+class ExperimentGridTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dataset.csv')
+        with open(self.path, 'wb') as f:
+            writer = UnicodeWriter(f)
+            for i, (document, label) in enumerate(zip(*make_documents(120, 40, seed=11))):
+                writer.writerow([unicode(i), document, label])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        run_experiments.shared_state.clear()
+
+    def test_expand_grid(self):
+        configurations = expand_grid([{'algorithm': 'NaiveBayes', 'ngrams': ['Unigrams', 'Both'], 'top': 10},
+                                      {'algorithm': 'Dictionary', 'ngrams': 'Unigrams'}])
+        self.assertEqual(configurations, [{'algorithm': 'NaiveBayes', 'ngrams': 'Unigrams', 'top': 10},
+                                          {'algorithm': 'NaiveBayes', 'ngrams': 'Both', 'top': 10},
+                                          {'algorithm': 'Dictionary', 'ngrams': 'Unigrams'}])
+
+    def test_shared_matrices_match_cross_validation(self):
+        configurations = expand_grid([{'algorithm': 'NaiveBayes', 'ngrams': ['Unigrams', 'Both'],
+                                       'metric': ['Count', 'Boolean']},
+                                      {'algorithm': 'NaiveBayes', 'ngrams': 'Unigrams', 'hashing_bits': 5}])
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            dataset = prepare_dataset(self.path, configurations, 4, False, 0)
+        finally:
+            sys.stdout = stdout
+        run_experiments.shared_state.update({'datasets': {self.path: dataset},
+                                             'configurations': [{'dataset': self.path, 'options': options}
+                                                                for options in configurations]})
+
+        input_set = zip(dataset['documents'], dataset['labels'])
+        for i, options in enumerate(configurations):
+            row = run_experiments.evaluate(i)
+            expected = cross_validation(build_classifier(options, self.path), input_set, dataset['classes'],
+                                        show_progress=False, folds=4)
+            self.assertTrue(np.allclose([row['precision'], row['recall'], row['f1']], expected), options)
+
+
+if __name__ == '__main__':
+    unittest.main()
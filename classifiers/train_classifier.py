@@ -1,10 +1,14 @@
 import argparse
 
-from classifiers.utils import save_classifier, read_labelled_set
+from classifiers import instrumentation
+
+from classifiers.utils import save_classifier, read_labelled_set, iter_labelled_chunks
 from classifiers.preprocessors import build_combined_preprocessor
 from classifiers.classifier import NaiveBayesClassifier, MaxEntClassifier, DictionaryClassifier, HierarchicalClassifier
-from classifiers.feature_extractors import NgramExtractorBoolean, NgramExtractorCount
-from classifiers.feature_selectors import DeltaIdfFeatureSelector, MutualInformationFeatureSelector
+from classifiers.feature_extractors import NgramExtractorBoolean, NgramExtractorCount, \
+    NgramExtractorHashingBoolean, NgramExtractorHashingCount
+from classifiers.feature_selectors import DeltaIdfFeatureSelector, MutualInformationFeatureSelector, \
+    ChiSquareFeatureSelector, InformationGainFeatureSelector
 
 
 def train_classifier(classifier, input_file_path, output_file_path):
@@ -19,6 +23,21 @@ def train_classifier(classifier, input_file_path, output_file_path):
     print 'Trained classifier saved to: %s' % (args.output,)
 
 
+def train_classifier_stream(classifier, input_file_path, output_file_path, chunk_size):
+    """Trains classifier chunk by chunk, never holding the whole dataset in memory"""
+    print 'Training classifier on stream of chunks: %s' % (str(classifier),)
+    document_count = 0
+    for documents, labels in iter_labelled_chunks(input_file_path, chunk_size):
+        classifier.partial_fit(documents, labels)
+        document_count += len(documents)
+        print 'Trained on %i documents' % (document_count,)
+
+    print 'Trained, now saving...'
+    save_classifier(output_file_path, classifier)
+
+    print 'Trained classifier saved to: %s' % (output_file_path,)
+
+
 def build_hierarchical():
     docs, labels = read_labelled_set('raw_data/scpn.csv')
     preprocessor = build_combined_preprocessor()
@@ -43,7 +62,14 @@ def build_classifier_from_args(args):
     else:
         ngrams = [1, 2]
 
-    if args.metric == 'Boolean':
+    if args.hashing_bits:
+        # negative values are meaningful only to MaxEnt weights, not to counts
+        signed = args.algorithm == 'MaxEnt' and not args.selection
+        if args.metric == 'Boolean':
+            feature_extractor = NgramExtractorHashingBoolean(ngrams, args.hashing_bits, signed)
+        else:
+            feature_extractor = NgramExtractorHashingCount(ngrams, args.hashing_bits, signed)
+    elif args.metric == 'Boolean':
         feature_extractor = NgramExtractorBoolean(ngrams)
     else:
         feature_extractor = NgramExtractorCount(ngrams)
@@ -56,13 +82,18 @@ def build_classifier_from_args(args):
 
         if args.selection == 'MutualInformation':
             feature_extractor = MutualInformationFeatureSelector(feature_extractor, top)
+        elif args.selection == 'ChiSquare':
+            feature_extractor = ChiSquareFeatureSelector(feature_extractor, top)
+        elif args.selection == 'InformationGain':
+            feature_extractor = InformationGainFeatureSelector(feature_extractor, top)
         else:
             feature_extractor = DeltaIdfFeatureSelector(feature_extractor, top)
 
     if args.algorithm == 'NaiveBayes':
         classifier = NaiveBayesClassifier(preprocessor, feature_extractor)
     elif args.algorithm == 'MaxEnt':
-        classifier = MaxEntClassifier(preprocessor, feature_extractor)
+        classifier = MaxEntClassifier(preprocessor, feature_extractor, solver=args.solver,
+                                      l2=args.l2, num_iter=args.iterations)
     else:
         classifier = DictionaryClassifier(preprocessor, feature_extractor)
 
@@ -82,14 +113,38 @@ def get_args_parser():
                         required=True,
                         help='Which metric to use for feature extraction (Boolean or Count)')
 
-    parser.add_argument('--selection', choices=['MutualInformation', 'DeltaIdf'],
+    parser.add_argument('--hashing-bits', type=int,
+                        required=False,
+                        help='Hash ngrams into 2^bits features instead of learning a vocabulary')
+
+    parser.add_argument('--selection', choices=['MutualInformation', 'DeltaIdf', 'ChiSquare', 'InformationGain'],
                         required=False,
-                        help='Feature selection algorithm (MutualInformation or DeltaIdf)')
+                        help='Feature selection algorithm (MutualInformation, DeltaIdf, ChiSquare or InformationGain)')
 
     parser.add_argument('--top', type=float,
                         required=False,
                         help='Feature selection amount (absolute value or percent of best features to use for classification)')
 
+    parser.add_argument('--solver', choices=['lbfgs', 'sgd'],
+                        default='lbfgs',
+                        help='MaxEnt training method (lbfgs or sgd)')
+
+    parser.add_argument('--l2', type=float,
+                        default=1e-4,
+                        help='MaxEnt L2 regularisation strength')
+
+    parser.add_argument('--iterations', type=int,
+                        default=100,
+                        help='Maximal number of MaxEnt training iterations')
+
+    parser.add_argument('--stream', action='store_true',
+                        help='Train NaiveBayes chunk by chunk in bounded memory (no feature selection; '
+                             'use --hashing-bits to bound vocabulary size too)')
+
+    parser.add_argument('--chunk-size', type=int,
+                        default=10000,
+                        help='Number of documents per chunk in streaming mode')
+
     parser.add_argument('--input', type=str,
                         required=True,
                         help='Input path (training dataset)')
@@ -98,6 +153,10 @@ def get_args_parser():
                         required=False,
                         help='Output path (classifier will be saved there)')
 
+    parser.add_argument('--stats', action='store_true',
+                        help='Time pipeline stages and print their statistics at the end '
+                             '(stages run in worker processes are not included)')
+
     return parser
 
 
@@ -105,6 +164,17 @@ if __name__ == '__main__':
     parser = get_args_parser()
 
     args = parser.parse_args()
+    if args.stream and (args.algorithm != 'NaiveBayes' or args.selection):
+        parser.error('--stream is supported only by NaiveBayes without feature selection')
+
     classifier = build_classifier_from_args(args)
+    if args.stats:
+        instrumentation.enable()
+
+    if args.stream:
+        train_classifier_stream(classifier, args.input, args.output, args.chunk_size)
+    else:
+        train_classifier(classifier, args.input, args.output)
 
-    train_classifier(classifier, args.input, args.output)
\ No newline at end of file
+    if args.stats:
+        print instrumentation.format_stats()
\ No newline at end of file
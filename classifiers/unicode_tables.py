@@ -0,0 +1,92 @@
+"""
+Tables of code points by Unicode category.
+
+Scanning every code point takes about a second, so each table is generated once
+per Unicode database version and stored as ranges of code points: shipped tables
+live in unicode_tables/ next to this module, generated ones in the user cache
+directory. Loaded tables are shared by the whole process.
+"""
+
+import os
+import sys
+import tempfile
+import unicodedata
+
+SHIPPED_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'unicode_tables')
+
+loaded_tables = {}
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'bachelor-project', 'unicode_tables')
+
+
+def table_file_name(prefix):
+    """Tables depend on Unicode database version and on build width (narrow builds stop at U+FFFF)"""
+    return '%s-%s-%x.txt' % (prefix, unicodedata.unidata_version, sys.maxunicode)
+
+
+def generate_ranges(prefix):
+    """Ranges [start, end] of code points whose category starts with prefix"""
+    ranges = []
+    for code in xrange(sys.maxunicode):
+        if unicodedata.category(unichr(code)).startswith(prefix):
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+    return ranges
+
+
+def write_ranges(path, ranges):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # written to temporary file first, so concurrent readers never see a partial table
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        for start, end in ranges:
+            f.write('%x %x\n' % (start, end))
+    os.rename(temp_path, path)
+
+
+def read_ranges(path):
+    with open(path, 'r') as f:
+        return [map(lambda x: int(x, 16), line.split()) for line in f if line.strip()]
+
+
+def category_ranges(prefix):
+    """Ranges of code points of categories starting with prefix, e.g. 'P' for punctuation"""
+    key = (prefix, unicodedata.unidata_version, sys.maxunicode)
+    if key in loaded_tables:
+        return loaded_tables[key]
+
+    file_name = table_file_name(prefix)
+    for directory in (SHIPPED_DIR, cache_dir()):
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            ranges = read_ranges(path)
+            break
+    else:
+        ranges = generate_ranges(prefix)
+        try:
+            write_ranges(os.path.join(cache_dir(), file_name), ranges)
+        except (IOError, OSError):
+            pass
+
+    loaded_tables[key] = ranges
+    return ranges
+
+
+def category_code_points(prefix):
+    return [code for start, end in category_ranges(prefix) for code in xrange(start, end + 1)]
+
+
+if __name__ == '__main__':
+    # regenerates shipped tables for the running interpreter
+    for prefix in sys.argv[1:] or ['P']:
+        path = os.path.join(SHIPPED_DIR, table_file_name(prefix))
+        write_ranges(path, generate_ranges(prefix))
+        print 'Written %s' % (path,)
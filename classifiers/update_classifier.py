@@ -0,0 +1,57 @@
+import argparse
+
+from classifiers.utils import save_classifier, load_classifier, iter_labelled_chunks
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description='Updating trained NaiveBayes classifier with new labelled tweets '
+                                                 'without retraining')
+    parser.add_argument('--classifier', type=str,
+                        required=True,
+                        help='Trained NaiveBayes classifier')
+
+    parser.add_argument('--input', type=str, nargs='*',
+                        default=[],
+                        help='New labelled datasets (id, text, label)')
+
+    parser.add_argument('--apply', type=str, nargs='*',
+                        default=[],
+                        help='Updates saved by --save-update to apply before learning from --input')
+
+    parser.add_argument('--chunk-size', type=int,
+                        default=10000,
+                        help='Number of documents folded into model at once')
+
+    parser.add_argument('--save-update', type=str,
+                        required=False,
+                        help='Path to save only changes learned from --input')
+
+    parser.add_argument('--output', type=str,
+                        required=False,
+                        help='Path to save whole updated classifier')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    # copy-on-write, mapped tables are read-only
+    classifier = load_classifier(args.classifier, mmap_mode='c')
+
+    for update_path in args.apply:
+        classifier.apply_update(update_path)
+        print 'Applied update: %s' % (update_path,)
+
+    classifier.start_update()
+    for input_path in args.input:
+        for documents, labels in iter_labelled_chunks(input_path, args.chunk_size):
+            classifier.update(documents, labels)
+        print 'Learned from: %s' % (input_path,)
+
+    if args.save_update:
+        classifier.save_update(args.save_update)
+        print 'Update saved to: %s' % (args.save_update,)
+
+    if args.output:
+        save_classifier(args.output, classifier)
+        print 'Updated classifier saved to: %s' % (args.output,)
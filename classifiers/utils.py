@@ -1,8 +1,12 @@
 import cStringIO
 import csv
+import itertools
+import os
 import pickle
 import codecs
 
+from classifiers.model_format import save_model, load_model, is_model_directory, make_temp_file
+
 
 class UTF8Recoder:
     def __init__(self, f, encoding):
@@ -62,12 +66,51 @@ def read_labelled_set(input_file_path):
     return documents, labels
 
 
-def save_classifier(path, classifier):
-    with open(path, 'wb') as f:
-        pickle.dump(classifier, f)
+def iter_labelled_set(input_file_path):
+    """Yields (document, label) pairs without reading the whole file"""
+    with open(input_file_path, 'rt') as f_in:
+        for row in UnicodeReader(f_in):
+            yield row[1], row[2]
+
 
+def iter_labelled_chunks(input_file_path, chunk_size):
+    """Yields (documents, labels) lists of at most chunk_size rows,
+    so memory is bounded by chunk size, not by file size"""
+    rows = iter_labelled_set(input_file_path)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        documents, labels = zip(*chunk)
+        yield list(documents), list(labels)
+
+
+def save_classifier(path, classifier):
+    """Saves classifier to path, in memory-mappable format if path ends with .model,
+    otherwise pickled"""
+    if path.endswith('.model'):
+        save_model(path, classifier)
+        return
+
+    # written to temporary file and renamed over path, so readers never see a partial pickle
+    path = os.path.abspath(path)
+    fd, temp_path = make_temp_file(os.path.dirname(path), '.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(classifier, f)
+        os.rename(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+def load_classifier(path, mmap_mode='r'):
+    """Loads classifier saved by save_classifier
+    mmap_mode -- how tables of .model classifiers are mapped, see model_format.load_model
+    """
+    if is_model_directory(path):
+        return load_model(path, mmap_mode)
 
-def load_classifier(path):
     with open(path, 'rb') as f:
         classifier = pickle.load(f)
     return classifier
\ No newline at end of file
@@ -0,0 +1,122 @@
+import gzip
+import httplib
+import os
+import socket
+import threading
+import urlparse
+from StringIO import StringIO
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of keep-alive HTTP(S) connections
+
+    Connections are kept per (scheme, host, port); a request takes an idle
+    connection or opens a new one and returns it when the response is read.
+    Responses are requested gzip-encoded and decoded transparently.
+    """
+
+    def __init__(self, max_idle=10, timeout=10.):
+        """
+        max_idle -- maximal number of idle connections kept per host
+        timeout -- seconds to wait for connecting and for every read
+        """
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.pid = os.getpid()
+        self.counters = {'requests': 0, 'created': 0, 'reused': 0, 'retried': 0, 'errors': 0, 'discarded': 0}
+
+    def connection_class(self, scheme):
+        if scheme == 'https':
+            return httplib.HTTPSConnection
+        if scheme == 'http':
+            return httplib.HTTPConnection
+        raise ValueError('Unsupported url scheme: %s' % (scheme,))
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def acquire(self, key):
+        """Returns (connection, reused)"""
+        with self.lock:
+            if self.pid != os.getpid():
+                # sockets inherited from parent process are shared with it
+                self.idle = {}
+                self.pid = os.getpid()
+            connections = self.idle.get(key)
+            if connections:
+                self.counters['reused'] += 1
+                return connections.pop(), True
+        return self.connect(key), False
+
+    def connect(self, key):
+        self.count('created')
+        scheme, host, port = key
+        return self.connection_class(scheme)(host, port, timeout=self.timeout)
+
+    def release(self, key, connection):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle and self.pid == os.getpid():
+                connections.append(connection)
+                return
+            self.counters['discarded'] += 1
+        connection.close()
+
+    def request(self, method, url, headers=None, body=None):
+        """Sends request, returns (status, headers with lowercase names, decoded body)"""
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = urlparse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'gzip')
+        self.count('requests')
+
+        connection, reused = self.acquire(key)
+        try:
+            try:
+                response = self.send(connection, method, path, headers, body)
+            except (httplib.HTTPException, socket.error):
+                if not reused:
+                    raise
+                # server closed idle keep-alive connection, retry once on a fresh one
+                connection.close()
+                self.count('retried')
+                connection = self.connect(key)
+                response = self.send(connection, method, path, headers, body)
+            content = response.read()
+        except Exception:
+            connection.close()
+            self.count('errors')
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.release(key, connection)
+
+        response_headers = dict((name.lower(), value) for name, value in response.getheaders())
+        if response_headers.get('content-encoding') == 'gzip':
+            content = gzip.GzipFile(fileobj=StringIO(content)).read()
+        return response.status, response_headers, content
+
+    def send(self, connection, method, path, headers, body):
+        connection.request(method, path, body, headers)
+        return connection.getresponse()
+
+    def close(self):
+        """Closes idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.itervalues():
+            for connection in connections:
+                connection.close()
+
+    def stats(self):
+        """Counters of requests and connections, and number of idle connections"""
+        with self.lock:
+            result = dict(self.counters)
+            result['idle'] = sum(len(connections) for connections in self.idle.itervalues())
+        return result
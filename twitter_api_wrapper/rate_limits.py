@@ -0,0 +1,150 @@
+import threading
+import time
+
+# seconds added to reset times announced by server, against clock skew
+RESET_MARGIN = 1.
+
+
+class EndpointBudget(object):
+    """Requests left in current rate-limit window of one endpoint
+
+    Budget is learned from x-rate-limit-* headers of responses. Slots are
+    reserved for requests before they are sent; when paced, remaining requests
+    are spread evenly until reset, so that the window is used fully without
+    bursts. When budget is exhausted, next slot is after reset.
+    """
+
+    def __init__(self, window, pace=True, share=1.):
+        self.window = window
+        self.pace = pace
+        self.share = share
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.next_slot = 0.
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.
+
+    def next_start(self, now):
+        """Time when next request may start"""
+        if self.remaining is None or self.reset is None or now >= self.reset:
+            # unknown budget, or new window: allowed until headers tell otherwise
+            return now
+        if self.remaining <= 0:
+            return max(self.reset, self.next_slot)
+        return max(now, self.next_slot)
+
+    def reserve(self, now):
+        """Reserves slot of next request, returns its start time"""
+        start = self.next_start(now)
+        if self.reset is not None and start >= self.reset:
+            # reservation in next window, its budget is estimated until its headers arrive
+            self.remaining = self.limit
+            self.reset = start + self.window
+        if self.remaining is not None and self.reset is not None:
+            self.remaining -= 1
+            if self.pace:
+                self.next_slot = start + (self.reset - start) / max(self.remaining * self.share, 1)
+        self.requests += 1
+        self.waited += start - now
+        return start
+
+    def update(self, limit, remaining, reset):
+        """Applies budget announced by server"""
+        if limit is not None:
+            self.limit = limit
+        if remaining is None or reset is None:
+            return
+        if self.reset is not None and abs(reset - self.reset) < self.window / 2 and self.remaining is not None:
+            # same window: requests in flight are reserved locally but not counted by server yet
+            remaining = min(remaining, self.remaining)
+        self.remaining = remaining
+        self.reset = reset
+
+    def exhaust(self, now):
+        """Server refused request (status 429)"""
+        self.throttled += 1
+        self.remaining = 0
+        if self.reset is None or self.reset <= now:
+            self.reset = now + self.window
+
+    def to_dict(self, now):
+        return {'limit': self.limit, 'remaining': self.remaining,
+                'reset_in_s': None if self.reset is None else max(self.reset - now, 0.),
+                'requests': self.requests, 'throttled': self.throttled, 'waited_s': self.waited}
+
+
+def parse_rate_limit_headers(headers):
+    """(limit, remaining, reset time) from x-rate-limit-* headers, None for missing values"""
+    values = []
+    for name in ('x-rate-limit-limit', 'x-rate-limit-remaining', 'x-rate-limit-reset'):
+        try:
+            values.append(int(headers[name]))
+        except (KeyError, ValueError):
+            values.append(None)
+    limit, remaining, reset = values
+    if reset is not None:
+        reset += RESET_MARGIN
+    return limit, remaining, reset
+
+
+class RateLimiter(object):
+    """Thread-safe scheduler of requests by per-endpoint rate-limit budgets"""
+
+    def __init__(self, window=900., pace=True, share=1., clock=time.time, sleep=time.sleep):
+        """
+        window -- length of rate-limit window in seconds, used until reset time is known
+        pace -- spread requests evenly over window (for batch jobs), otherwise
+            requests are sent at once until budget is exhausted (for interactive use)
+        share -- fraction of budget paced requests of this process may use,
+            when processes share credentials
+        clock, sleep -- time functions, replaceable in tests
+        """
+        self.window = window
+        self.pace = pace
+        self.share = share
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.budgets = {}
+
+    def budget(self, endpoint):
+        if endpoint not in self.budgets:
+            self.budgets[endpoint] = EndpointBudget(self.window, self.pace, self.share)
+        return self.budgets[endpoint]
+
+    def wait_time(self, endpoint):
+        """Seconds until next request to endpoint may start"""
+        with self.lock:
+            now = self.clock()
+            return self.budget(endpoint).next_start(now) - now
+
+    def acquire(self, endpoint, max_wait=None):
+        """Waits for slot of request to endpoint
+        returns seconds waited, or None without waiting if it would take more than max_wait
+        """
+        with self.lock:
+            now = self.clock()
+            budget = self.budget(endpoint)
+            if max_wait is not None and budget.next_start(now) - now > max_wait:
+                return None
+            wait = budget.reserve(now) - now
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def update(self, endpoint, status, headers):
+        """Learns budget from response headers"""
+        limit, remaining, reset = parse_rate_limit_headers(headers)
+        with self.lock:
+            budget = self.budget(endpoint)
+            budget.update(limit, remaining, reset)
+            if status == 429:
+                budget.exhaust(self.clock())
+
+    def stats(self):
+        """Budget and counters of each endpoint"""
+        with self.lock:
+            now = self.clock()
+            return dict((endpoint, budget.to_dict(now)) for endpoint, budget in self.budgets.items())
@@ -0,0 +1,423 @@
+import BaseHTTPServer
+import SocketServer
+import csv
+import gzip
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urlparse
+from StringIO import StringIO
+
+import oauth2
+
+from classifiers import download_tweets
+from twitter_api_wrapper.connection_pool import ConnectionPool
+from twitter_api_wrapper.rate_limits import RateLimiter, RESET_MARGIN
+from twitter_api_wrapper.twitter import Twitter
+from twitter_api_wrapper.twitter_exceptions import *
+
+
+class FakeApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        parts = urlparse.urlsplit(self.path)
+        query = dict(urlparse.parse_qsl(parts.query))
+        with self.server.lock:
+            self.server.requests.append((parts.path, query, dict(self.headers)))
+        status, headers, content = self.server.respond(parts.path, query)
+
+        body = json.dumps(content)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buffer = StringIO()
+            with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+                f.write(body)
+            body = buffer.getvalue()
+            headers = dict(headers, **{'Content-Encoding': 'gzip'})
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.drop_connections:
+            # closed without telling client, like idle keep-alive connections closed by servers
+            self.close_connection = 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeApiServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Local HTTP server answering API requests with respond(path, query) -> (status, headers, json content)"""
+    daemon_threads = True
+
+    def __init__(self, respond):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FakeApiHandler)
+        self.respond = respond
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.drop_connections = False
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def api_root(self):
+        return 'http://127.0.0.1:%i/1.1/' % (self.server_address[1],)
+
+    def handle_error(self, request, client_address):
+        pass
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def respond_with_tweets(path, query):
+    if path == '/1.1/search/tweets.json':
+        return 200, {}, {'statuses': [{'id': 2, 'text': u'tweet about %s' % (query['q'],)}]}
+    if path == '/1.1/statuses/show.json':
+        if query['id'] == '404':
+            return 404, {}, {'errors': [{'message': 'No status found'}]}
+        return 200, {}, {'id': int(query['id']), 'text': u'tweet %s' % (query['id'],)}
+    if path == '/1.1/statuses/lookup.json':
+        ids = query['id'].split(',')
+        assert len(ids) <= 100
+        # ids ending with 0 are deleted tweets
+        return 200, {}, [{'id': int(id), 'id_str': id, 'text': u'tweet %s' % (id,)} for id in ids if id[-1] != '0']
+    if path == '/1.1/slow.json':
+        time.sleep(0.5)
+        return 200, {}, {}
+    return 429, {}, {'errors': [{'message': 'Rate limit exceeded'}]}
+
+
+class FakeServerTestCase(unittest.TestCase):
+    def respond(self, path, query):
+        return respond_with_tweets(path, query)
+
+    def setUp(self):
+        self.server = FakeApiServer(self.respond)
+        self.pool = ConnectionPool(max_idle=4, timeout=5.)
+        # waits for rate limits are recorded and skipped by moving clock forward
+        self.waits = []
+        self.time_offset = 0.
+        self.rate_limiter = RateLimiter(clock=self.clock, sleep=self.sleep)
+        self.twitter = Twitter(self.pool, self.server.api_root(),
+                               oauth2.Consumer('consumer', 'secret'), oauth2.Token('key', 'secret'),
+                               self.rate_limiter, backoff=0.001)
+
+    def clock(self):
+        return time.time() + self.time_offset
+
+    def sleep(self, seconds):
+        self.waits.append(seconds)
+        self.time_offset += seconds
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+
+class ConnectionPoolTest(FakeServerTestCase):
+    def test_connection_is_kept_alive(self):
+        for i in xrange(5):
+            self.assertEqual(self.twitter.get_tweet(i)[u'id'], i)
+        self.assertEqual(self.server.connections, 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats['requests'], stats['created'], stats['reused'], stats['idle']), (5, 1, 4, 1))
+
+    def test_responses_are_gzipped(self):
+        tweets = self.twitter.search(u'python')
+        self.assertEqual(tweets[u'statuses'][0][u'text'], u'tweet about python')
+        path, query, headers = self.server.requests[0]
+        self.assertEqual(headers['accept-encoding'], 'gzip')
+        self.assertTrue(headers['authorization'].startswith('OAuth '))
+
+    def test_closed_connection_is_retried(self):
+        self.server.drop_connections = True
+        for i in xrange(3):
+            self.assertEqual(self.twitter.get_tweet(i)[u'id'], i)
+        stats = self.pool.stats()
+        self.assertEqual((stats['retried'], stats['errors']), (2, 0))
+        self.assertEqual(self.server.connections, 3)
+
+    def test_timeout(self):
+        self.pool.timeout = 0.1
+        self.twitter.max_retries = 1
+        self.assertRaises(socket.timeout, self.twitter.request, self.twitter.api_url('slow.json'))
+        self.assertEqual(self.pool.stats()['errors'], 2)
+
+    def test_lookup_in_batches(self):
+        tweets = self.twitter.lookup(range(1, 251))
+        self.assertEqual([tweet[u'id'] for tweet in tweets], [i for i in xrange(1, 251) if i % 10])
+        self.assertEqual([len(query['id'].split(',')) for path, query, headers in self.server.requests],
+                         [100, 100, 50])
+
+    def test_errors(self):
+        self.assertRaises(Twitter_Not_Found_Exception, self.twitter.get_tweet, 404)
+        self.twitter.max_retries = 0
+        self.assertRaises(Twitter_Rate_Limit_Exception, self.twitter.request, self.twitter.api_url('other.json'))
+
+    def test_threads_share_pool(self):
+        results = []
+
+        def work(start):
+            for i in xrange(start, start + 20):
+                results.append(self.twitter.get_tweet(i)[u'id'])
+
+        threads = [threading.Thread(target=work, args=(start,)) for start in xrange(0, 160, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), range(160))
+        stats = self.pool.stats()
+        self.assertEqual(stats['created'], self.server.connections)
+        self.assertEqual(stats['created'] + stats['reused'], 160)
+        self.assertTrue(stats['idle'] <= 4)
+
+    def test_instrumentation_is_injected(self):
+        from classifiers import instrumentation
+        instrumentation.reset()
+        instrumentation.enable()
+        try:
+            self.twitter.instrumentation = instrumentation
+            self.twitter.get_tweet(1)
+            self.assertEqual(instrumentation.histograms['twitter.statuses/show'].count, 1)
+        finally:
+            instrumentation.disable()
+            instrumentation.reset()
+
+    def test_wrapper_does_not_import_classifiers(self):
+        code = 'import sys, twitter_api_wrapper.twitter; sys.exit("classifiers" in sys.modules)'
+        self.assertEqual(subprocess.call([sys.executable, '-c', code]), 0)
+
+
+class RateLimitedServerTestCase(FakeServerTestCase):
+    """Server with budget of limit requests per window, statuses in self.statuses are returned first"""
+    limit = 10
+    window = 100
+
+    def setUp(self):
+        self.remaining = self.limit
+        self.reset = int(time.time()) + self.window
+        self.statuses = []
+        super(RateLimitedServerTestCase, self).setUp()
+
+    def respond(self, path, query):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            if self.remaining <= 0:
+                status = 429
+            else:
+                self.remaining -= 1
+        headers = {'x-rate-limit-limit': self.limit, 'x-rate-limit-remaining': self.remaining,
+                   'x-rate-limit-reset': self.reset}
+        if status != 200:
+            return status, headers, {'errors': [{'message': 'Error'}]}
+        return 200, headers, {'id': int(query['id']), 'text': u'tweet %s' % (query['id'],)}
+
+
+class RateLimitTest(RateLimitedServerTestCase):
+    def test_requests_are_paced_over_window(self):
+        # budget is unknown before first response, then 9 requests are left for window,
+        # second is sent at once and 8 remaining ones are spread until reset
+        spacing = (self.reset + RESET_MARGIN - self.clock()) / 8
+        for i in xrange(5):
+            self.twitter.get_tweet(i)
+        self.assertEqual(len(self.waits), 3)
+        for wait in self.waits:
+            self.assertTrue(spacing * 0.9 < wait < spacing * 1.1, (wait, spacing))
+        self.assertEqual(self.rate_limiter.stats()['statuses/show']['throttled'], 0)
+
+    def test_exhausted_budget_waits_for_reset(self):
+        self.rate_limiter.pace = False
+        self.remaining = 1
+        self.twitter.get_tweet(1)
+        self.remaining = self.limit
+        self.twitter.get_tweet(2)
+        self.assertEqual(len(self.waits), 1)
+        self.assertAlmostEqual(self.waits[0], self.reset + RESET_MARGIN - time.time(), delta=1.)
+        self.assertEqual(self.rate_limiter.stats()['statuses/show']['throttled'], 0)
+
+    def test_throttled_request_is_retried_after_reset(self):
+        self.remaining = 0
+        self.assertRaises(Twitter_Rate_Limit_Exception, self.twitter.get_tweet, 1)
+        self.assertEqual(self.rate_limiter.stats()['statuses/show']['throttled'], 4)
+        self.assertEqual(len(self.waits), 3)
+        self.assertTrue(all(wait > self.window - 5 for wait in self.waits))
+
+    def test_max_wait(self):
+        self.rate_limiter.pace = False
+        self.twitter.max_wait = 5.
+        self.remaining = 1
+        self.twitter.get_tweet(1)
+        self.assertRaises(Twitter_Rate_Limit_Exception, self.twitter.get_tweet, 2)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_transient_errors_are_retried(self):
+        self.statuses = [503, 500]
+        self.assertEqual(self.twitter.get_tweet(1)[u'id'], 1)
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.statuses = [503] * 4
+        try:
+            self.twitter.get_tweet(2)
+            self.fail('Twitter_Exception not raised')
+        except Twitter_Exception as e:
+            self.assertEqual(e.code, 503)
+
+    def test_backoff_is_jittered_and_bounded(self):
+        self.twitter.backoff = 1.
+        self.twitter.max_backoff = 4.
+        times = [self.twitter.backoff_time(attempt) for attempt in xrange(1, 6) for i in xrange(100)]
+        self.assertTrue(all(0 <= t <= 4. for t in times))
+        self.assertTrue(len(set(times)) > 400)
+        self.assertTrue(max(times[:100]) <= 1.)
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+class CrashingCheckpoint(download_tweets.Checkpoint):
+    """Checkpoint of process killed when it is about to record hydrated batch number crash_at,
+    after rows of the batch were written"""
+    crash_at = None
+
+    def record(self, status, ids, output_size=None):
+        if status == download_tweets.HYDRATED:
+            if CrashingCheckpoint.crash_at == 0:
+                raise SimulatedCrash()
+            if CrashingCheckpoint.crash_at is not None:
+                CrashingCheckpoint.crash_at -= 1
+        super(CrashingCheckpoint, self).record(status, ids, output_size)
+
+
+class DownloadTest(FakeServerTestCase):
+    """Downloads of corpus rows (id, label) by lookup, ids ending with 0 are deleted tweets
+    and batches containing an id in self.forbidden fail with 403 (only once if self.forbidden_once)"""
+
+    def respond(self, path, query):
+        if any(id in self.forbidden for id in query['id'].split(',')):
+            if self.forbidden_once:
+                self.forbidden = set()
+            return 403, {}, {'errors': [{'message': 'Forbidden'}]}
+        return respond_with_tweets(path, query)
+
+    def setUp(self):
+        super(DownloadTest, self).setUp()
+        self.forbidden = set()
+        self.forbidden_once = False
+        self.directory = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.directory, 'dataset.csv')
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+        self.checkpoint_class = download_tweets.Checkpoint
+        download_tweets.Checkpoint = CrashingCheckpoint
+
+    def tearDown(self):
+        download_tweets.Checkpoint = self.checkpoint_class
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+        super(DownloadTest, self).tearDown()
+
+    def rows(self, ids):
+        return [(str(id), u'label %i' % (id,)) for id in ids]
+
+    def download(self, rows, output_path=None, retry_rounds=0, crash_at=None):
+        CrashingCheckpoint.crash_at = crash_at
+        try:
+            return download_tweets.resumable_download(self.twitter, rows, output_path or self.output_path,
+                                                      workers=1, retry_rounds=retry_rounds)
+        except SimulatedCrash:
+            return None
+
+    def output_ids(self, output_path=None):
+        with open(output_path or self.output_path, 'rb') as f:
+            content = f.read()
+        self.assertFalse('\0' in content)
+        return [row[0] for row in csv.reader(StringIO(content))]
+
+    def test_resume_after_crash_writes_no_duplicates(self):
+        # batches: 1-100, 100 deleted tweets, 101-200, 201-300
+        rows = self.rows(range(1, 101)) + self.rows(range(1010, 2010, 10)) + \
+               self.rows(range(101, 201)) + self.rows(range(201, 301))
+        expected = sorted(id for id, label in rows if id[-1] != '0')
+
+        # batch of deleted tweets is forbidden and deferred, crash after rows of 101-200 are written
+        self.forbidden = set(['1010'])
+        self.assertEqual(self.download(rows, crash_at=1), None)
+        # resumed with the batch of deleted tweets, which writes no rows, crash after rows of 101-200
+        self.forbidden = set()
+        self.assertEqual(self.download(rows, crash_at=1), None)
+        count, left, deferred = self.download(rows)
+
+        self.assertEqual((left, deferred), (200, []))
+        self.assertEqual(sorted(self.output_ids()), expected)
+
+    def test_resume_after_torn_checkpoint_line(self):
+        rows = self.rows(range(1, 301))
+        self.assertEqual(self.download(rows, crash_at=1), None)
+        # killed while writing record of next batch
+        with open(self.output_path + '.checkpoint', 'ab') as f:
+            f.write('hydrated 8')
+
+        self.assertEqual(self.download(rows, crash_at=1), None)
+        count, left, deferred = self.download(rows)
+        self.assertEqual((left, deferred), (100, []))
+        self.assertEqual(sorted(self.output_ids()), sorted(id for id, label in rows if id[-1] != '0'))
+
+    def test_deferred_batch_is_retried_on_resume(self):
+        rows = self.rows(range(1, 301))
+        self.forbidden = set(['150'])
+        count, left, deferred = self.download(rows)
+        self.assertEqual((count, left, sorted(deferred)), (180, 300, sorted(id for id, label in rows[100:200])))
+
+        # resume looks up only deferred ids
+        self.forbidden = set()
+        requests = len(self.server.requests)
+        count, left, deferred = self.download(rows)
+        self.assertEqual((count, left, deferred), (90, 100, []))
+        self.assertEqual(len(self.server.requests), requests + 1)
+        self.assertEqual(sorted(self.output_ids()), sorted(id for id, label in rows if id[-1] != '0'))
+
+    def test_deferred_batch_is_retried_in_next_round(self):
+        rows = self.rows(range(1, 301))
+        self.forbidden = set(['150'])
+        self.forbidden_once = True
+        count, left, deferred = self.download(rows, retry_rounds=1)
+        self.assertEqual((count, deferred), (270, []))
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(sorted(self.output_ids()), sorted(id for id, label in rows if id[-1] != '0'))
+
+    def test_shards_are_disjoint(self):
+        rows = self.rows(range(1, 501))
+        shards = [download_tweets.shard_rows(rows, shard, 3) for shard in xrange(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(rows))
+
+        ids = []
+        for shard, shard_rows in enumerate(shards):
+            output_path = '%s.shard-%i-of-3' % (self.output_path, shard)
+            self.download(shard_rows, output_path)
+            ids.extend(self.output_ids(output_path))
+        self.assertEqual(sorted(ids), sorted(id for id, label in rows if id[-1] != '0'))
+
+
+if __name__ == '__main__':
+    unittest.main()
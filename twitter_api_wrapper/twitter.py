@@ -1,19 +1,85 @@
 import oauth2
+import httplib
 import json
+import random
+import socket
+import time
 import urlparse
 import urllib
-from twitter_api_wrapper import auth_settings
+from twitter_api_wrapper.connection_pool import ConnectionPool
+from twitter_api_wrapper.rate_limits import RateLimiter
 from twitter_api_wrapper.twitter_exceptions import *
 
+API_ROOT = 'https://api.twitter.com/1.1/'
 
-class Twitter():
-    """Twitter client wrapper"""
+# maximal number of ids of one statuses/lookup request
+LOOKUP_BATCH_SIZE = 100
+
+# statuses retried after backoff (429 after rate-limit reset)
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+# keep-alive connections and rate-limit budgets shared by all clients of the process
+shared_pool = ConnectionPool()
+shared_rate_limiter = RateLimiter()
+
+
+class NoInstrumentation(object):
+    """Default recorder of request timings, records nothing
+    (classifiers.instrumentation can be passed instead)"""
+    enabled = False
+
+    def timer(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
 
-    def __init__(self):
-        consumer = oauth2.Consumer(auth_settings.consumer_key, auth_settings.consumer_secret)
-        token = oauth2.Token(auth_settings.app_key, auth_settings.app_secret)
+    def record(self, name, seconds):
+        pass
 
-        self.client = oauth2.Client(consumer, token=token)
+    def increment(self, name, value=1):
+        pass
+
+
+no_instrumentation = NoInstrumentation()
+
+
+class Twitter():
+    """Twitter client wrapper, safe to share between threads"""
+
+    def __init__(self, pool=None, api_root=API_ROOT, consumer=None, token=None, rate_limiter=None,
+                 max_retries=3, backoff=1., max_backoff=60., max_wait=None, instrumentation=None):
+        """
+        pool -- ConnectionPool, by default shared_pool
+        api_root -- base url of API endpoints (e.g. of a fake server in tests)
+        consumer, token -- oauth2 credentials, by default from auth_settings
+        rate_limiter -- RateLimiter pacing requests, by default shared_rate_limiter
+        max_retries -- retries of requests failed by network errors or TRANSIENT_STATUSES
+        backoff, max_backoff -- retry n waits random time up to min(max_backoff, backoff * 2^(n-1)) seconds
+        max_wait -- maximal seconds to wait for rate limits, Twitter_Rate_Limit_Exception is raised
+            instead of waiting longer; None waits until reset
+        instrumentation -- module or object with enabled, timer(name), record(name, seconds)
+            and increment(name) recording stages 'twitter.<endpoint>', by default nothing is recorded
+        """
+        if consumer is None or token is None:
+            from twitter_api_wrapper import auth_settings
+            consumer = oauth2.Consumer(auth_settings.consumer_key, auth_settings.consumer_secret)
+            token = oauth2.Token(auth_settings.app_key, auth_settings.app_secret)
+
+        self.consumer = consumer
+        self.token = token
+        self.signature_method = oauth2.SignatureMethod_HMAC_SHA1()
+        self.pool = pool if pool is not None else shared_pool
+        self.api_root = api_root
+        self.rate_limiter = rate_limiter if rate_limiter is not None else shared_rate_limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self.instrumentation = instrumentation if instrumentation is not None else no_instrumentation
 
     def url_params(self, base_url, **kwargs):
         url_parts = list(urlparse.urlparse(base_url))
@@ -24,11 +90,64 @@ class Twitter():
 
         return urlparse.urlunparse(url_parts)
 
-    def request(self, url, return_field=None):
-        resp, content = self.client.request(url)
+    def api_url(self, path):
+        return urlparse.urljoin(self.api_root, path)
+
+    def endpoint(self, url):
+        """Name of API endpoint, e.g. search/tweets"""
+        path = urlparse.urlparse(url).path
+        root = urlparse.urlparse(self.api_root).path
+        if path.startswith(root):
+            path = path[len(root):]
+        return path.replace('.json', '')
+
+    def backoff_time(self, attempt):
+        """Jittered exponential backoff before retry number attempt"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def signed_headers(self, method, url):
+        """OAuth Authorization header of request, query parameters of url are signed too"""
+        oauth_request = oauth2.Request.from_consumer_and_token(self.consumer, self.token,
+                                                               http_method=method, http_url=url)
+        oauth_request.sign_request(self.signature_method, self.consumer, self.token)
+        return oauth_request.to_header()
+
+    def send(self, url):
+        """GET request sent when rate limits allow, with retries of transient failures
+        returns (status, content)
+        """
+        endpoint = self.endpoint(url)
+        instrumentation = self.instrumentation
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire(endpoint, self.max_wait)
+            if waited is None:
+                raise Twitter_Rate_Limit_Exception(url)
+            if waited > 0 and instrumentation.enabled:
+                instrumentation.record('twitter.rate_limit_wait.' + endpoint, waited)
+
+            try:
+                with instrumentation.timer('twitter.' + endpoint):
+                    status, headers, content = self.pool.request('GET', url, self.signed_headers('GET', url))
+            except (httplib.HTTPException, socket.error):
+                if attempt >= self.max_retries:
+                    raise
+                status = None
+            else:
+                self.rate_limiter.update(endpoint, status, headers)
+                if status not in TRANSIENT_STATUSES or attempt >= self.max_retries:
+                    return status, content
+
+            attempt += 1
+            if instrumentation.enabled:
+                instrumentation.increment('twitter.retries.' + endpoint)
+            if status != 429:
+                # after 429 rate limiter waits until reset
+                time.sleep(self.backoff_time(attempt))
 
+    def request(self, url, return_field=None):
+        status, content = self.send(url)
         content = json.loads(content, 'utf-8')
-        status = int(resp['status'])
 
         if status == 403:
             raise Twitter_Forbidden_Exception(url)
@@ -48,14 +167,29 @@ class Twitter():
         return content
 
     def get_tweet(self, id):
-        base_url = 'https://api.twitter.com/1.1/statuses/show.json'
+        base_url = self.api_url('statuses/show.json')
         url = self.url_params(base_url, id=id)
         return self.request(url)
 
+    def lookup(self, ids):
+        """Tweets with given ids, fetched in batches of LOOKUP_BATCH_SIZE ids per request;
+        deleted and protected tweets are missing from result"""
+        ids = list(ids)
+        base_url = self.api_url('statuses/lookup.json')
+        tweets = []
+        for start in xrange(0, len(ids), LOOKUP_BATCH_SIZE):
+            batch = ids[start:start + LOOKUP_BATCH_SIZE]
+            url = self.url_params(base_url, id=','.join(str(id) for id in batch),
+                                  include_entities='false', trim_user='true')
+            tweets.extend(self.request(url))
+        return tweets
+
     def search(self, query, language='en', count=100, **kwargs):
-        base_url = 'https://api.twitter.com/1.1/search/tweets.json'
+        base_url = self.api_url('search/tweets.json')
         url = self.url_params(base_url, q=query, lang=language,
                               count=count, include_entities='false', result_type='recent')
         if 'max_id' in kwargs:
             url = self.url_params(url, max_id=(int(kwargs['max_id']) - 1))
+        if kwargs.get('since_id'):
+            url = self.url_params(url, since_id=kwargs['since_id'])
         return self.request(url)
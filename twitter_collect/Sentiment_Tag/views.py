@@ -3,10 +3,15 @@ from django.shortcuts import render
 from django.http import HttpResponseBadRequest, HttpResponse
 
 from twitter_collect.Sentiment_Tag.forms import SearchForm, DatasetForm
+from twitter_api_wrapper.rate_limits import RateLimiter
 from twitter_api_wrapper.twitter import Twitter
 
 import json
 
+# shares keep-alive connections of twitter_api_wrapper.twitter.shared_pool;
+# searches are not paced, but fail instead of waiting long for rate-limit reset
+twitter = Twitter(rate_limiter=RateLimiter(pace=False), max_wait=5.)
+
 
 def home(request):
     return render(request, 'Sentiment_Tag/home.html')
@@ -16,7 +21,6 @@ def search_tweets(request):
     if request.method == 'POST':
         form = SearchForm(request.POST)
         if form.is_valid():
-            twitter = Twitter()
             query = form.cleaned_data.get('query')
             language = form.cleaned_data.get('language')
             max_id = form.cleaned_data.get('max_id')
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from classifiers import instrumentation
+
+
+class InstrumentationMiddleware(object):
+    """Times pipeline stages of each request and reports their totals
+    in Server-Timing header (visible in browser developer tools);
+    used only when settings.INSTRUMENTATION_ENABLED is set"""
+
+    def __init__(self):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed()
+        instrumentation.enable()
+
+    def process_request(self, request):
+        request.instrumentation_started = time.time()
+        instrumentation.start_request()
+
+    def process_response(self, request, response):
+        timings = instrumentation.finish_request()
+        started = getattr(request, 'instrumentation_started', None)
+        if started is None:
+            return response
+
+        total = time.time() - started
+        instrumentation.record('request', total)
+        metrics = ['%s;dur=%.2f' % (name, seconds * 1000.) for name, seconds in sorted(timings.items())]
+        metrics.append('total;dur=%.2f' % (total * 1000.,))
+        response['Server-Timing'] = ', '.join(metrics)
+        return response
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import time
+
+from classifiers.utils import load_classifier
+
+
+def path_signature(path):
+    """Cheap signature of model file or directory, changes when it is replaced"""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+def path_checksum(path):
+    """md5 of model file, or of all files of model directory"""
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    else:
+        paths = [path]
+
+    md5 = hashlib.md5()
+    for file_path in paths:
+        md5.update(os.path.basename(file_path))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), ''):
+                md5.update(block)
+    return md5.hexdigest()
+
+
+class LoadedModel(object):
+    """Immutable snapshot of loaded classifier, replaced as a whole on reload"""
+
+    def __init__(self, name, path, classifier, signature, checksum, loaded_at, load_time, version):
+        self.name = name
+        self.path = path
+        self.classifier = classifier
+        self.signature = signature
+        self.checksum = checksum
+        self.loaded_at = loaded_at
+        self.load_time = load_time
+        self.version = version
+
+
+class ModelRegistry(object):
+    """Loads each registered classifier once per process and reloads it when
+    its file changes
+
+    Requests get the classifier of current snapshot, a reload only swaps
+    snapshot reference, so requests in flight finish with the old classifier.
+    Files are checked at most once per check_interval seconds; a changed
+    mtime triggers checksum comparison, so touching a file does not reload it.
+    """
+
+    def __init__(self, check_interval=2., loader=load_classifier, on_load=None):
+        """
+        loader -- function path -> classifier
+        on_load -- optional function called with each freshly loaded classifier
+        """
+        self.check_interval = check_interval
+        self.loader = loader
+        self.on_load = on_load
+        self.paths = {}
+        self.models = {}
+        self.checked_at = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, path):
+        with self.lock:
+            if self.paths.get(name) != path:
+                self.paths[name] = path
+                self.models.pop(name, None)
+
+    def load(self, name, previous=None):
+        path = self.paths[name]
+        signature = path_signature(path)
+        checksum = path_checksum(path)
+        if previous is not None and previous.checksum == checksum:
+            # touched, not changed
+            return LoadedModel(name, path, previous.classifier, signature, checksum,
+                               previous.loaded_at, previous.load_time, previous.version)
+
+        started = time.time()
+        classifier = self.loader(path)
+        if self.on_load is not None:
+            self.on_load(classifier)
+        finished = time.time()
+        version = previous.version + 1 if previous is not None else 1
+        return LoadedModel(name, path, classifier, signature, checksum, finished, finished - started, version)
+
+    def get_model(self, name):
+        """Current LoadedModel of name, (re)loaded if necessary"""
+        model = self.models.get(name)
+        now = time.time()
+        if model is not None and now - self.checked_at.get(name, 0) < self.check_interval:
+            return model
+
+        with self.lock:
+            model = self.models.get(name)
+            self.checked_at[name] = now
+            try:
+                if model is None or path_signature(self.paths[name]) != model.signature:
+                    model = self.load(name, model)
+                    self.models[name] = model
+                self.errors.pop(name, None)
+            except Exception as e:
+                # model being replaced or broken (unpickling fails with almost any error),
+                # keep serving the loaded one
+                if model is None:
+                    raise
+                self.errors[name] = '%s: %s' % (type(e).__name__, e)
+        return model
+
+    def get(self, name):
+        """Current classifier registered as name"""
+        return self.get_model(name).classifier
+
+    def preload(self, warm_up_text=u'warm up :)'):
+        """Loads all registered models and runs them once, so lazily built
+        tables are built now (e.g. in master process before workers fork)"""
+        for name in sorted(self.paths):
+            classifier = self.get(name)
+            classifier.classify_batch([warm_up_text])
+            if hasattr(classifier, 'clear_cache'):
+                classifier.clear_cache()
+
+    def info(self):
+        """Description of registered models, loaded ones are not reloaded"""
+        result = []
+        for name in sorted(self.paths):
+            model = self.models.get(name)
+            description = {'name': name, 'path': self.paths[name], 'loaded': model is not None,
+                           'error': self.errors.get(name)}
+            if model is not None:
+                description.update({'version': model.version, 'checksum': model.checksum,
+                                    'mtime': model.signature[2], 'loaded_at': model.loaded_at,
+                                    'load_time': model.load_time, 'classifier': str(model.classifier)})
+                if hasattr(model.classifier, 'cache_stats'):
+                    description['cache'] = model.classifier.cache_stats()
+            result.append(description)
+        return result
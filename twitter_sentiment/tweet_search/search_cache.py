@@ -0,0 +1,175 @@
+import cPickle
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from classifiers.caching import LRUCache
+
+
+class CachedSearch(object):
+    """Classified tweets of query (newest first) and id of the newest fetched tweet"""
+
+    def __init__(self, query, model, tweets, since_id, updated_at):
+        """
+        model -- identifies classifier which labelled tweets (e.g. its checksum)
+        tweets -- list of dicts with keys text and label
+        """
+        self.query = query
+        self.model = model
+        self.tweets = tweets
+        self.since_id = since_id
+        self.updated_at = updated_at
+
+
+def cache_key(query):
+    """Key safe for any backend (memcached keys cannot contain spaces)"""
+    return 'tweet_search:' + hashlib.md5(query.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend(object):
+    """Entries in memory of this process, least recently used are evicted beyond max_entries"""
+
+    def __init__(self, max_entries=1000, ttl=300.):
+        self.cache = LRUCache(max_entries)
+        self.ttl = ttl
+
+    def get(self, key):
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.time():
+            return None
+        return value
+
+    def set(self, key, value):
+        self.cache.put(key, (time.time() + self.ttl, value))
+
+
+class DjangoCacheBackend(object):
+    """Entries in a cache configured in settings.CACHES (shared by processes
+    with memcached, database or file caches), evicted by its own policy"""
+
+    def __init__(self, alias='default', ttl=300.):
+        from django.core.cache import get_cache
+        self.cache = get_cache(alias)
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+
+class SQLiteBackend(object):
+    """Entries in SQLite file shared by processes of one host,
+    least recently used are evicted beyond max_entries"""
+
+    def __init__(self, path, max_entries=1000, ttl=300.):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def connect(self):
+        """Connection of this process, connections must not be inherited by forked workers"""
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=10., check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS searches '
+                                    '(key TEXT PRIMARY KEY, expires REAL, accessed REAL, value BLOB)')
+            self.pid = os.getpid()
+        return self.connection
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                row = connection.execute('SELECT value FROM searches WHERE key = ? AND expires >= ?',
+                                         (key, now)).fetchone()
+                if row is None:
+                    return None
+                connection.execute('UPDATE searches SET accessed = ? WHERE key = ?', (now, key))
+        return cPickle.loads(str(row[0]))
+
+    def set(self, key, value):
+        now = time.time()
+        data = sqlite3.Binary(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)',
+                                   (key, now + self.ttl, now, data))
+                connection.execute('DELETE FROM searches WHERE expires < ?', (now,))
+                connection.execute('DELETE FROM searches WHERE key IN '
+                                   '(SELECT key FROM searches ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                                   (self.max_entries,))
+
+
+def create_backend(name, max_entries=1000, ttl=300., path=None, alias='default'):
+    """Backend by name: memory, django (cache alias) or sqlite (file path)"""
+    if name == 'memory':
+        return MemoryBackend(max_entries, ttl)
+    if name == 'django':
+        return DjangoCacheBackend(alias, ttl)
+    if name == 'sqlite':
+        return SQLiteBackend(path, max_entries, ttl)
+    raise ValueError('Unknown search cache backend: %s' % (name,))
+
+
+class SearchCache(object):
+    """Classified results of recent searches, so that a repeated search
+    fetches and classifies only tweets newer than the cached ones
+
+    Each query keeps at most window newest tweets. Entries are dropped
+    when classifier changes, or expire after ttl of backend.
+    """
+
+    def __init__(self, backend, window=100):
+        self.backend = backend
+        self.window = window
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'new_tweets': 0, 'gaps': 0}
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def get(self, query, model):
+        """CachedSearch of query labelled by model, or None"""
+        entry = self.backend.get(cache_key(query))
+        if entry is None or entry.query != query or entry.model != model:
+            self.count('misses')
+            return None
+        self.count('hits')
+        return entry
+
+    def update(self, query, model, previous, new_tweets, newest_id, complete=True):
+        """Stores new_tweets (newest first) before tweets of previous entry, trimmed to window
+        complete -- False if older tweets newer than previous entry might not have been fetched,
+            so previous tweets are dropped rather than merged across a gap
+        returns new CachedSearch
+        """
+        tweets = new_tweets
+        since_id = newest_id
+        if previous is not None:
+            if complete:
+                tweets = new_tweets + previous.tweets
+            else:
+                self.count('gaps')
+            if newest_id is None or previous.since_id > newest_id:
+                since_id = previous.since_id
+        self.count('new_tweets', len(new_tweets))
+
+        entry = CachedSearch(query, model, tweets[:self.window], since_id, time.time())
+        self.backend.set(cache_key(query), entry)
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
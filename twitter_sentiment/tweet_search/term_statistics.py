@@ -0,0 +1,114 @@
+import heapq
+import os
+import re
+
+STOP_WORDS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'stopwords.txt')
+WORD_PATTERN = re.compile(ur'^[$a-zA-Z0-9_]+$')
+
+loaded_stop_words = {}
+
+
+def load_stop_words(path=STOP_WORDS_PATH):
+    """Set of stop words, read once per process"""
+    if path not in loaded_stop_words:
+        with open(path) as f:
+            loaded_stop_words[path] = frozenset(line.strip() for line in f)
+    return loaded_stop_words[path]
+
+
+class SpaceSaving(object):
+    """Space-Saving heavy hitters sketch, counts at most capacity items
+
+    When a new item arrives at full capacity, it replaces the item with
+    minimal count and inherits that count, so count of each monitored item
+    is overestimated by at most its error. Counts are exact while number
+    of distinct items does not exceed capacity.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # (count, item) entries, possibly stale, top is item with minimal count
+        self.heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, item):
+        return item in self.counts
+
+    def count(self, item):
+        return self.counts.get(item, 0)
+
+    def pop_minimal(self):
+        while True:
+            count, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                return item
+
+    def add(self, item, weight=1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += weight
+        elif len(counts) < self.capacity:
+            counts[item] = weight
+            self.errors[item] = 0
+        else:
+            minimal = self.pop_minimal()
+            error = counts.pop(minimal)
+            del self.errors[minimal]
+            counts[item] = error + weight
+            self.errors[item] = error
+        heapq.heappush(self.heap, (counts[item], item))
+
+        if len(self.heap) > 4 * self.capacity:
+            # drop stale entries
+            self.heap = [(count, item) for item, count in counts.iteritems()]
+            heapq.heapify(self.heap)
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self.counts.iteritems(), key=lambda item: item[1])
+
+
+class TermStatistics(object):
+    """Words most specific to positive or negative tweets of a search
+
+    Tweets are added one by one as they are classified, memory and cost of
+    most_frequent() are bounded by sketch capacity, not by number of tweets.
+    """
+
+    def __init__(self, query, capacity=1000, stop_words=None):
+        self.query = query.lower()
+        self.stop_words = stop_words if stop_words is not None else load_stop_words()
+        self.positive = SpaceSaving(capacity)
+        self.negative = SpaceSaving(capacity)
+
+    def words(self, text):
+        query, stop_words, match = self.query, self.stop_words, WORD_PATTERN.match
+        return [word for word in text.lower().split()
+                if word not in stop_words and query not in word and match(word)]
+
+    def add(self, text, label):
+        """Counts words of tweet classified as label, other than positive or negative are ignored"""
+        if label == u'positive':
+            sketch = self.positive
+        elif label == u'negative':
+            sketch = self.negative
+        else:
+            return
+        for word in self.words(text):
+            sketch.add(word)
+
+    def most_frequent(self, count=20):
+        """count words with greatest difference of positive and negative counts,
+        followed by count - 1 words with least difference (least first),
+        as (word, difference) pairs"""
+        positive, negative = self.positive.counts, self.negative.counts
+        differences = dict((word, c) for word, c in positive.iteritems())
+        for word, c in negative.iteritems():
+            differences[word] = differences.get(word, 0) - c
+
+        key = lambda item: item[1]
+        return heapq.nlargest(count, differences.iteritems(), key=key) + \
+               heapq.nsmallest(count - 1, differences.iteritems(), key=key)
@@ -5,7 +5,20 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from random import Random
+from StringIO import StringIO
+
+from django.test import SimpleTestCase, TestCase
+
+from tweet_search.model_registry import ModelRegistry
+from tweet_search.search_cache import MemoryBackend, SQLiteBackend, SearchCache
+from tweet_search.term_statistics import SpaceSaving, TermStatistics
+from twitter_sentiment.preload import MemoryReportMiddleware, format_memory_usage, memory_usage
 
 
 class SimpleTest(TestCase):
@@ -14,3 +27,199 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+def tweets(*ids):
+    return [{'text': u'tweet %i' % (id,), 'label': u'positive'} for id in ids]
+
+
+class SearchCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = SearchCache(MemoryBackend(), window=5)
+
+    def test_miss_then_hit(self):
+        self.assertEqual(self.cache.get(u'python', 'model-1'), None)
+        self.cache.update(u'python', 'model-1', None, tweets(3, 2, 1), 3)
+        entry = self.cache.get(u'python', 'model-1')
+        self.assertEqual((entry.tweets, entry.since_id), (tweets(3, 2, 1), 3))
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'new_tweets': 3, 'gaps': 0})
+
+    def test_new_tweets_are_merged_before_cached_ones(self):
+        previous = self.cache.update(u'python', 'model-1', None, tweets(2, 1), 2)
+        entry = self.cache.update(u'python', 'model-1', previous, tweets(4, 3), 4)
+        self.assertEqual((entry.tweets, entry.since_id), (tweets(4, 3, 2, 1), 4))
+
+    def test_no_new_tweets_keep_since_id(self):
+        previous = self.cache.update(u'python', 'model-1', None, tweets(2, 1), 2)
+        entry = self.cache.update(u'python', 'model-1', previous, [], None)
+        self.assertEqual((entry.tweets, entry.since_id), (tweets(2, 1), 2))
+
+    def test_gap_drops_cached_tweets(self):
+        previous = self.cache.update(u'python', 'model-1', None, tweets(2, 1), 2)
+        entry = self.cache.update(u'python', 'model-1', previous, tweets(9, 8), 9, complete=False)
+        self.assertEqual((entry.tweets, entry.since_id), (tweets(9, 8), 9))
+        self.assertEqual(self.cache.stats()['gaps'], 1)
+
+    def test_model_change_misses(self):
+        self.cache.update(u'python', 'model-1', None, tweets(1), 1)
+        self.assertEqual(self.cache.get(u'python', 'model-2'), None)
+        self.assertEqual(self.cache.get(u'java', 'model-1'), None)
+
+    def test_window_keeps_newest_tweets(self):
+        previous = self.cache.update(u'python', 'model-1', None, tweets(3, 2, 1), 3)
+        entry = self.cache.update(u'python', 'model-1', previous, tweets(7, 6, 5, 4), 7)
+        self.assertEqual((entry.tweets, entry.since_id), (tweets(7, 6, 5, 4, 3), 7))
+        self.assertEqual(self.cache.get(u'python', 'model-1').tweets, tweets(7, 6, 5, 4, 3))
+
+
+class BackendTestMixin(object):
+    def create_backend(self, max_entries, ttl):
+        raise NotImplementedError()
+
+    def test_entries_expire(self):
+        backend = self.create_backend(10, 300.)
+        backend.set('a', [1])
+        self.assertEqual(backend.get('a'), [1])
+        expired = self.create_backend(10, -1.)
+        expired.set('b', [2])
+        self.assertEqual(expired.get('b'), None)
+
+    def test_least_recently_used_are_evicted(self):
+        backend = self.create_backend(2, 300.)
+        backend.set('a', 1)
+        time.sleep(0.01)
+        backend.set('b', 2)
+        time.sleep(0.01)
+        self.assertEqual(backend.get('a'), 1)
+        time.sleep(0.01)
+        backend.set('c', 3)
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), (1, None, 3))
+
+
+class MemoryBackendTest(BackendTestMixin, SimpleTestCase):
+    def create_backend(self, max_entries, ttl):
+        return MemoryBackend(max_entries, ttl)
+
+
+class SQLiteBackendTest(BackendTestMixin, SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_backend(self, max_entries, ttl):
+        return SQLiteBackend(os.path.join(self.directory, 'searches-%i-%s.sqlite' % (max_entries, ttl)),
+                             max_entries, ttl)
+
+    def test_entries_are_shared_through_file(self):
+        self.create_backend(10, 300.).set('a', {'tweets': [1]})
+        self.assertEqual(self.create_backend(10, 300.).get('a'), {'tweets': [1]})
+
+
+class SpaceSavingTest(SimpleTestCase):
+    def test_counts_are_exact_within_capacity(self):
+        sketch = SpaceSaving(capacity=3)
+        for item in 'abacab':
+            sketch.add(item)
+        self.assertEqual((sketch.count('a'), sketch.count('b'), sketch.count('c'), sketch.count('d')), (3, 2, 1, 0))
+        self.assertEqual(sketch.most_common(1), [('a', 3)])
+
+    def test_overestimates_are_bounded(self):
+        random = Random(1)
+        stream = ['hot'] * 300 + ['warm'] * 150 + ['cold%i' % (i,) for i in xrange(550)]
+        random.shuffle(stream)
+        sketch = SpaceSaving(capacity=20)
+        for item in stream:
+            sketch.add(item)
+
+        self.assertEqual(len(sketch), 20)
+        true_counts = Counter(stream)
+        for item, count in sketch.counts.iteritems():
+            self.assertTrue(true_counts[item] <= count <= true_counts[item] + sketch.errors[item])
+        # items more frequent than len(stream) / capacity are always monitored
+        self.assertEqual([item for item, count in sketch.most_common(2)], ['hot', 'warm'])
+
+
+class TermStatisticsTest(SimpleTestCase):
+    def test_words_are_filtered(self):
+        statistics = TermStatistics(u'Python', stop_words=frozenset([u'the']))
+        self.assertEqual(statistics.words(u'The PYTHONista loves python3 #code great! $AAPL snake_case'),
+                         [u'loves', u'$aapl', u'snake_case'])
+
+    def test_differences_match_counting_all_words(self):
+        random = Random(2)
+        vocabulary = [u'word%i' % (i,) for i in xrange(60)]
+        statistics = TermStatistics(u'query', stop_words=frozenset())
+        counts = Counter()
+        for i in xrange(300):
+            text = u' '.join(random.choice(vocabulary) for j in xrange(5))
+            label = random.choice([u'positive', u'negative', u'neutral'])
+            statistics.add(text, label)
+            sign = {u'positive': 1, u'negative': -1}.get(label, 0)
+            for word in text.split():
+                counts[word] += sign
+
+        result = statistics.most_frequent(20)
+        self.assertEqual(len(result), 39)
+        self.assertTrue(all(counts[word] == difference for word, difference in result))
+        differences = sorted(counts.itervalues())
+        self.assertEqual([difference for word, difference in result],
+                         differences[::-1][:20] + differences[:19])
+
+
+class CountingClassifier(object):
+    def __init__(self):
+        self.batches = []
+        self.cleared = 0
+
+    def classify_batch(self, texts):
+        self.batches.append(texts)
+        return [u'positive'] * len(texts)
+
+    def clear_cache(self):
+        self.cleared += 1
+
+
+class PreloadTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_registry_preload_runs_models_once(self):
+        registry = ModelRegistry(loader=lambda path: CountingClassifier())
+        for name in ('a', 'b'):
+            path = os.path.join(self.directory, name)
+            with open(path, 'w') as f:
+                f.write(name)
+            registry.register(name, path)
+        registry.preload()
+        for name in ('a', 'b'):
+            classifier = registry.get(name)
+            self.assertEqual((len(classifier.batches), classifier.cleared), (1, 1))
+
+    def test_memory_usage(self):
+        path = os.path.join(self.directory, 'smaps')
+        with open(path, 'w') as f:
+            f.write('00400000-0040b000 r-xp 00000000 08:01 1 /bin/cat\n'
+                    'Rss:                 40 kB\nPss:                 20 kB\n'
+                    'Shared_Clean:        30 kB\nShared_Dirty:         0 kB\n'
+                    'Private_Clean:        4 kB\nPrivate_Dirty:        6 kB\n'
+                    'Rss:                  8 kB\nPss:                  8 kB\nPrivate_Dirty:        8 kB\n')
+        usage = memory_usage(path)
+        self.assertEqual(usage, {'rss': 48, 'pss': 28, 'shared': 30, 'private': 18})
+        self.assertEqual(format_memory_usage(usage), 'rss 48 kB, unique 18 kB, shared 30 kB, pss 28 kB')
+        self.assertEqual(memory_usage(os.path.join(self.directory, 'missing')), None)
+
+    def test_middleware_reports_once_per_worker(self):
+        stream = StringIO()
+        middleware = MemoryReportMiddleware(lambda environ, start_response: ['ok'], stream)
+        self.assertEqual(middleware({}, None), ['ok'])
+        self.assertEqual(stream.getvalue(), '')
+        # as if forked
+        middleware.reported_pid = None
+        middleware({}, None)
+        middleware({}, None)
+        self.assertEqual(stream.getvalue().count('Worker %i: ' % (os.getpid(),)), 1)
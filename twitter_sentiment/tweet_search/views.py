@@ -3,44 +3,61 @@ from django.http import HttpResponse
 from django.conf import settings
 
 import json
-from collections import Counter
 import re
 
+from classifiers import instrumentation
+from twitter_api_wrapper.connection_pool import ConnectionPool
+from twitter_api_wrapper.rate_limits import RateLimiter
 from twitter_api_wrapper.twitter import Twitter
-from classifiers.utils import load_classifier
+from tweet_search.model_registry import ModelRegistry
+from tweet_search.search_cache import SearchCache, create_backend
+from tweet_search.term_statistics import TermStatistics
 
 
 def remove_url(text):
     url_pattern = ur'(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:\'".,<>?\xab\xbb\u201c\u201d\u2018\u2019]))'
     return re.sub(url_pattern, '', text)
 
-def get_classifier(classifier_path):
-    return load_classifier(classifier_path)
+def enable_cache(classifier):
+    if settings.CLASSIFIER_CACHE_SIZE:
+        classifier.enable_cache(settings.CLASSIFIER_CACHE_SIZE, settings.CLASSIFIER_CACHE_MEMORY)
 
 
-def stop_words():
-    stop_words = set()
-    with open(settings.ROOT_DIR + '/twitter_sentiment/tweet_search/stopwords.txt') as f:
-        for line in f:
-            stop_words.add(line.strip())
-    return stop_words
+# classifiers are loaded once per process and reloaded when their files change
+registry = ModelRegistry(settings.MODEL_CHECK_INTERVAL, on_load=enable_cache)
+registry.register('sentiment', settings.CLASSIFIER_PATH)
 
+# one client per process, its connections to Twitter API are kept alive between requests;
+# searches are not paced, but fail instead of waiting long for rate-limit reset
+twitter = Twitter(ConnectionPool(settings.TWITTER_MAX_IDLE_CONNECTIONS, settings.TWITTER_TIMEOUT),
+                  rate_limiter=RateLimiter(pace=False), max_wait=settings.TWITTER_MAX_WAIT,
+                  instrumentation=instrumentation)
 
-def get_counter(text_set, query, sw):
-    return Counter((word
-                    for text in text_set
-                    for word in text.lower().split()
-                    if word not in sw and query not in word and
-                    re.match(ur'^[$a-zA-Z0-9_]+$', word)))
+# classified tweets of recent queries, repeated queries fetch only newer tweets
+search_cache = SearchCache(create_backend(settings.SEARCH_CACHE_BACKEND, settings.SEARCH_CACHE_MAX_ENTRIES,
+                                          settings.SEARCH_CACHE_TTL, settings.SEARCH_CACHE_PATH),
+                           settings.SEARCH_CACHE_WINDOW)
 
+# tweets fetched per search request
+SEARCH_COUNT = 100
 
-def most_frequent_words(positive_text_set, negative_text_set, query):
-    sw = stop_words()
-    query = query.lower()
-    pos = get_counter(positive_text_set, query, sw)
-    neg = get_counter(negative_text_set, query, sw)
-    pos.subtract(neg)
-    return pos.most_common(20) + pos.most_common()[:-20:-1]
+
+def get_classifier(name):
+    return registry.get(name)
+
+
+def models(request):
+    """Introspection: versions, load times and cache statistics of loaded models"""
+    return HttpResponse(json.dumps(registry.info(), indent=2), 'application/json')
+
+
+def stats(request):
+    """Introspection: timing statistics of pipeline stages, Twitter client and search cache in this process"""
+    result = instrumentation.snapshot()
+    result['twitter_connections'] = twitter.pool.stats()
+    result['twitter_rate_limits'] = twitter.rate_limiter.stats()
+    result['search_cache'] = search_cache.stats()
+    return HttpResponse(json.dumps(result, indent=2, sort_keys=True), 'application/json')
 
 
 def home(request):
@@ -51,36 +68,39 @@ def search(request):
     query = request.GET.get('q', '')
 
     if query:
-        twitter = Twitter()
-        tweets = []
-        tweets_set = set([])
-        positive = set([])
-        negative = set([])
-        classifier = get_classifier(settings.CLASSIFIER_PATH)
-
-        max_id = None
-        for i in xrange(1):
-            if max_id:
-                response = twitter.search(query, max_id=max_id)
-            else:
-                response = twitter.search(query)
-
-            for status in response[u'statuses']:
-                text = status[u'text']
-                text_wo_url = remove_url(text)
-                if not max_id or int(status[u'id']) < max_id:
-                    max_id = int(status[u'id'])
-                if text_wo_url not in tweets_set:
-                    label = classifier.classify_one(text)
-
-                    if label == u'positive':
-                        positive.add(text_wo_url)
-                    elif label == u'negative':
-                        negative.add(text_wo_url)
-
-                    tweets.append({'text': text_wo_url, 'label': label})
-                    tweets_set.add(text_wo_url)
-
-        freq = most_frequent_words(positive, negative, query)
-        result = { 'tweets': tweets, 'most_frequent': freq }
+        model = registry.get_model('sentiment')
+        cached = search_cache.get(query, model.checksum)
+        if cached is not None:
+            # only tweets newer than cached ones are fetched and classified
+            response = twitter.search(query, count=SEARCH_COUNT, since_id=cached.since_id)
+            tweets_set = set(tweet['text'] for tweet in cached.tweets)
+        else:
+            response = twitter.search(query, count=SEARCH_COUNT)
+            tweets_set = set([])
+
+        newest_id = None
+        new_texts = []
+        for status in response[u'statuses']:
+            text = status[u'text']
+            text_wo_url = remove_url(text)
+            if newest_id is None or int(status[u'id']) > newest_id:
+                newest_id = int(status[u'id'])
+            if text_wo_url not in tweets_set:
+                new_texts.append((text, text_wo_url))
+                tweets_set.add(text_wo_url)
+
+        labels = []
+        if new_texts:
+            # repeated search often finds no new tweets
+            labels = model.classifier.classify_batch([text for text, text_wo_url in new_texts])
+        new_tweets = [{'text': text_wo_url, 'label': label} for (text, text_wo_url), label in zip(new_texts, labels)]
+        # full page of new tweets may not reach cached ones
+        entry = search_cache.update(query, model.checksum, cached, new_tweets, newest_id,
+                                    complete=len(response[u'statuses']) < SEARCH_COUNT)
+
+        statistics = TermStatistics(query, settings.TERM_STATISTICS_CAPACITY)
+        for tweet in entry.tweets:
+            statistics.add(tweet['text'], tweet['label'])
+        freq = statistics.most_frequent()
+        result = { 'tweets': entry.tweets, 'most_frequent': freq }
         return HttpResponse(json.dumps(result), 'application/json')
\ No newline at end of file
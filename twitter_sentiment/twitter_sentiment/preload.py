@@ -0,0 +1,68 @@
+"""
+Pre-fork warm-up: models and preprocessing tables are built once in the master
+process, so forked workers share their memory pages copy-on-write.
+"""
+
+import gc
+import os
+import sys
+
+
+def warm_up():
+    """Loads registered models and shared preprocessing tables"""
+    from classifiers.preprocessors import punctuation_table
+    from tweet_search.views import registry
+
+    punctuation_table()
+    registry.preload()
+
+
+def freeze_heap():
+    """Moves objects allocated so far out of garbage collector's reach, so
+    collections in workers do not write to (and un-share) their pages.
+    gc.freeze() exists since Python 3.7; older interpreters only collect once
+    before fork, reference count updates still un-share touched objects there
+    (numeric tables of mapped *.model files are file-backed and stay shared).
+    """
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def memory_usage(smaps_path='/proc/self/smaps'):
+    """Dict of rss, pss, shared and private (unique) memory in kB,
+    None if smaps are not available (non-Linux)"""
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+              'Private_Clean': 'private', 'Private_Dirty': 'private'}
+    usage = dict.fromkeys(fields.values(), 0)
+    try:
+        with open(smaps_path, 'r') as f:
+            for line in f:
+                key = line.split(':', 1)[0]
+                if key in fields:
+                    usage[fields[key]] += int(line.split()[1])
+    except IOError:
+        return None
+    return usage
+
+
+def format_memory_usage(usage):
+    if usage is None:
+        return 'memory usage is not available'
+    return 'rss %(rss)i kB, unique %(private)i kB, shared %(shared)i kB, pss %(pss)i kB' % usage
+
+
+class MemoryReportMiddleware(object):
+    """WSGI middleware printing memory usage of each worker process
+    when it gets its first request, i.e. after fork"""
+
+    def __init__(self, application, stream=sys.stderr):
+        self.application = application
+        self.stream = stream
+        self.reported_pid = os.getpid()
+
+    def __call__(self, environ, start_response):
+        if self.reported_pid != os.getpid():
+            self.reported_pid = os.getpid()
+            self.stream.write('Worker %i: %s\n' % (self.reported_pid, format_memory_usage(memory_usage())))
+        return self.application(environ, start_response)
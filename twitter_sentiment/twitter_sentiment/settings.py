@@ -9,6 +9,33 @@ ROOT_DIR = dn(dn(dn(rp(__file__))))
 CLASSIFIER_PATH = jn(ROOT_DIR, 'classifiers', 'trained_classifiers', sentiment_settings.CLASSIFIER)
 NEUTRAL_CLASSIFIER_PATH = jn(ROOT_DIR, 'classifiers', 'trained_classifiers', sentiment_settings.NEUTRAL_CLASSIFIER)
 
+# texts memoised by classifier (retweets are classified by lookup), 0 disables cache
+CLASSIFIER_CACHE_SIZE = 10000
+CLASSIFIER_CACHE_MEMORY = 64 * 1024 * 1024
+
+# seconds between checks whether classifier files were replaced
+MODEL_CHECK_INTERVAL = 2.
+
+# distinct words counted per label for most frequent words panel
+TERM_STATISTICS_CAPACITY = 1000
+
+# Twitter API client: idle keep-alive connections kept per process, seconds to wait for connection or data
+TWITTER_MAX_IDLE_CONNECTIONS = 10
+TWITTER_TIMEOUT = 10.
+# seconds a search may wait for rate-limit reset before failing
+TWITTER_MAX_WAIT = 5.
+
+# classified results of recent searches: backend (memory, django for CACHES['default'] or sqlite),
+# queries kept (memory, sqlite), seconds they are kept, tweets kept per query, sqlite file
+SEARCH_CACHE_BACKEND = 'memory'
+SEARCH_CACHE_MAX_ENTRIES = 1000
+SEARCH_CACHE_TTL = 300
+SEARCH_CACHE_WINDOW = 100
+SEARCH_CACHE_PATH = jn(ROOT_DIR, 'search_cache.sqlite')
+
+# time pipeline stages: Server-Timing headers and statistics at /stats/
+INSTRUMENTATION_ENABLED = os.environ.get('TWITTER_SENTIMENT_INSTRUMENTATION', '') not in ('', '0')
+
 DEBUG = True
 TEMPLATE_DEBUG = DEBUG
 
@@ -102,6 +129,7 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'tweet_search.middleware.InstrumentationMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -3,4 +3,6 @@ from django.conf.urls import patterns, url
 urlpatterns = patterns('',
     url(r'^/?$', 'tweet_search.views.home', name='home'),
     url(r'^search_tweets/?$', 'tweet_search.views.search', name='search'),
+    url(r'^models/?$', 'tweet_search.views.models', name='models'),
+    url(r'^stats/?$', 'tweet_search.views.stats', name='stats'),
 )
@@ -27,6 +27,19 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "twitter_sentiment.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Preload mode (TWITTER_SENTIMENT_PRELOAD=1) for pre-forking servers which import
+# this module in master process (gunicorn --preload, uWSGI without lazy-apps):
+# models and preprocessing tables are built before fork, so workers share them.
+if os.environ.get('TWITTER_SENTIMENT_PRELOAD', '') not in ('', '0'):
+    import sys
+    from twitter_sentiment.preload import warm_up, freeze_heap, memory_usage, format_memory_usage, \
+        MemoryReportMiddleware
+
+    warm_up()
+    freeze_heap()
+    sys.stderr.write('Master %i preloaded models: %s\n' % (os.getpid(), format_memory_usage(memory_usage())))
+    application = MemoryReportMiddleware(application)
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)